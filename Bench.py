@@ -0,0 +1,304 @@
+# Benchmark Suite of the Butterfly Network Generation
+
+import os
+import sys
+import json
+import time
+import hashlib
+import platform
+import tempfile
+import tracemalloc
+
+import numpy as np
+
+from Butterfly import ButterflyNet, LIST_TCL_MODES
+from Cache import GENERATOR_VERSION
+
+
+# n_port of the benchmark matrix
+LIST_BENCH_SIZES = [16, 64, 256, 1024, 4096]
+
+# type_list mixes of radix 2 & 4 switch nodes, see get_mix_type_list
+LIST_BENCH_MIXES = ['r2', 'r4', 'mix']
+
+# benchmarks run on every configuration, see run_config
+LIST_BENCHES = ['construct', 'pin_pairs'] + ['tcl_%s' % mode for mode in LIST_TCL_MODES] + ['image_svg', 'image_png']
+
+# png images are only rendered up to this n_port by default, matplotlib takes minutes beyond
+BENCH_PNG_MAX_PORT = 256
+
+# measures compared against the baseline as name: (smallest baseline value worth comparing, absolute tolerance),
+# below the former the noise dominates; a regression is above (1 + threshold) times the baseline plus the tolerance
+DICT_COMPARED = {'time': (1e-2, 2e-3), 'peak_mem': (1 << 16, 1 << 14)}
+
+# default number of timed runs & least seconds spent on them per round, short benchmarks are run more often
+BENCH_REPEAT = 5
+BENCH_MIN_TIME = 0.1
+
+# default number of rounds over the whole matrix, the best round of a benchmark is kept so that a slow spell of
+# the machine only hits some of its runs
+BENCH_ROUNDS = 3
+
+# default number of re-runs of a benchmark slower than the baseline & seconds waited before each, only a regression
+# of every re-run fails
+BENCH_RETRIES = 3
+BENCH_RETRY_WAIT = 5.0
+
+
+def get_mix_type_list(n_port, mix):
+    '''
+    Get the type_list of n_port (a power of two) for a mix, None if not applicable
+        r2: radix 2 only; r4: radix 4 only, a radix 2 last stage if needed; mix: alternating radix 4 & 2
+    '''
+    n_bit = n_port.bit_length() - 1
+    assert n_port == 1 << n_bit and n_bit >= 1, "Invalid n_port, should be a power of two"
+
+    if mix == 'r2':
+        return [2] * n_bit
+    if mix == 'r4':
+        return [4] * (n_bit // 2) + [2] * (n_bit % 2)
+
+    type_list = []
+    while n_bit > 0:
+        n_ports = 4 if len(type_list) % 2 == 0 and n_bit >= 2 else 2
+        type_list.append(n_ports)
+        n_bit -= n_ports.bit_length() - 1
+
+    # a mix is only distinct with both radices
+    return type_list if len(set(type_list)) > 1 else None
+
+
+def measure(func, repeat=BENCH_REPEAT, min_time=BENCH_MIN_TIME, trace_memory=True):
+    '''
+    Run func at least repeat times and for at least min_time seconds, return (best wall time, peak traced memory of
+    an extra traced run, result of the last call)
+    '''
+    best = None
+    n_run = 0
+    t_start = time.perf_counter()
+    while n_run < repeat or time.perf_counter() - t_start < min_time:
+        t = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+        n_run += 1
+
+    peak_mem = None
+    if trace_memory:
+        own_tracing = not tracemalloc.is_tracing()
+        if own_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        start = tracemalloc.get_traced_memory()[0]
+        result = func()
+        peak_mem = tracemalloc.get_traced_memory()[1] - start
+        if own_tracing:
+            tracemalloc.stop()
+
+    return best, peak_mem, result
+
+
+def get_file_checksum(fn):
+    '''
+    Get the sha256 of the bytes of file fn
+    '''
+    digest = hashlib.sha256()
+    with open(fn, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def run_config(type_list, benches=LIST_BENCHES, repeat=BENCH_REPEAT, png_max_port=BENCH_PNG_MAX_PORT, work_dir=None,
+               min_time=BENCH_MIN_TIME):
+    '''
+    Run the benchmarks of one type_list, return dictionary of bench name to result
+        Result: time (s, best of the runs, see measure), peak_mem (bytes), throughput (nets/s, lines/s) & checksum of the output
+        Note: images are written into work_dir (default a temporary directory) under the network name
+    '''
+    n_port = int(np.prod(type_list))
+    n_stage = len(type_list)
+    n_nets = n_port * (n_stage-1)
+    pfx_list = ['sw%d_s%d' % (n_ports, i) for i, n_ports in enumerate(type_list)]
+
+    def construct():
+        return ButterflyNet(n_stage=n_stage, n_port=n_port, type_list=list(type_list), monitor_def=[2560, 1440],
+                            pfx_list=pfx_list, headless=True)
+
+    results = {}
+    bfNet = construct()
+
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp_dir:
+        for bench in benches:
+            checksum = None
+            throughput = {}
+
+            if bench == 'construct':
+                elapsed, peak_mem, _ = measure(construct, repeat, min_time)
+                throughput['nets/s'] = n_nets / elapsed
+            elif bench == 'pin_pairs':
+                elapsed, peak_mem, _ = measure(bfNet.get_pin_pairs, repeat, min_time)
+                throughput['nets/s'] = n_nets / elapsed
+            elif bench.startswith('tcl_'):
+                tcl_fn = os.path.join(tmp_dir, 'connect.tcl')
+                elapsed, peak_mem, _ = measure(lambda: bfNet.gen_connect_tcl_as_file(tcl_fn, tcl_mode=bench[4:]), repeat, min_time)
+                with open(tcl_fn) as file:
+                    n_line = sum(1 for _ in file)
+                throughput['nets/s'] = n_nets / elapsed
+                throughput['lines/s'] = n_line / elapsed
+                checksum = get_file_checksum(tcl_fn)
+            elif bench.startswith('image_'):
+                img_fmt = bench[6:]
+                if img_fmt == 'png' and n_port > png_max_port:
+                    continue
+                cwd = os.getcwd()
+                os.chdir(tmp_dir)
+                try:
+                    def save():
+                        bfNet.save_network_image(img_fmt=img_fmt)
+                        if img_fmt == 'png':
+                            # start from a fresh canvas for every run
+                            bfNet.ax = None
+                    elapsed, peak_mem, _ = measure(save, 1 if img_fmt == 'png' else repeat, min_time, trace_memory=img_fmt != 'png')
+                    checksum = get_file_checksum('%s.%s' % (bfNet.get_net_name(), img_fmt))
+                finally:
+                    os.chdir(cwd)
+                throughput['nets/s'] = n_nets / elapsed
+            else:
+                raise AssertionError("Invalid benchmark %s, allowed values are %s" % (bench, ', '.join(LIST_BENCHES)))
+
+            results[bench] = {'time': elapsed, 'peak_mem': peak_mem, 'throughput': throughput, 'checksum': checksum}
+
+    return results
+
+
+def run_suite(sizes=LIST_BENCH_SIZES, mixes=LIST_BENCH_MIXES, benches=LIST_BENCHES, repeat=BENCH_REPEAT, png_max_port=BENCH_PNG_MAX_PORT, callback=None,
+              min_time=BENCH_MIN_TIME, n_round=BENCH_ROUNDS):
+    '''
+    Run the benchmarks over the matrix of sizes & mixes n_round times, return the report as a dictionary
+        Results are keyed by <bench>/<n_port>/<mix>, the fastest round of each is kept
+        Note: callback is called with (key, result) as soon as one is measured in the last round
+    '''
+    import matplotlib
+    matplotlib.use('Agg')
+
+    report = {'meta': get_meta(), 'results': {}}
+    for roundIdx in range(n_round):
+        for n_port in sizes:
+            for mix in mixes:
+                type_list = get_mix_type_list(n_port, mix)
+                if type_list is None:
+                    continue
+                for bench, result in run_config(type_list, benches, repeat, png_max_port, min_time=min_time).items():
+                    key = '%s/%d/%s' % (bench, n_port, mix)
+                    result['type_list'] = type_list
+                    best = report['results'].get(key)
+                    if best is None or result['time'] < best['time']:
+                        report['results'][key] = best = result
+                    if callback is not None and roundIdx == n_round-1:
+                        callback(key, best)
+
+    return report
+
+
+def get_meta():
+    '''
+    Get the environment of a benchmark run, recorded to tell apart baselines of different machines
+    '''
+    import matplotlib
+
+    return {
+        'generator_version': GENERATOR_VERSION,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'matplotlib': matplotlib.__version__,
+        'machine': platform.machine(),
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def compare_reports(report, baseline, threshold=0.2):
+    '''
+    Compare the results of report with the baseline, return list of (key, measure, message) failures
+        A failure is a measure of DICT_COMPARED above (1 + threshold) times the baseline plus its absolute tolerance,
+        or a different checksum
+        Note: keys only found in one of the reports are skipped, so are png checksums of another matplotlib version
+    '''
+    same_matplotlib = report['meta'].get('matplotlib') == baseline['meta'].get('matplotlib')
+
+    failures = []
+    for key, result in report['results'].items():
+        base = baseline['results'].get(key)
+        if base is None:
+            continue
+
+        if base['checksum'] is not None and result['checksum'] is not None and base['checksum'] != result['checksum']:
+            if same_matplotlib or not key.startswith('image_png/'):
+                failures.append((key, 'checksum', 'output differs from the baseline %s' % base['checksum'][:12]))
+
+        for name, (min_value, tolerance) in DICT_COMPARED.items():
+            if base.get(name) is not None and base[name] >= min_value and result.get(name) is not None:
+                ratio = result[name] / base[name]
+                if result[name] > base[name] * (1 + threshold) + tolerance:
+                    failures.append((key, name, '%.3g vs baseline %.3g (x%.2f)' % (result[name], base[name], ratio)))
+
+    return failures
+
+
+def recheck_reports(report, baseline, threshold=0.2, n_retry=BENCH_RETRIES, wait=BENCH_RETRY_WAIT, **kwargs):
+    '''
+    Compare the results of report with the baseline, re-running the benchmarks of time failures up to n_retry times,
+    return list of (key, measure, message) failures of compare_reports after the last re-run
+        The best time of the re-runs is kept in report, other keyword arguments are passed to run_config
+        Note: a shared machine may run slower for seconds, a re-run waits for the spell to pass
+    '''
+    failures = compare_reports(report, baseline, threshold)
+    for _ in range(n_retry):
+        keys = [key for key, name, _ in failures if name == 'time']
+        if not keys:
+            break
+        time.sleep(wait)
+        for key in keys:
+            bench = key.split('/')[0]
+            best = report['results'][key]
+            result = run_config(best['type_list'], [bench], **kwargs)[bench]
+            if result['time'] < best['time']:
+                result['type_list'] = best['type_list']
+                report['results'][key] = result
+        failures = compare_reports(report, baseline, threshold)
+
+    return failures
+
+
+def gen_report_table(report, baseline=None):
+    '''
+    Generate the lines of a text table of the report, with the time ratio to the baseline if given
+    '''
+    yield '%-24s %10s %12s %14s %14s %8s  %s\n' % ('bench/n_port/mix', 'time(ms)', 'peak_mem(KB)', 'nets/s', 'lines/s', 'vs base', 'checksum')
+    for key, result in report['results'].items():
+        ratio = ''
+        if baseline is not None and key in baseline['results'] and baseline['results'][key]['time']:
+            ratio = 'x%.2f' % (result['time'] / baseline['results'][key]['time'])
+        yield '%-24s %10.3f %12s %14.0f %14s %8s  %s\n' % (
+            key, result['time'] * 1e3,
+            '%.0f' % (result['peak_mem'] / 1024) if result['peak_mem'] is not None else '-',
+            result['throughput']['nets/s'],
+            '%.0f' % result['throughput']['lines/s'] if 'lines/s' in result['throughput'] else '-',
+            ratio, (result['checksum'] or '-')[:12])
+
+
+def load_report(fn):
+    with open(fn) as file:
+        return json.load(file)
+
+
+def save_report(report, fn):
+    if fn == '-':
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+        return
+
+    with open(fn, 'w') as file:
+        json.dump(report, file, indent=2)
+        file.write('\n')
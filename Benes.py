@@ -0,0 +1,181 @@
+# Rearrangeable (Looping Algorithm) Router of the Benes Network
+
+import numpy as np
+
+from Butterfly import open_output, write_lines
+
+
+def get_mirror_tables(bfNet):
+    '''
+    Get the sub-block tables of the butterfly stages of a benes ButterflyNet
+        Index: stage Id i < n_bfly_stage-1
+        Value: int32 array of shape (n_nodes, type_list[i]), [j, c] is the port of j_th switch node connected to
+               the c_th sub-block, the output port at stage i and the input port at its mirror stage n_stage-1-i
+        Note: same as ButterflyNet.get_route_tables of the butterfly, the mirror stages use the inverse links
+    '''
+    list_table = []
+    pre_span = bfNet.n_port
+    for i in range(len(bfNet.bfly_type_list)-1):
+        n_ports = bfNet.type_list[i]
+        cur_span = pre_span // n_ports
+
+        sub_block = bfNet.get_stage_perm(i).reshape(-1, n_ports) % pre_span // cur_span
+        list_table.append(np.argsort(sub_block, axis=1).astype(np.int32))
+        pre_span = cur_span
+
+    return list_table
+
+
+def pair_by(key):
+    '''
+    Pair up the edges of equal key, return the partner of every edge, every key must occur an even number of times
+    '''
+    order = np.argsort(key, kind='stable')
+    partner = np.empty_like(order)
+    partner[order[0::2]] = order[1::2]
+    partner[order[1::2]] = order[0::2]
+
+    return partner
+
+
+def split_cycles(partner_a, partner_b, n_round):
+    '''
+    2-color the edges so that partners of partner_a and of partner_b get different colors
+        The two pairings form cycles alternating between a & b partners, sigma = b o a walks one color class of
+        a cycle, which is labelled by its smallest edge by pointer doubling in n_round steps (cycle length < 2^(n_round+1))
+        Return int8 array of colors 0/1, 0 for the class holding the smallest edge of the cycle
+    '''
+    sigma = partner_b[partner_a]
+    label = np.arange(len(sigma))
+    for _ in range(n_round):
+        label = np.minimum(label, label[sigma])
+        sigma = sigma[sigma]
+
+    return (label > label[partner_a]).astype(np.int8)
+
+
+def color_edges(in_node, out_node, n_ports, n_round):
+    '''
+    Color the edges of a n_ports-regular bipartite multigraph with n_ports colors (a power of two) by repeated Euler splits
+        in_node & out_node: integer arrays, end nodes of every edge, each node has n_ports edges
+        Return int32 array of colors, the edges of every node get every color exactly once
+    '''
+    n_node = int(max(in_node.max(), out_node.max())) + 1
+    color = np.zeros(len(in_node), dtype=np.int64)
+
+    # every split halves the degree of each color class, edges of a class are paired within each node
+    for _ in range(n_ports.bit_length() - 1):
+        partner_a = pair_by(color * n_node + in_node)
+        partner_b = pair_by(color * n_node + out_node)
+        color = color * 2 + split_cycles(partner_a, partner_b, n_round)
+
+    return color.astype(np.int32)
+
+
+def route_benes(bfNet, perms):
+    '''
+    Compute conflict-free switch settings of a benes ButterflyNet for every permutation
+        perms: integer array of shape (n_perm, n_port) or (n_port,), input port s sends to output port perms[., s]
+        Return uint8 array of shape (n_perm, n_stage, n_port), [p, i, u] is the output port taken by input pin u
+        (uniId, i.e. switch node u // type_list[i] & input port u % type_list[i]) of stage i for permutation p
+        Note: the outer stage pair i & n_stage-1-i splits every block into type_list[i] sub-blocks by coloring
+              the edges between its switch nodes (looping algorithm), then every sub-block is routed recursively;
+              all permutations & blocks of a stage pair are colored at once
+    '''
+    assert bfNet.topology == 'benes', "Switch settings are only computed for the benes topology"
+
+    perms = np.atleast_2d(np.asarray(perms))
+    n_perm, n_port = perms.shape
+    assert n_port == bfNet.n_port, "Length of permutations does not match n_port of the network"
+    assert (np.sort(perms, axis=1) == np.arange(n_port)).all(), "Invalid permutations, every output port must be used once"
+
+    n_stage = bfNet.n_stage
+    n_bfly_stage = len(bfNet.bfly_type_list)
+    configs = np.empty((n_perm, n_stage, n_port), dtype=np.uint8)
+
+    # flat edge Id b*n_port + u for input pin u of permutation b, dst is the output pin of the mirror stage
+    ofst = (np.arange(n_perm, dtype=np.int64) * n_port)[:, None]
+    dst = perms.astype(np.int64) + ofst
+    uniIds = np.arange(n_perm * n_port, dtype=np.int64)
+
+    list_table = get_mirror_tables(bfNet)
+    span = n_port
+    for i in range(n_bfly_stage-1):
+        n_ports = bfNet.type_list[i]
+        mirror = n_stage - 1 - i
+        table = list_table[i].ravel()
+        perm = bfNet.get_stage_perm(i).astype(np.int64)
+
+        dst_flat = dst.ravel()
+        in_node = uniIds // n_ports
+        out_node = dst_flat // n_ports
+        n_round = max(1, (span - 1).bit_length())
+        color = color_edges(in_node, out_node, n_ports, n_round)
+
+        # node j of both stages reaches sub-block c by port table[j, c]
+        in_node_local = in_node % (n_port // n_ports)
+        out_node_local = out_node % (n_port // n_ports)
+        out_port = table[in_node_local * n_ports + color]
+        mirror_in_port = table[out_node_local * n_ports + color]
+
+        configs[:, i, :] = out_port.reshape(n_perm, n_port)
+        mirror_in = out_node * n_ports + mirror_in_port
+        mirror_cfg = np.empty(n_perm * n_port, dtype=np.uint8)
+        mirror_cfg[mirror_in] = dst_flat % n_ports
+        configs[:, mirror, :] = mirror_cfg.reshape(n_perm, n_port)
+
+        # the sub-block inputs & outputs are connected by the links of stage i and of its mirror
+        batch_ofst = uniIds // n_port * n_port
+        next_in = batch_ofst + perm[(in_node_local * n_ports + out_port)]
+        next_dst = batch_ofst[mirror_in] + perm[mirror_in % n_port]
+        dst = np.empty(n_perm * n_port, dtype=np.int64)
+        dst[next_in] = next_dst
+        span //= n_ports
+
+    # the middle stage connects every input pin to its destination within the switch node
+    configs[:, n_bfly_stage-1, :] = (dst.ravel() % bfNet.type_list[n_bfly_stage-1]).reshape(n_perm, n_port)
+
+    return configs
+
+
+def apply_configs(bfNet, configs):
+    '''
+    Trace the input ports through the switch settings of configs, see route_benes
+        Return int64 array of shape (n_perm, n_port), the output port reached by every input port
+        Note: raise AssertionError if two input pins of a switch node take the same output port
+    '''
+    configs = configs.reshape(-1, bfNet.n_stage, bfNet.n_port)
+    n_perm = len(configs)
+    rows = np.arange(n_perm)[:, None]
+
+    pin = np.tile(np.arange(bfNet.n_port), (n_perm, 1))
+    for i in range(bfNet.n_stage):
+        n_ports = bfNet.type_list[i]
+        out_pin = pin // n_ports * n_ports + configs[rows, i, pin]
+        assert (np.sort(out_pin, axis=1) == np.arange(bfNet.n_port)).all(), "Conflicting switch settings at stage %d" % i
+        pin = bfNet.get_stage_perm(i)[out_pin] if i < bfNet.n_stage-1 else out_pin
+
+    return pin
+
+
+def export_configs(bfNet, configs, fn):
+    '''
+    Export the switch settings of route_benes as file
+        .npy: the uint8 array of shape (n_perm, n_stage, n_port) as is
+        other: csv text with one perm,stage,swId,inPort,outPort row per input pin, '-' for stdout, gzip if ending with '.gz'
+    '''
+    if isinstance(fn, str) and fn.endswith('.npy'):
+        np.save(fn, configs)
+        return
+
+    with open_output(fn) as file:
+        write_lines(file, gen_config_lines(bfNet, configs))
+
+
+def gen_config_lines(bfNet, configs):
+    yield 'perm,stage,swId,inPort,outPort\n'
+    for p in range(len(configs)):
+        for i in range(bfNet.n_stage):
+            n_ports = bfNet.type_list[i]
+            for uniId, port in enumerate(configs[p, i].tolist()):
+                yield '%d,%d,%d,%d,%d\n' % (p, i, uniId // n_ports, uniId % n_ports, port)
@@ -1,18 +1,213 @@
-# Butterfly Network Based on 2X2 Node and 4X4 Node
+# Butterfly Network Based on 2X2, 4X4 ... 2^k X 2^k Nodes (mixed radix allowed)
 
+import gzip
 import math
-import matplotlib.pyplot as plt
-from matplotlib import collections  as mc
+import os
+import shutil
+import sys
+from collections.abc import Mapping
+from contextlib import contextmanager, nullcontext
+from itertools import islice
+
+import numpy as np
+
+# matplotlib is only imported on first render, see load_matplotlib()
+Figure = None
+FigureCanvasAgg = None
+mc = None
+
+
+def load_matplotlib():
+    '''
+    Import matplotlib on demand, topology & tcl only runs never pay for it
+        Note: figures are not registered with pyplot, a network's figure is freed together with the network
+    '''
+    global Figure, FigureCanvasAgg, mc
+    if Figure is None:
+        from matplotlib.figure import Figure as _Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg as _FigureCanvasAgg
+        from matplotlib import collections as _mc
+        Figure, FigureCanvasAgg, mc = _Figure, _FigureCanvasAgg, _mc
+
+
+def get_port_suffix(portId):
+    '''
+    Get the pin name suffix of the portId_th port of a switch node, i.e. a, b ... z, aa, ab ...
+    '''
+    suffix = ''
+    portId += 1
+    while portId > 0:
+        portId, rem = divmod(portId-1, 26)
+        suffix = chr(ord('a')+rem) + suffix
+
+    return suffix
+
+
+# i/o signal groups of the switch nodes as (output pin, input pin) connected between consecutive stages
+LIST_LINK_SIGNALS = [('ovld', 'ivld'), ('dout', 'din'), ('ofw_output', 'ofw_input')]
+
+# external ports as (pin, port name) on the first stage (input ports) & the last stage (output ports)
+LIST_EXT_IN_PORTS = [('ivld', 'ivld'), ('din', 'din'), ('ofw_input', 'ofw')]
+LIST_EXT_OUT_PORTS = [('ovld', 'ovld'), ('dout', 'dout'), ('ofw_output', 'bp')]
+
+# default interface of every inter-stage pin, the output pins of LIST_LINK_SIGNALS belong to one (master)
+# interface <Intf>_<PortSuffix> and the input pins to another (slave), see ButterflyNet.get_link_intf
+DICT_INTF_MAP = {'ovld': 'm_axis', 'dout': 'm_axis', 'ofw_output': 'm_axis',
+                 'ivld': 's_axis', 'din': 's_axis', 'ofw_input': 's_axis'}
+
+# direction of the external ports seen from the network, din & dout are DATA_WIDTH wide, see ButterflyNet.gen_verilog
+DICT_EXT_PORT_DIR = {'ivld': 'input', 'din': 'input', 'ofw': 'output',
+                     'ovld': 'output', 'dout': 'output', 'bp': 'input'}
+LIST_DATA_PINS = ['din', 'dout']
+
+# topologies of ButterflyNet, benes appends the mirrored butterfly stages, see ButterflyNet.build_uni_pairs
+LIST_TOPOLOGIES = ['butterfly', 'benes']
+
+# output modes of the tcl command file, see ButterflyNet.gen_connect_tcl
+LIST_TCL_MODES = ['flat', 'compact', 'intf']
+
+# number of lines joined into one write call
+WRITE_BATCH_LINES = 8192
+
+# phase context without profiler, see ButterflyNet.profile_phase
+NULL_PHASE = nullcontext()
+
+
+@contextmanager
+def open_output(fn):
+    '''
+    Open the output file as text for writing
+        fn: file name (gzip compressed if it ends with '.gz'), '-' for stdout or an opened file-like object
+        Note: stdout & file-like objects are not closed on exit
+    '''
+    if hasattr(fn, 'write'):
+        yield fn
+    elif fn == '-':
+        yield sys.stdout
+    else:
+        file = gzip.open(fn, 'wt', compresslevel=6) if str(fn).endswith('.gz') else open(fn, 'w')
+        with file:
+            yield file
+
+
+def write_lines(file, lines, batch=WRITE_BATCH_LINES):
+    '''
+    Write an iterable of lines into file, batch lines are joined into one write call
+    '''
+    lines = iter(lines)
+    while True:
+        chunk = ''.join(islice(lines, batch))
+        if not chunk:
+            break
+        file.write(chunk)
+
+
+def copy_to_output(path, fn):
+    '''
+    Copy the text file path to the output fn of open_output, plain files are copied as bytes without decoding
+    '''
+    if isinstance(fn, str) and fn != '-' and not fn.endswith('.gz'):
+        shutil.copyfile(path, fn)
+        return
+
+    with open(path) as src, open_output(fn) as file:
+        shutil.copyfileobj(src, file)
+
+
+def get_segments(x0, y0, x1, y1):
+    '''
+    Build line segments [(x0, y0), (x1, y1)] from broadcastable coordinate arrays as float array of shape (n, 2, 2)
+    '''
+    return np.stack(np.broadcast_arrays(x0, y0, x1, y1), axis=-1).reshape(-1, 2, 2)
+
+
+class NodeCoordView(Mapping):
+    '''
+    Read-only mapping of switch node tuples (i, j) to the (x, y) central point, backed by per-stage arrays
+    '''
+
+    def __init__(self, list_x, list_y):
+        self.list_x = list_x
+        self.list_y = list_y
+
+    def check_key(self, key):
+        try:
+            i, j = key
+            if 0 <= i < len(self.list_y) and 0 <= j < len(self.list_y[i]):
+                return i, j
+        except (TypeError, ValueError):
+            pass
+        raise KeyError(key)
+
+    def __getitem__(self, key):
+        i, j = self.check_key(key)
+        return (self.list_x[i], float(self.list_y[i][j]))
+
+    def __iter__(self):
+        for i, y in enumerate(self.list_y):
+            for j in range(len(y)):
+                yield (i, j)
+
+    def __len__(self):
+        return sum(len(y) for y in self.list_y)
+
+
+class PinCoordView(NodeCoordView):
+    '''
+    Read-only mapping of switch node tuples (i, j) to the list of (x, y) of its pins in y-coordinate ascending order
+    '''
+
+    def __init__(self, list_x, list_y, list_ofst):
+        super().__init__(list_x, list_y)
+        self.list_ofst = list_ofst
+
+    def __getitem__(self, key):
+        i, j = self.check_key(key)
+        x = self.list_x[i]
+        return [(x, y) for y in (self.list_y[i][j] + self.list_ofst[i]).tolist()]
 
 
 class ButterflyNet(object):
 
-    def __init__(self, n_stage=None, n_port=None, type_list=None, monitor_def=None, pfx_list=None, tcl_fn=None):
+    def __init__(self, n_stage=None, n_port=None, type_list=None, monitor_def=None, pfx_list=None, tcl_fn=None, headless=False, intf_map=None, cache=None, profiler=None, topology='butterfly', placement=None,
+                 layout=None, list_uni_pairs=None):
         self.n_stage = n_stage
         self.n_port = n_port
         self.type_list = type_list
         self.pfx_list = pfx_list
+
+        # benes: type_list is followed by its mirror without the last stage, i.e. 2*n_stage-1 stages in total,
+        # n_stage & type_list cover all stages afterwards and pfx_list must name all of them
+        assert topology in LIST_TOPOLOGIES, "Invalid topology, allowed values are %s" % ', '.join(LIST_TOPOLOGIES)
+        self.topology = topology
+        self.bfly_type_list = list(type_list)
+        if topology == 'benes':
+            self.type_list = list(type_list) + list(type_list[-2::-1])
+            self.n_stage = len(self.type_list)
+
+        # placement[i][j]: slot (in y ascending order) of the j_th switch node of stage i, default the j_th slot,
+        # see Wire.optimize_layout
+        self.placement = None
+        if placement is not None:
+            assert len(placement) == self.n_stage, "Number of stages does not match the length of the placement"
+            self.placement = [np.asarray(slots, dtype=np.int64) for slots in placement]
+            for i, slots in enumerate(self.placement):
+                assert (np.sort(slots) == np.arange(self.n_port // self.type_list[i])).all(), \
+                    "Invalid placement of stage %d, should be a permutation of the switch node slots" % i
+
         self.tcl_fn = tcl_fn
+        self.monitor_def = monitor_def
+        # pin to interface name mapping, entries of intf_map override DICT_INTF_MAP
+        self.intf_map = dict(DICT_INTF_MAP, **(intf_map or {}))
+
+        # phases are recorded by profiler (a Profile.Profiler) if given
+        self.profiler = profiler
+
+        # pin pairs, tcl files & images are looked up in / stored into cache (a Cache.TopologyCache) if given
+        self.cache = cache
+        self.cache_key = None
+        if cache is not None:
+            self.cache_key = cache.get_key(**self.get_cache_config())
 
         # baseline size is based on 2K definition (2560*1440)
         self.scale_factor = monitor_def[1] / 1440
@@ -21,13 +216,38 @@ class ButterflyNet(object):
         self.H_margin = 6.0
         self.V_margin = 1.0
 
-        self.get_all_size()
-        self.get_all_coordinates()
-        self.get_pin_pairs()
+        # a layout & pin pairs computed before (e.g. by Graph.load_net) are used as they are, see set_layout & get_pin_pairs
+        n_nodes = sum(self.n_port // n_ports for n_ports in self.type_list)
+        if layout is None:
+            with self.profile_phase('get_all_size'):
+                self.get_all_size()
+            with self.profile_phase('get_all_coordinates', nodes=n_nodes, pins=2*self.n_port*self.n_stage):
+                self.get_all_coordinates()
+        else:
+            self.set_layout(layout)
+        with self.profile_phase('get_pin_pairs', nets=self.n_port*(self.n_stage-1)):
+            self.get_pin_pairs(list_uni_pairs)
+
+        # canvas is built lazily when headless, i.e. only once an image is requested
+        self.ax = None
+        if not headless:
+            self.render()
+
+    def profile_phase(self, name, **counts):
+        '''
+        Get the context recording phase name by the profiler, a shared no-op context without profiler
+        '''
+        if self.profiler is None:
+            return NULL_PHASE
+        return self.profiler.phase(name, **counts)
 
-        self.create_canvas()
-        self.draw_switch_nodes()
-        self.draw_pin_connection()
+    def profile_lines(self, name, lines, **counts):
+        '''
+        Get the lines recorded as phase name by the profiler, lines themselves without profiler
+        '''
+        if self.profiler is None:
+            return lines
+        return self.profiler.gen_lines(name, lines, **counts)
 
     def get_all_size(self):
         '''
@@ -43,141 +263,309 @@ class ButterflyNet(object):
         self.Node_hspace = 24.4 * self.scale_factor * (8 / self.n_stage)
 
 
+    def get_node_height(self, n_ports):
+        '''
+        Get height(float) of a n_ports X n_ports switch node, e.g. TNode_height for 2 and FNode_height for 4
+        '''
+        return (2*n_ports / 5) * self.scale_factor * self.zoom_factor
+
+
+    def get_node_vspace(self, n_ports):
+        '''
+        Get vertical spacing(float) after a n_ports X n_ports switch node, nodes smaller than 4X4 are
+        grouped to fill one 4X4 node slot and share its spacing, see get_all_coordinates
+        '''
+        return self.FNode_vspace * n_ports / 4 if n_ports >= 4 else self.FNode_vspace
+
+
+    def get_pin_offsets(self, n_ports):
+        '''
+        Get y-offset factors of the i/o pins relative to the central point of a n_ports X n_ports switch node
+            Pins are 0.4 apart and organized in y-coordinate ascending order, e.g. -0.2, 0.2 for 2X2 node
+            Note: multiply by zoom_factor & scale_factor to get the actual offsets
+        '''
+        return [(2*k + 1 - n_ports) / 5 for k in range(n_ports)]
+
+
     def get_all_coordinates(self):
         '''
         Get coordinates(float) of every switch node, including the central point and input/output pins
+            Coordinates are kept as per-stage arrays shared by layout, drawing and export:
+            list_node_x[i]: x of the central points of stage i, list_node_y[i]: float array of shape (n_nodes,)
+                            by swId, ascending unless a placement is given
+            list_pin_ofst[i]: float array of shape (type_list[i],), y-offsets of the pins to the central point
+            pin_dx: x-offset of the input (-) & output (+) pins to the central point
         '''
         # set the coordinate of the (0, 0) switch node
         x0 = self.H_margin + self.Node_width/2
 
-        '''
-        Create dictionary to record the coordinate of the central point
-            Key: switch node tuples (i, j) as identifier of stage i and j_th switch node
-            Value: one tuple of float value as (x, y) coordinate 
-        '''
-        self.dict_central_point_coord = {}
+        hw = self.Node_width / 2
+        z = self.zoom_factor
+
+        hqw = hw * 1.5
+        self.pin_dx = hqw
+
+        self.list_node_x = []
+        self.list_node_y = []
+        self.list_pin_ofst = []
         for i in range(self.n_stage):
             # switch node travseral: stage i, j_th node
-            n_nodes = self.n_port // self.type_list[i]
-            y0 = self.V_margin + (self.TNode_height/2 if self.type_list[i] == 2 else self.FNode_height/2)
+            n_ports = self.type_list[i]
+            n_nodes = self.n_port // n_ports
+            node_height = self.get_node_height(n_ports)
+            node_vspace = self.get_node_vspace(n_ports)
+            y0 = self.V_margin + node_height/2
 
-            for j in range(n_nodes):
-                x = x0 + i * self.Node_hspace
-                if self.type_list[i] == 2:
-                    y = y0 + j * self.TNode_height + j//2 * self.FNode_vspace
-                else:
-                    y = y0 + j * (self.FNode_height+self.FNode_vspace)
+            j = np.arange(n_nodes)
+            if n_ports < 4:
+                y = y0 + j * node_height + j//(4//n_ports) * node_vspace
+            else:
+                y = y0 + j * (node_height+node_vspace)
+            if self.placement is not None:
+                y = y[self.placement[i]]
 
-                self.dict_central_point_coord[(i, j)] = (x, y)
+            self.list_node_x.append(x0 + i * self.Node_hspace)
+            self.list_node_y.append(y)
+            self.list_pin_ofst.append(np.array(self.get_pin_offsets(n_ports)) * z * self.scale_factor)
 
+        self.create_coord_views()
 
-        hw = self.Node_width / 2
-        z = self.zoom_factor
 
-        hqw = hw * 1.5
+    def set_layout(self, layout):
         '''
-        Create dictionary to record the coordinate of the input pins
-            Key: switch node tuples (i, j) as identifier of stage i and j_th switch node
-            Value: one list consists of two/four tuples, each of float value as (x, y) coordinate
-            Note: with the same key, the tuples are organized in y-coordinate ascending order
+        Set the sizes & coordinates of a layout instead of get_all_size & get_all_coordinates
+            layout: dictionary of the size attributes, pin_dx, list_node_x, list_node_y & list_pin_ofst, e.g. as exported
+                    by Graph.export_graph; the node coordinates already follow the placement
         '''
-        self.dict_input_pin_coord = {}
-        for i in range(self.n_stage):
-            # switch node travseral: stage i, j_th node
-            n_nodes = self.n_port // self.type_list[i]
+        for name, value in layout.items():
+            setattr(self, name, value)
+
+        self.create_coord_views()
 
-            xi = self.dict_central_point_coord[(i, 0)][0]
-            x = xi - hqw
-            for j in range(n_nodes):
-                yj = self.dict_central_point_coord[(i, j)][1]
-                self.dict_input_pin_coord[(i, j)] = []
-                
-                if self.type_list[i] == 2:
-                    self.dict_input_pin_coord[(i, j)].append((x, yj - 0.2*z*self.scale_factor))
-                    self.dict_input_pin_coord[(i, j)].append((x, yj + 0.2*z*self.scale_factor))
-                else:
-                    self.dict_input_pin_coord[(i, j)].append((x, yj - 0.6*z*self.scale_factor))
-                    self.dict_input_pin_coord[(i, j)].append((x, yj - 0.2*z*self.scale_factor))
-                    self.dict_input_pin_coord[(i, j)].append((x, yj + 0.2*z*self.scale_factor))
-                    self.dict_input_pin_coord[(i, j)].append((x, yj + 0.6*z*self.scale_factor))
 
+    def create_coord_views(self):
         '''
-        Create dictionary to record the coordinate of the output pins
+        Read-only dictionary views of the coordinate arrays
             Key: switch node tuples (i, j) as identifier of stage i and j_th switch node
-            Value: one list consists of two/four tuples, each of float value as (x, y) coordinate
-            Note: with the same key, the tuples are organized in y-coordinate ascending order
+            Value: dict_central_point_coord: one tuple of float value as (x, y) coordinate
+                   dict_input/output_pin_coord: one list consists of type_list[i] tuples, each of float value as (x, y) coordinate
+            Note: with the same key, the pin tuples are organized in y-coordinate ascending order
         '''
-        self.dict_output_pin_coord = {}
-        for i in range(self.n_stage):
-            # switch node travseral: stage i, j_th node
-            n_nodes = self.n_port // self.type_list[i]
+        self.dict_central_point_coord = NodeCoordView(self.list_node_x, self.list_node_y)
+        self.dict_input_pin_coord = PinCoordView([x - self.pin_dx for x in self.list_node_x], self.list_node_y, self.list_pin_ofst)
+        self.dict_output_pin_coord = PinCoordView([x + self.pin_dx for x in self.list_node_x], self.list_node_y, self.list_pin_ofst)
 
-            xi = self.dict_central_point_coord[(i, 0)][0]
-            x = xi + hqw
-            for j in range(n_nodes):
-                yj = self.dict_central_point_coord[(i, j)][1]
-                self.dict_output_pin_coord[(i, j)] = []
-                
-                if self.type_list[i] == 2:
-                    self.dict_output_pin_coord[(i, j)].append((x, yj - 0.2*z*self.scale_factor))
-                    self.dict_output_pin_coord[(i, j)].append((x, yj + 0.2*z*self.scale_factor))
-                else:
-                    self.dict_output_pin_coord[(i, j)].append((x, yj - 0.6*z*self.scale_factor))
-                    self.dict_output_pin_coord[(i, j)].append((x, yj - 0.2*z*self.scale_factor))
-                    self.dict_output_pin_coord[(i, j)].append((x, yj + 0.2*z*self.scale_factor))
-                    self.dict_output_pin_coord[(i, j)].append((x, yj + 0.6*z*self.scale_factor))
 
+    def get_pin_coords(self, stageIdx, uniIds, output=True):
+        '''
+        Get the (x, y) coordinates of the output (or input) pins uniIds of stage stageIdx as float array of shape uniIds.shape + (2,)
+        '''
+        n_ports = self.type_list[stageIdx]
+        swIds, portIds = np.divmod(np.asarray(uniIds), n_ports)
+
+        y = self.list_node_y[stageIdx][swIds] + self.list_pin_ofst[stageIdx][portIds]
+        x = self.list_node_x[stageIdx] + (self.pin_dx if output else -self.pin_dx)
+
+        return np.stack(np.broadcast_arrays(x, y), axis=-1)
+
+
+    def get_link_segments(self, stageIdx):
+        '''
+        Get the line segments between output pins of stage stageIdx and input pins of stage stageIdx+1
+            Return float array of shape (n_port, 2, 2) as [(x, y) of src, (x, y) of dst], in the order of list_uni_pairs
+        '''
+        uni_pairs = self.list_uni_pairs[stageIdx]
+        src = self.get_pin_coords(stageIdx, uni_pairs[:, 0], output=True)
+        dst = self.get_pin_coords(stageIdx+1, uni_pairs[:, 1], output=False)
+
+        return np.stack((src, dst), axis=1)
 
-    def get_pin_pairs(self):
+
+    def get_cache_config(self):
+        '''
+        Get the configuration identifying the cache entry of the network, monitor_def only affects images
+        '''
+        config = {
+            'n_port': self.n_port,
+            'type_list': list(self.type_list),
+            'pfx_list': list(self.pfx_list) if self.pfx_list is not None else None,
+            'intf_map': self.intf_map,
+        }
+        # keys of butterfly entries predate the topology
+        if self.topology != 'butterfly':
+            config['topology'] = self.topology
+        if self.placement is not None:
+            config['placement'] = [slots.tolist() for slots in self.placement]
+
+        return config
+
+
+    def get_pin_pairs(self, list_uni_pairs=None):
         ''' 
         Get all pin pairs for connection in the next step
-            Firstly, build (uniSrcId, uniDstId) pairs, then convert to
-            From (srcSwId, srcPortId) to (dstSwId, dstPortId)
+            Build (uniSrcId, uniDstId) pairs of every stage by whole-array integer operations,
+            the (srcSwId, srcPortId) to (dstSwId, dstPortId) form is built lazily by dict_connect_pin_pairs
+            Note: list_uni_pairs, the pin pairs of every stage computed before, are used as they are
         '''
-        list_uni_pairs = [[] for i in range(self.n_stage-1)]
-        # create (uniSrcId, uniDstId) tuples as pin pairs
-        for i in range(self.n_stage-1):
-            pre_span = self.n_port // math.prod(self.type_list[0:i])
-            cur_span = self.n_port // math.prod(self.type_list[0:i+1])
+        '''
+        Create list to record the connection pairs between output pins of i_th stage and input pins of i+1_th stage
+            Index: stage Id i
+            Value: int32 array of shape (n_port, 2), each row as (uniSrcId, uniDstId)
+            Note: rows are organized in the same order as the connection commands are emitted
+            Note: with a cache, the arrays of a hit are read-only memory-mapped views of the cached file
+        '''
+        self.list_uni_pairs = list_uni_pairs
+        if self.list_uni_pairs is None and self.cache is not None:
+            self.list_uni_pairs = self.cache.load_pin_pairs(self.cache_key)
+
+        if self.list_uni_pairs is None:
+            self.list_uni_pairs = self.build_uni_pairs()
+            if self.cache is not None:
+                self.cache.store_pin_pairs(self.cache_key, self.list_uni_pairs, config=self.get_cache_config())
+
+        self._dict_connect_pin_pairs = None
+        self._list_route_table = None
+        self._route_index = None
+
 
-            # traverse across all switch nodes from i_th stage
+    def build_uni_pairs(self):
+        '''
+        Compute the (uniSrcId, uniDstId) pairs of every stage, see get_pin_pairs
+            benes: the links after the butterfly stages are the inverse of the butterfly links in reverse order,
+            so stage n_stage-1-i mirrors stage i
+        '''
+        list_uni_pairs = []
+        pre_span = self.n_port
+        for i in range(len(self.bfly_type_list)-1):
             n_ports = self.type_list[i]
             n_nodes = self.n_port // n_ports
-            for j in range(n_nodes):
-                uniId_ofst = j*n_ports // pre_span * pre_span
-                for k in range(n_ports):
-                    uniSrcId = j*n_ports + k
-                    rank = (uniSrcId%pre_span) // cur_span
-                    if k == rank:
-                        fxPortId = k
+            cur_span = pre_span // n_ports
 
-                for l in range(n_ports):
-                    uniSrcId = j*n_ports + (fxPortId+l)%n_ports
-                    uniDstId = uniId_ofst + (j*n_ports+fxPortId + cur_span*l) % pre_span
+            # one row per switch node of i_th stage, one column per port
+            uniId_base = np.arange(n_nodes, dtype=np.int64)[:, None] * n_ports
+            portIds = np.arange(n_ports, dtype=np.int64)
+            uniId_ofst = uniId_base // pre_span * pre_span
 
-                    list_uni_pairs[i].append((uniSrcId, uniDstId))
-        # print(list_uni_pairs)
+            # the fixed port is the only port k whose rank equals k
+            rank = (uniId_base + portIds) % pre_span // cur_span
+            fxPortId = np.argmax(rank == portIds, axis=1)[:, None]
 
+            uniSrcId = uniId_base + (fxPortId + portIds) % n_ports
+            uniDstId = uniId_ofst + (uniId_base + fxPortId + cur_span*portIds) % pre_span
 
+            list_uni_pairs.append(np.stack((uniSrcId.ravel(), uniDstId.ravel()), axis=1).astype(np.int32))
+            pre_span = cur_span
+
+        if self.topology == 'benes':
+            for uni_pairs in list_uni_pairs[::-1]:
+                # swap src & dst, rows in uniSrcId ascending order
+                mirror_pairs = uni_pairs[:, ::-1]
+                list_uni_pairs.append(np.ascontiguousarray(mirror_pairs[np.argsort(mirror_pairs[:, 0])]))
+
+        return list_uni_pairs
+
+
+    @property
+    def dict_connect_pin_pairs(self):
         '''
-        Create dictionary to record the connection pairs between output pins of i_th stage and input pins of i+1_th stage
+        Dictionary view of list_uni_pairs, built on first access
             Key: stage Id tuples (i, i+1)
             Value: list of lists, each inner list consists of [(srcSwId, srcPortId), (dstSwId, dstPortId)] as a [src, dst] list
         '''
-        self.dict_connect_pin_pairs = {}
-        # convert uniId to (SwId, PortId) tuple
-        for i in range(self.n_stage-1):
-            self.dict_connect_pin_pairs[(i, i+1)] = []
+        if self._dict_connect_pin_pairs is None:
+            self._dict_connect_pin_pairs = {}
+            # convert uniId to (SwId, PortId) tuple
+            for i in range(self.n_stage-1):
+                uni_pairs = self.list_uni_pairs[i]
+                src_pins = zip(*(a.tolist() for a in np.divmod(uni_pairs[:, 0], self.type_list[i])))
+                dst_pins = zip(*(a.tolist() for a in np.divmod(uni_pairs[:, 1], self.type_list[i+1])))
 
-            # traverse across all pin pairs within one list
-            for srcId, dstId in list_uni_pairs[i]:
-                srcSwId = srcId // self.type_list[i]
-                srcPortId = srcId % self.type_list[i]
+                self._dict_connect_pin_pairs[(i, i+1)] = [list(pair) for pair in zip(src_pins, dst_pins)]
 
-                dstSwId = dstId // self.type_list[i+1]
-                dstPortId = dstId % self.type_list[i+1]
+        return self._dict_connect_pin_pairs
 
-                self.dict_connect_pin_pairs[(i, i+1)].append([(srcSwId, srcPortId), (dstSwId, dstPortId)])
+
+    def get_stage_perm(self, stageIdx):
+        '''
+        Get the permutation from output pins of stage stageIdx to input pins of stage stageIdx+1
+            Return int32 array perm, uniSrcId is connected to uniDstId perm[uniSrcId]
+        '''
+        uni_pairs = self.list_uni_pairs[stageIdx]
+
+        perm = np.empty(self.n_port, dtype=np.int32)
+        perm[uni_pairs[:, 0]] = uni_pairs[:, 1]
+        return perm
+
+
+    def get_route_tables(self):
+        '''
+        Get the destination-tag routing tables of every stage, built on first call
+            Index: stage Id i
+            Value: int32 array of shape (n_nodes, type_list[i]), [j, c] is the output port of j_th switch node
+                   towards its c_th sub-block, i.e. the output ports d of the network with d % span_i // span_i+1 == c
+            Note: span_i = n_port // prod(type_list[0:i]), a switch node of stage i only reaches the span_i output
+                  ports of its own block, the table of the last stage is the identity (port d % type_list[i])
+            Note: paths of a benes network are not unique, see Benes.route_benes
+        '''
+        assert self.topology == 'butterfly', "Destination-tag routing requires the butterfly topology"
+        if self._list_route_table is None:
+            self._list_route_table = []
+            pre_span = self.n_port
+            for i in range(self.n_stage):
+                n_ports = self.type_list[i]
+                cur_span = pre_span // n_ports
+
+                if i == self.n_stage-1:
+                    table = np.tile(np.arange(n_ports, dtype=np.int32), (self.n_port // n_ports, 1))
+                else:
+                    # sub-block reached by each output port, one row per switch node
+                    sub_block = self.get_stage_perm(i).reshape(-1, n_ports) % pre_span // cur_span
+                    table = np.argsort(sub_block, axis=1).astype(np.int32)
+
+                self._list_route_table.append(table)
+                pre_span = cur_span
+
+        return self._list_route_table
+
+
+    def get_route_ports(self, stageIdx, swId, dstId):
+        '''
+        Get the output port of switch node swId of stage stageIdx on the unique path towards output port dstId
+            swId & dstId may be integer arrays of the same shape, dstId must be reachable from swId
+        '''
+        table = self.get_route_tables()[stageIdx]
+        cur_span = self.n_port // math.prod(self.type_list[0:stageIdx+1])
+
+        return table[swId, dstId // cur_span % self.type_list[stageIdx]]
+
+
+    def get_route_index(self, lazy=True):
+        '''
+        Get the RouteIndex of the network, created on first call and cached, see Routing.RouteIndex
+            lazy: compute the paths input port by input port on demand, otherwise all at once
+        '''
+        if self._route_index is None:
+            from Routing import RouteIndex
+            self._route_index = RouteIndex(self, lazy=lazy)
+        elif not lazy and self._route_index.paths is None:
+            self._route_index.build_all()
+
+        return self._route_index
+
+
+    def render(self):
+        '''
+        Draw the whole network (canvas, switch nodes and pin connections) by matplotlib
+        '''
+        load_matplotlib()
+
+        with self.profile_phase('create_canvas'):
+            self.create_canvas()
+        with self.profile_phase('draw_switch_nodes', nodes=sum(self.n_port // n_ports for n_ports in self.type_list),
+                                pins=2*self.n_port*self.n_stage):
+            self.draw_switch_nodes()
+        with self.profile_phase('draw_pin_connection', nets=self.n_port*(self.n_stage-1)):
+            self.draw_pin_connection()
 
 
     def create_canvas(self):
@@ -187,13 +575,14 @@ class ButterflyNet(object):
         Width = 216.0 * self.scale_factor
         Height= 128.0 * self.scale_factor
 
-        plt.figure(figsize=[Width, Height], dpi=10)
+        fig = Figure(figsize=[Width, Height], dpi=10)
+        FigureCanvasAgg(fig)
 
-        self.ax = plt.subplot(111,aspect = 'equal')
+        self.ax = fig.add_subplot(111,aspect = 'equal')
         self.ax.set_xlim([0, Width])
         self.ax.set_ylim([0, Height])
 
-        plt.subplots_adjust(left=0, bottom=0, right=1, top=1, wspace=0, hspace=0)
+        fig.subplots_adjust(left=0, bottom=0, right=1, top=1, wspace=0, hspace=0)
 
 
     def draw_switch_nodes(self):
@@ -201,76 +590,33 @@ class ButterflyNet(object):
         Draw switch nodes (edges) and their corresponding i/o pins by matplotlib
             Top Edge -a; Bottom Edge - b; Left Edge - c; Right Edge - d
         '''
-        # create coordinate pairs for edges of switch nodes
-        list_edge_a_pairs = [[] for i in range(self.n_stage)]
-        list_edge_b_pairs = [[] for i in range(self.n_stage)]
-        list_edge_c_pairs = [[] for i in range(self.n_stage)]
-        list_edge_d_pairs = [[] for i in range(self.n_stage)]
-
         hw = self.Node_width / 2
         z = self.zoom_factor
 
-        hqw = hw * 1.5
-        for i in range(self.n_stage):
-            # switch node travseral: stage i, j_th node
-            n_nodes = self.n_port // self.type_list[i]        
-            
-            xi = self.dict_central_point_coord[(i, 0)][0]
-            for j in range(n_nodes):
-                yj = self.dict_central_point_coord[(i, j)][1]
-                if self.type_list[i] == 2:
-                    list_edge_a_pairs[i].append([(xi-hw, yj-0.4*z*self.scale_factor), (xi+hw, yj-0.4*z*self.scale_factor)])
-                    list_edge_b_pairs[i].append([(xi-hw, yj+0.4*z*self.scale_factor), (xi+hw, yj+0.4*z*self.scale_factor)])
-                    list_edge_c_pairs[i].append([(xi-hw, yj-0.4*z*self.scale_factor), (xi-hw, yj+0.4*z*self.scale_factor)])
-                    list_edge_d_pairs[i].append([(xi+hw, yj-0.4*z*self.scale_factor), (xi+hw, yj+0.4*z*self.scale_factor)])
-                else:
-                    list_edge_a_pairs[i].append([(xi-hw, yj-0.8*z*self.scale_factor), (xi+hw, yj-0.8*z*self.scale_factor)])
-                    list_edge_b_pairs[i].append([(xi-hw, yj+0.8*z*self.scale_factor), (xi+hw, yj+0.8*z*self.scale_factor)])
-                    list_edge_c_pairs[i].append([(xi-hw, yj-0.8*z*self.scale_factor), (xi-hw, yj+0.8*z*self.scale_factor)])
-                    list_edge_d_pairs[i].append([(xi+hw, yj-0.8*z*self.scale_factor), (xi+hw, yj+0.8*z*self.scale_factor)])
-
-        # create coordinate pairs for i/o pins of switch nodes
-        list_input_pin_pairs = [[] for i in range(self.n_stage)]
-        list_output_pin_pairs = [[] for i in range(self.n_stage)]
-        
+        hqw = self.pin_dx
         for i in range(self.n_stage):
-            # switch node travseral: stage i, j_th node
-            n_nodes = self.n_port // self.type_list[i]        
-            
-            xi = self.dict_central_point_coord[(i, 0)][0]
-            for j in range(n_nodes):
-                yj = self.dict_central_point_coord[(i, j)][1]
-                if self.type_list[i] == 2:
-                    list_input_pin_pairs[i].append([(xi-hqw, yj-0.2*z*self.scale_factor), (xi-hw, yj-0.2*z*self.scale_factor)])
-                    list_input_pin_pairs[i].append([(xi-hqw, yj+0.2*z*self.scale_factor), (xi-hw, yj+0.2*z*self.scale_factor)])
-
-                    list_output_pin_pairs[i].append([(xi+hw, yj-0.2*z*self.scale_factor), (xi+hqw, yj-0.2*z*self.scale_factor)])
-                    list_output_pin_pairs[i].append([(xi+hw, yj+0.2*z*self.scale_factor), (xi+hqw, yj+0.2*z*self.scale_factor)])
-                else:
-                    list_input_pin_pairs[i].append([(xi-hqw, yj-0.6*z*self.scale_factor), (xi-hw, yj-0.6*z*self.scale_factor)])
-                    list_input_pin_pairs[i].append([(xi-hqw, yj-0.2*z*self.scale_factor), (xi-hw, yj-0.2*z*self.scale_factor)])
-                    list_input_pin_pairs[i].append([(xi-hqw, yj+0.2*z*self.scale_factor), (xi-hw, yj+0.2*z*self.scale_factor)])
-                    list_input_pin_pairs[i].append([(xi-hqw, yj+0.6*z*self.scale_factor), (xi-hw, yj+0.6*z*self.scale_factor)])
-
-                    list_output_pin_pairs[i].append([(xi+hw, yj-0.6*z*self.scale_factor), (xi+hqw, yj-0.6*z*self.scale_factor)])
-                    list_output_pin_pairs[i].append([(xi+hw, yj-0.2*z*self.scale_factor), (xi+hqw, yj-0.2*z*self.scale_factor)])
-                    list_output_pin_pairs[i].append([(xi+hw, yj+0.2*z*self.scale_factor), (xi+hqw, yj+0.2*z*self.scale_factor)])
-                    list_output_pin_pairs[i].append([(xi+hw, yj+0.6*z*self.scale_factor), (xi+hqw, yj+0.6*z*self.scale_factor)])
-
-        # draw edges and i/o pins
-        for i in range(self.n_stage):
-            lc_edge_a = mc.LineCollection(list_edge_a_pairs[i], colors='k', linewidth=8)
-            lc_edge_b = mc.LineCollection(list_edge_b_pairs[i], colors='k', linewidth=8)
-            lc_edge_c = mc.LineCollection(list_edge_c_pairs[i], colors='k', linewidth=8)
-            lc_edge_d = mc.LineCollection(list_edge_d_pairs[i], colors='k', linewidth=8)
+            xi = self.list_node_x[i]
+            yj = self.list_node_y[i]
+            # half height of the node, 0.4 for 2X2 node and 0.8 for 4X4 node
+            hh = self.type_list[i] / 5
+            top = yj - hh*z*self.scale_factor
+            bottom = yj + hh*z*self.scale_factor
+
+            # create coordinate pairs for edges of switch nodes, one segment per node
+            lc_edge_a = mc.LineCollection(get_segments(xi-hw, top, xi+hw, top), colors='k', linewidth=8)
+            lc_edge_b = mc.LineCollection(get_segments(xi-hw, bottom, xi+hw, bottom), colors='k', linewidth=8)
+            lc_edge_c = mc.LineCollection(get_segments(xi-hw, top, xi-hw, bottom), colors='k', linewidth=8)
+            lc_edge_d = mc.LineCollection(get_segments(xi+hw, top, xi+hw, bottom), colors='k', linewidth=8)
 
             self.ax.add_collection(lc_edge_a)
             self.ax.add_collection(lc_edge_b)
             self.ax.add_collection(lc_edge_c)
             self.ax.add_collection(lc_edge_d)
 
-            lc_input_pin = mc.LineCollection(list_input_pin_pairs[i], colors='k', linewidth=6)
-            lc_output_pin = mc.LineCollection(list_output_pin_pairs[i], colors='k', linewidth=6)
+            # create coordinate pairs for i/o pins of switch nodes, node by node in y-coordinate ascending order
+            pin_y = (yj[:, None] + self.list_pin_ofst[i]).ravel()
+            lc_input_pin = mc.LineCollection(get_segments(xi-hqw, pin_y, xi-hw, pin_y), colors='k', linewidth=6)
+            lc_output_pin = mc.LineCollection(get_segments(xi+hw, pin_y, xi+hqw, pin_y), colors='k', linewidth=6)
 
             self.ax.add_collection(lc_input_pin)
             self.ax.add_collection(lc_output_pin)
@@ -281,271 +627,469 @@ class ButterflyNet(object):
         Draw the connection line segments among pins by matplotlib
         '''
         for i in range(self.n_stage-1):
-            # convert pin pairs to coordinate pairs i.e. (SwId, PortId) to (x, y)
-            list_pin_pairs = []
-            
-            pin_pairs = self.dict_connect_pin_pairs[(i, i+1)]
-            for pair in pin_pairs:
-                src_pin = pair[0]
-                dst_pin = pair[1]
-
-                src_pin_coord = self.dict_output_pin_coord[(i, src_pin[0])][src_pin[1]]
-                dst_pin_coord = self.dict_input_pin_coord[(i+1, dst_pin[0])][dst_pin[1]]
-                list_pin_pairs.append([src_pin_coord, dst_pin_coord])
-
-            lc = mc.LineCollection(list_pin_pairs, colors='b', linewidth=6)
+            lc = mc.LineCollection(self.get_link_segments(i), colors='b', linewidth=6)
             self.ax.add_collection(lc)
 
 
-    def save_network_image(self):
+    def save_network_image(self, img_fmt='png', img_dir=None):
+        '''
+        Save the butterfly network topology image as file <net name>.<img_fmt> in img_dir (default the working directory)
+            png: rendered by matplotlib; svg & pdf: streamed from the coordinate arrays, see Vector.gen_svg
+            Note: with a cache, a hit is copied without rendering, matplotlib is not even imported
+        '''
+        from Vector import LIST_IMG_FORMATS, save_svg, save_pdf
+        assert img_fmt in LIST_IMG_FORMATS, "Invalid image format, allowed values are %s" % ', '.join(LIST_IMG_FORMATS)
+
+        if img_fmt == 'png':
+            def write(fn):
+                if self.ax is None:
+                    self.render()
+                self.ax.figure.savefig(fn)
+        else:
+            write = lambda fn: (save_svg if img_fmt == 'svg' else save_pdf)(self, fn)
+
+        img_fn = '%s.%s' % (self.get_net_name(), img_fmt)
+        if img_dir is not None:
+            img_fn = os.path.join(img_dir, img_fn)
+
+        if self.cache is not None:
+            name = 'image_%dx%d.%s' % (self.monitor_def[0], self.monitor_def[1], img_fmt)
+            path = self.cache.get_path(self.cache_key, name)
+            if path is None:
+                with self.profile_phase('save_image'):
+                    path = self.cache.put_file(self.cache_key, name, write, config=self.get_cache_config())
+            shutil.copyfile(path, img_fn)
+            return
+
+        with self.profile_phase('save_image'):
+            write(img_fn)
+
+
+    def get_net_name(self):
         '''
-        Save the butterfly network topology image as file
+        Get the name of the network as ButterflyNet_<n_port>X<n_port>_<type_list>, e.g. ButterflyNet_16X16_2_4_2
+            benes: BenesNet_<n_port>X<n_port>_<type_list of the butterfly stages>
         '''
         str_type_list = ''
-        for i in range(self.n_stage):
-            str_type_list = str_type_list + '_' + str(self.type_list[i])
-        
-        img_fn = 'ButterflyNet_%dX%d%s' % (self.n_port, self.n_port, str_type_list)
-        # img_fn = 'ButterflyNet_' + str(self.n_port) + 'X' + str(self.n_port) + '_' + str_type_list
-        plt.savefig(img_fn)
+        for n_ports in self.bfly_type_list:
+            str_type_list = str_type_list + '_' + str(n_ports)
 
+        name = 'BenesNet' if self.topology == 'benes' else 'ButterflyNet'
+        return '%s_%dX%d%s' % (name, self.n_port, self.n_port, str_type_list)
 
 
-    def gen_connect_tcl_as_file(self):
+
+    def gen_connect_tcl_as_file(self, tcl_fn=None, tcl_mode='flat', n_worker=None):
         '''
         Generate the tcl command for automatic connection as file
             Tcl cmd <create external ports>: make_bd_pins_external  [get_bd_pins <IP_Instance>/<Pin>]
             Tcl cmd <rename external ports>: set_property name <new_name> [get_bd_ports <old_name>]
             Tcl cmd <connect external ports>: connect_bd_net [get_bd_ports <ext_port>] [get_bd_pins <IP_Instance>/<Pin>]
             Tcl cmd <connect two pins>: connect_bd_net [get_bd_pins <IP_Instance_a>/<Pin_a>] [get_bd_pins <IP_Instance_b>/<Pin_b>]
+            Note: tcl_fn (default self.tcl_fn) may also be a file-like object, '-' for stdout or end with '.gz' for gzip output
+            Note: see gen_connect_tcl for tcl_mode
+            Note: with a cache, the tcl file of every mode is generated once and copied from the cache
+            Note: n_worker emits the shards of get_tcl_shards on n_worker processes (tcl_mode flat & intf), the
+                  output is byte-identical to the serial one, see Shard.write_tcl_shards
+        '''
+        if tcl_fn is None:
+            tcl_fn = self.tcl_fn
+        assert tcl_fn is not None, "Output tcl command file name not specified"
+
+        if n_worker is None:
+            lines = self.gen_connect_tcl(tcl_mode)
+            def write_tcl(file):
+                write_lines(file, lines)
+        else:
+            from Shard import write_tcl_shards
+            def write_tcl(file):
+                write_tcl_shards(self, file, tcl_mode, n_worker)
+
+        if self.cache is not None:
+            name = 'connect_%s.tcl' % tcl_mode
+            path = self.cache.get_path(self.cache_key, name)
+            if path is None:
+                def write(fn):
+                    with open(fn, 'w') as file:
+                        write_tcl(file)
+                path = self.cache.put_file(self.cache_key, name, write, config=self.get_cache_config())
+            copy_to_output(path, tcl_fn)
+            return
+
+        with open_output(tcl_fn) as file:
+            write_tcl(file)
+
+
+    def gen_connect_tcl(self, tcl_mode='flat'):
         '''
-        assert self.tcl_fn is not None, "Output tcl command file name not specified"
+        Generate the tcl command lines for automatic connection
+            flat: one command per net, see gen_connect_tcl_flat
+            compact: connectivity tables driven by foreach loops, see gen_connect_tcl_compact
+            intf: as flat, but one interface net per link between consecutive stages, see gen_tcl_connect_consec_stages_intf
+        '''
+        assert tcl_mode in LIST_TCL_MODES, "Invalid tcl mode, allowed values are %s" % ', '.join(LIST_TCL_MODES)
+
+        if tcl_mode == 'compact':
+            return self.profile_lines('tcl_compact', self.gen_connect_tcl_compact(), nets=self.n_port*(self.n_stage-1))
+        if tcl_mode == 'intf':
+            # check the interface mapping before anything is emitted
+            self.get_link_intf()
+        return self.gen_connect_tcl_flat(intf=(tcl_mode == 'intf'))
 
-        self.gen_tcl_crt_rn_ext_ports() # create & rename external ports
-        self.gen_tcl_connect_clk_rst() # connect clk & rst_n signals
 
+    def gen_connect_tcl_flat(self, intf=False):
+        '''
+        Generate the tcl command lines for automatic connection, one command per net
+            intf: consecutive stages are connected by interface nets instead of pin nets
+        '''
+        yield from self.profile_lines('tcl_ext_ports', self.gen_tcl_crt_rn_ext_ports()) # create & rename external ports
+        yield from self.profile_lines('tcl_clk_rst', self.gen_tcl_connect_clk_rst()) # connect clk & rst_n signals
+
+        gen_consec_stages = self.gen_tcl_connect_consec_stages_intf if intf else self.gen_tcl_connect_consec_stages
+        lines = (line for stageIdx in range(self.n_stage-1) for line in gen_consec_stages(stageIdx))
+        yield from self.profile_lines('tcl_consec_stages', lines, nets=self.n_port*(self.n_stage-1))
+
+
+    def get_tcl_shards(self, intf=False):
+        '''
+        Get the independent shards of gen_connect_tcl_flat as list of (shard name, method name, args)
+            The lines of getattr(self, method name)(*args) concatenated in list order are the lines of
+            gen_connect_tcl_flat: creation & renaming of the external ports, clk & rst_n of every stage and
+            the links of every stage, split by signal unless intf
+        '''
+        shards = [('ext_ports_crt', 'gen_tcl_crt_ext_ports', ()), ('ext_ports_rn', 'gen_tcl_rn_ext_ports', ())]
+        shards += [('clk_rst_%d' % i, 'gen_tcl_connect_clk_rst', (i,)) for i in range(self.n_stage)]
+
+        for i in range(self.n_stage-1):
+            if intf:
+                shards.append(('stage_%d_intf' % i, 'gen_tcl_connect_consec_stages_intf', (i,)))
+            else:
+                shards += [('stage_%d_%s' % (i, src_pin), 'gen_tcl_connect_stage_signal', (i, k))
+                           for k, (src_pin, _) in enumerate(LIST_LINK_SIGNALS)]
+
+        return shards
+
+
+    def gen_connect_tcl_compact(self):
+        '''
+        Generate the tcl command lines for automatic connection in compact form
+            Pin pairs are emitted as tcl lists of (uniSrcId, uniDstId) and connected by foreach loops,
+            clk & rst_n are connected by one multi-pin command each, all in a single startgroup/endgroup
+        '''
+        last = self.n_stage - 1
+
+        yield 'startgroup\n'
+        # tcl list of the pin name suffixes of each radix
+        for n_ports in sorted(set(self.type_list)):
+            yield 'set sfx_%d {%s}\n' % (n_ports, ' '.join(get_port_suffix(k) for k in range(n_ports)))
+        yield '\n'
+        yield 'proc bfly_pin {pfx n_ports uniId pin} {\n'
+        yield '    upvar #0 sfx_$n_ports sfx\n'
+        yield '    return "${pfx}_[expr {$uniId / $n_ports}]/${pin}_[lindex $sfx [expr {$uniId % $n_ports}]]"\n'
+        yield '}\n\n'
+
+        # create & rename external ports
+        yield 'make_bd_pins_external  [get_bd_pins %s_0/clk]\n' % self.pfx_list[0]
+        yield 'make_bd_pins_external  [get_bd_pins %s_0/rst_n]\n' % self.pfx_list[0]
+        list_ext_groups = [(self.pfx_list[0], self.type_list[0], LIST_EXT_IN_PORTS),
+                           (self.pfx_list[last], self.type_list[last], LIST_EXT_OUT_PORTS)]
+        for pfx, n_ports, ext_ports in list_ext_groups:
+            yield 'foreach pin {%s} {\n' % ' '.join(pin for pin, _ in ext_ports)
+            yield '    for {set i 0} {$i < %d} {incr i} {\n' % self.n_port
+            yield '        make_bd_pins_external  [get_bd_pins [bfly_pin %s %d $i $pin]]\n' % (pfx, n_ports)
+            yield '    }\n'
+            yield '}\n'
+
+        yield 'set_property name clk [get_bd_ports clk_0]\n'
+        yield 'set_property name rst_n [get_bd_ports rst_n_0]\n'
+        for pfx, n_ports, ext_ports in list_ext_groups:
+            yield 'foreach {pin name} {%s} {\n' % ' '.join('%s %s' % port for port in ext_ports)
+            yield '    for {set i 0} {$i < %d} {incr i} {\n' % self.n_port
+            yield '        set old_name ${pin}_[lindex $sfx_%d [expr {$i %% %d}]]_[expr {$i / %d}]\n' % (n_ports, n_ports, n_ports)
+            yield '        set_property name ${name}_$i [get_bd_ports $old_name]\n'
+            yield '    }\n'
+            yield '}\n'
+        yield '\n'
+
+        # connect clk & rst_n signals, the pin lists are built by plain loops as Vivado runs Tcl 8.5 (no lmap)
+        yield 'set clk_pins {}\n'
+        yield 'set rst_n_pins {}\n'
+        for i in range(self.n_stage):
+            n_nodes = self.n_port // self.type_list[i]
+            yield 'for {set j %d} {$j < %d} {incr j} {lappend clk_pins %s_$j/clk; lappend rst_n_pins %s_$j/rst_n}\n' \
+                % (1 if i == 0 else 0, n_nodes, self.pfx_list[i], self.pfx_list[i])
+        yield 'if {[llength $clk_pins]} {\n'
+        yield '    connect_bd_net [get_bd_ports clk] [get_bd_pins $clk_pins]\n'
+        yield '    connect_bd_net [get_bd_ports rst_n] [get_bd_pins $rst_n_pins]\n'
+        yield '}\n\n'
+
+        # connect pins between consecutive stages
         for stageIdx in range(self.n_stage-1):
-            self.gen_tcl_connect_consec_stages(stageIdx)
+            yield from self.gen_tcl_list('pin_pairs_%d' % stageIdx, self.list_uni_pairs[stageIdx])
 
+            yield 'foreach {src dst} $pin_pairs_%d {\n' % stageIdx
+            for src_pin, dst_pin in LIST_LINK_SIGNALS:
+                yield '    connect_bd_net [get_bd_pins [bfly_pin %s %d $src %s]] [get_bd_pins [bfly_pin %s %d $dst %s]]\n' \
+                    % (self.pfx_list[stageIdx], self.type_list[stageIdx], src_pin, self.pfx_list[stageIdx+1], self.type_list[stageIdx+1], dst_pin)
+            yield '}\n\n'
 
-    def gen_tcl_crt_rn_ext_ports(self):
-        
-        with open(self.tcl_fn, 'w') as file:
-            file.write('startgroup\n')
+        yield 'endgroup\n'
 
-            cmd_ext_clk = 'make_bd_pins_external  [get_bd_pins '+ self.pfx_list[0] +'_0/clk]\n'
-            cmd_ext_rst = 'make_bd_pins_external  [get_bd_pins '+ self.pfx_list[0] +'_0/rst_n]\n'
-            file.write(cmd_ext_clk)
-            file.write(cmd_ext_rst)
 
-            # ivld signals
-            for i in range(self.n_port):
-                if (self.type_list[0] == 2):
-                    cmd_crt_ivld = 'make_bd_pins_external  [get_bd_pins '+ self.pfx_list[0] +'_'+str(i//2)+'/ivld_'+chr(ord('a')+i%2)+']\n'
-                else:
-                    cmd_crt_ivld = 'make_bd_pins_external  [get_bd_pins '+ self.pfx_list[0] +'_'+str(i//4)+'/ivld_'+chr(ord('a')+i%4)+']\n'
-                
-                file.write(cmd_crt_ivld)
-            
-            file.write('\n')
-            
-            # din signals
-            for i in range(self.n_port):
-                if (self.type_list[0] == 2):
-                    cmd_crt_din = 'make_bd_pins_external  [get_bd_pins '+ self.pfx_list[0] +'_'+str(i//2)+'/din_'+chr(ord('a')+i%2)+']\n'
-                else:
-                    cmd_crt_din = 'make_bd_pins_external  [get_bd_pins '+ self.pfx_list[0] +'_'+str(i//4)+'/din_'+chr(ord('a')+i%4)+']\n'
-                
-                file.write(cmd_crt_din)
-            
-            file.write('\n')
-            
-            # ofw signals
-            for i in range(self.n_port):
-                if (self.type_list[0] == 2):
-                    cmd_crt_ofw = 'make_bd_pins_external  [get_bd_pins '+ self.pfx_list[0] +'_'+str(i//2)+'/ofw_input_'+chr(ord('a')+i%2)+']\n'
-                else:
-                    cmd_crt_ofw = 'make_bd_pins_external  [get_bd_pins '+ self.pfx_list[0] +'_'+str(i//4)+'/ofw_input_'+chr(ord('a')+i%4)+']\n'
-                
-                file.write(cmd_crt_ofw)
-            
-            file.write('\n')
+    def gen_tcl_list(self, name, array, n_per_line=64):
+        '''
+        Generate the tcl command lines setting variable name to the flattened integer array as a tcl list
+        '''
+        values = array.ravel().tolist()
 
-            # ovld signals
-            for i in range(self.n_port):
-                if (self.type_list[self.n_stage-1] == 2):
-                    cmd_crt_ovld = 'make_bd_pins_external  [get_bd_pins '+ self.pfx_list[self.n_stage-1] +'_'+str(i//2)+'/ovld_'+chr(ord('a')+i%2)+']\n'
-                else:
-                    cmd_crt_ovld = 'make_bd_pins_external  [get_bd_pins '+ self.pfx_list[self.n_stage-1] +'_'+str(i//4)+'/ovld_'+chr(ord('a')+i%4)+']\n'
-                
-                file.write(cmd_crt_ovld)
-            
-            file.write('\n')
+        yield 'set %s {\n' % name
+        for i in range(0, len(values), n_per_line):
+            yield ' '.join(map(str, values[i:i+n_per_line])) + '\n'
+        yield '}\n'
 
-            # dout signals
-            for i in range(self.n_port):
-                if (self.type_list[self.n_stage-1] == 2):
-                    cmd_crt_dout = 'make_bd_pins_external  [get_bd_pins '+ self.pfx_list[self.n_stage-1] +'_'+str(i//2)+'/dout_'+chr(ord('a')+i%2)+']\n'
-                else:
-                    cmd_crt_dout = 'make_bd_pins_external  [get_bd_pins '+ self.pfx_list[self.n_stage-1] +'_'+str(i//4)+'/dout_'+chr(ord('a')+i%4)+']\n'
-                
-                file.write(cmd_crt_dout)
-            
-            file.write('\n')
 
-            # bp signals
-            for i in range(self.n_port):
-                if (self.type_list[self.n_stage-1] == 2):
-                    cmd_crt_bp = 'make_bd_pins_external  [get_bd_pins '+ self.pfx_list[self.n_stage-1] +'_'+str(i//2)+'/ofw_output_'+chr(ord('a')+i%2)+']\n'
-                else:
-                    cmd_crt_bp = 'make_bd_pins_external  [get_bd_pins '+ self.pfx_list[self.n_stage-1] +'_'+str(i//4)+'/ofw_output_'+chr(ord('a')+i%4)+']\n'
-                
-                file.write(cmd_crt_bp)
-            
-            file.write('endgroup\n\n\n')
+    def gen_ext_port_pins(self, stageIdx):
+        '''
+        Get (SwId, PortSuffix) of every external i/o port, i.e. all input pins of the first stage or all output pins of the last stage
+        '''
+        n_ports = self.type_list[stageIdx]
+        sfx = [get_port_suffix(k) for k in range(n_ports)]
 
+        return [(i//n_ports, sfx[i%n_ports]) for i in range(self.n_port)]
+
+
+    def get_ext_groups(self):
         '''
-        Rename External Ports
+        Get (prefix name, ext pins of gen_ext_port_pins, ext ports) of the first & the last stage
         '''
-        with open(self.tcl_fn, 'a') as file:
-            file.write('startgroup\n')
+        # input ports are on the first stage while output ports are on the last stage
+        return [(self.pfx_list[0], self.gen_ext_port_pins(0), LIST_EXT_IN_PORTS),
+                (self.pfx_list[self.n_stage-1], self.gen_ext_port_pins(self.n_stage-1), LIST_EXT_OUT_PORTS)]
 
-            cmd_ext_clk = 'set_property name clk [get_bd_ports clk_0]\n'
-            cmd_ext_rst = 'set_property name rst_n [get_bd_ports rst_n_0]\n'
-            file.write(cmd_ext_clk)
-            file.write(cmd_ext_rst)
 
-            # ivld signals
-            for i in range(self.n_port):
-                if (self.type_list[0] == 2):
-                    cmd_rn_ivld = 'set_property name ivld_'+str(i)+' [get_bd_ports ivld_'+chr(ord('a')+i%2)+'_'+str(i//2)+']\n'
-                else:
-                    cmd_rn_ivld = 'set_property name ivld_'+str(i)+' [get_bd_ports ivld_'+chr(ord('a')+i%4)+'_'+str(i//4)+']\n'
-                
-                file.write(cmd_rn_ivld)
-            
-            file.write('\n')
+    def gen_tcl_crt_rn_ext_ports(self):
+        '''
+        Create external ports from the input pins of the first stage & the output pins of the last stage, then rename them
+        '''
+        yield from self.gen_tcl_crt_ext_ports()
+        yield from self.gen_tcl_rn_ext_ports()
 
-            # din signals
-            for i in range(self.n_port):
-                if (self.type_list[0] == 2):
-                    cmd_rn_din = 'set_property name din_'+str(i)+' [get_bd_ports din_'+chr(ord('a')+i%2)+'_'+str(i//2)+']\n'
-                else:
-                    cmd_rn_din = 'set_property name din_'+str(i)+' [get_bd_ports din_'+chr(ord('a')+i%4)+'_'+str(i//4)+']\n'
-                
-                file.write(cmd_rn_din)
-            
-            file.write('\n')
 
-            # ofw signals
-            for i in range(self.n_port):
-                if (self.type_list[0] == 2):
-                    cmd_rn_ofw = 'set_property name ofw_'+str(i)+' [get_bd_ports ofw_input_'+chr(ord('a')+i%2)+'_'+str(i//2)+']\n'
-                else:
-                    cmd_rn_ofw = 'set_property name ofw_'+str(i)+' [get_bd_ports ofw_input_'+chr(ord('a')+i%4)+'_'+str(i//4)+']\n'
-                
-                file.write(cmd_rn_ofw)
-            
-            file.write('\n')
+    def gen_tcl_crt_ext_ports(self):
+        '''
+        Create External Ports
+        '''
+        list_ext_groups = self.get_ext_groups()
 
+        yield 'startgroup\n'
+        yield 'make_bd_pins_external  [get_bd_pins %s_0/clk]\n' % self.pfx_list[0]
+        yield 'make_bd_pins_external  [get_bd_pins %s_0/rst_n]\n' % self.pfx_list[0]
 
-            # ovld signals
-            for i in range(self.n_port):
-                if (self.type_list[self.n_stage-1] == 2):
-                    cmd_rn_ovld = 'set_property name ovld_'+str(i)+' [get_bd_ports ovld_'+chr(ord('a')+i%2)+'_'+str(i//2)+']\n'
-                else:
-                    cmd_rn_ovld = 'set_property name ovld_'+str(i)+' [get_bd_ports ovld_'+chr(ord('a')+i%4)+'_'+str(i//4)+']\n'
-                
-                file.write(cmd_rn_ovld)
-            
-            file.write('\n')
+        sep = ''
+        for pfx, ext_pins, ext_ports in list_ext_groups:
+            for pin, _ in ext_ports:
+                yield sep
+                fmt = 'make_bd_pins_external  [get_bd_pins %s_%%d/%s_%%s]\n' % (pfx, pin)
+                for ext_pin in ext_pins:
+                    yield fmt % ext_pin
+                sep = '\n'
 
-            # dout signals
-            for i in range(self.n_port):
-                if (self.type_list[self.n_stage-1] == 2):
-                    cmd_rn_dout = 'set_property name dout_'+str(i)+' [get_bd_ports dout_'+chr(ord('a')+i%2)+'_'+str(i//2)+']\n'
-                else:
-                    cmd_rn_dout = 'set_property name dout_'+str(i)+' [get_bd_ports dout_'+chr(ord('a')+i%4)+'_'+str(i//4)+']\n'
-                
-                file.write(cmd_rn_dout)
-            
-            file.write('\n')
+        yield 'endgroup\n\n\n'
 
-            # bp signals
-            for i in range(self.n_port):
-                if (self.type_list[self.n_stage-1] == 2):
-                    cmd_rn_bp = 'set_property name bp_'+str(i)+' [get_bd_ports ofw_output_'+chr(ord('a')+i%2)+'_'+str(i//2)+']\n'
-                else:
-                    cmd_rn_bp = 'set_property name bp_'+str(i)+' [get_bd_ports ofw_output_'+chr(ord('a')+i%4)+'_'+str(i//4)+']\n'
-                
-                file.write(cmd_rn_bp)
-            
-            file.write('endgroup\n\n\n')
 
+    def gen_tcl_rn_ext_ports(self):
+        '''
+        Rename External Ports
+            Note: the external port of pin <Pin> of <IP_Instance>_<SwId> is named <Pin>_<SwId> by default
+        '''
+        list_ext_groups = self.get_ext_groups()
 
-    def gen_tcl_connect_clk_rst(self):
+        yield 'startgroup\n'
+        yield 'set_property name clk [get_bd_ports clk_0]\n'
+        yield 'set_property name rst_n [get_bd_ports rst_n_0]\n'
 
-        with open(self.tcl_fn, 'a') as file:
+        sep = ''
+        for pfx, ext_pins, ext_ports in list_ext_groups:
+            for pin, name in ext_ports:
+                yield sep
+                fmt = 'set_property name %s_%%d [get_bd_ports %s_%%s_%%d]\n' % (name, pin)
+                for i, (swId, portSfx) in enumerate(ext_pins):
+                    yield fmt % (i, portSfx, swId)
+                sep = '\n'
 
-            for i in range(self.n_stage):
-                n_nodes = self.n_port // self.type_list[i]
-                for j in range(n_nodes):
-                    if not (i==0 and j==0):
-                        cmd_clk = 'connect_bd_net [get_bd_ports clk] [get_bd_pins '+ self.pfx_list[i] +'_'+str(j)+'/clk]\n'
-                        cmd_rst = 'connect_bd_net [get_bd_ports rst_n] [get_bd_pins '+ self.pfx_list[i] +'_'+str(j)+'/rst_n]\n'
+        yield 'endgroup\n\n\n'
+
+
+    def gen_tcl_connect_clk_rst(self, stageIdx=None):
+        '''
+        Connect clk & rst_n of every switch node (except the first one already made external) to the external ports
+            stageIdx: only the switch nodes of this stage, default all stages
+        '''
+        for i in (range(self.n_stage) if stageIdx is None else [stageIdx]):
+            n_nodes = self.n_port // self.type_list[i]
+            for j in range(1 if i == 0 else 0, n_nodes):
+                yield 'connect_bd_net [get_bd_ports clk] [get_bd_pins %s_%d/clk]\n' % (self.pfx_list[i], j)
+                yield 'connect_bd_net [get_bd_ports rst_n] [get_bd_pins %s_%d/rst_n]\n' % (self.pfx_list[i], j)
+
+            yield '\n'
+
+
+    def gen_stage_pin_pairs(self, stageIdx):
+        '''
+        Get (srcSwId, srcPortSuffix, dstSwId, dstPortSuffix) of every pin pair between stage stageIdx and stageIdx+1
+        '''
+        src_sfx = [get_port_suffix(k) for k in range(self.type_list[stageIdx])]
+        dst_sfx = [get_port_suffix(k) for k in range(self.type_list[stageIdx+1])]
 
-                        file.write(cmd_clk)
-                        file.write(cmd_rst)
-                
-                file.write('\n')
+        uni_pairs = self.list_uni_pairs[stageIdx]
+        srcSwId, srcPortId = (a.tolist() for a in np.divmod(uni_pairs[:, 0], self.type_list[stageIdx]))
+        dstSwId, dstPortId = (a.tolist() for a in np.divmod(uni_pairs[:, 1], self.type_list[stageIdx+1]))
+
+        return list(zip(srcSwId, [src_sfx[k] for k in srcPortId], dstSwId, [dst_sfx[k] for k in dstPortId]))
 
 
     def gen_tcl_connect_consec_stages(self, stageIdx):
         '''
         Connect pins between stage stageIdx and stageIdx+1
         '''
-        # list of [(srcSwId, srcPortId), (dstSwId, dstPortId)] lists
-        pin_pairs = self.dict_connect_pin_pairs[(stageIdx, stageIdx+1)]
+        pin_pairs = self.gen_stage_pin_pairs(stageIdx)
+
+        # ovld to ivld, dout to din, ofw_output to ofw_input
+        for signalIdx in range(len(LIST_LINK_SIGNALS)):
+            yield from self.gen_tcl_connect_stage_signal(stageIdx, signalIdx, pin_pairs)
 
-        # ovld to ivld
-        with open(self.tcl_fn, 'a') as file:
-            file.write('startgroup\n')
-            for pair in pin_pairs:
-                src_pin = pair[0] # srcSwId: src_pin[0]; srcPortId: src_pin[1]
-                dst_pin = pair[1] # dstSwId: dst_pin[0]; dstPortId: dst_pin[1]
 
-                cmd = 'connect_bd_net [get_bd_pins '+self.pfx_list[stageIdx]+'_'+str(src_pin[0])+'/ovld_'+chr(ord('a')+src_pin[1])+'] ' \
-				'[get_bd_pins '+self.pfx_list[stageIdx+1]+'_'+str(dst_pin[0])+'/ivld_'+chr(ord('a')+dst_pin[1])+']\n'
+    def gen_tcl_connect_stage_signal(self, stageIdx, signalIdx, pin_pairs=None):
+        '''
+        Connect the pins of signal LIST_LINK_SIGNALS[signalIdx] between stage stageIdx and stageIdx+1
+            The group of the stage is opened by the first signal and closed by the last one
+            pin_pairs: gen_stage_pin_pairs(stageIdx), computed if not given
+        '''
+        if pin_pairs is None:
+            pin_pairs = self.gen_stage_pin_pairs(stageIdx)
+        src_pin, dst_pin = LIST_LINK_SIGNALS[signalIdx]
+
+        if signalIdx == 0:
+            yield 'startgroup\n'
+
+        fmt = 'connect_bd_net [get_bd_pins %s_%%d/%s_%%s] [get_bd_pins %s_%%d/%s_%%s]\n' \
+            % (self.pfx_list[stageIdx], src_pin, self.pfx_list[stageIdx+1], dst_pin)
+        for pair in pin_pairs:
+            yield fmt % pair
+        yield '\n'
+
+        if signalIdx == len(LIST_LINK_SIGNALS)-1:
+            yield 'endgroup\n\n'
+
+
+    def get_link_intf(self):
+        '''
+        Get (output interface, input interface) names of the inter-stage links from intf_map
+            Note: all output pins of LIST_LINK_SIGNALS must map to one interface, and so must all input pins
+        '''
+        for pins in zip(*LIST_LINK_SIGNALS):
+            for pin in pins:
+                assert pin in self.intf_map, "Interface of pin %s not specified in intf_map" % pin
+            assert len(set(self.intf_map[pin] for pin in pins)) == 1, \
+                "Pins %s must be mapped to the same interface" % ', '.join(pins)
+
+        src_pin, dst_pin = LIST_LINK_SIGNALS[0]
+        return self.intf_map[src_pin], self.intf_map[dst_pin]
 
-                file.write(cmd)
 
-            file.write('\n')
+    def gen_tcl_connect_consec_stages_intf(self, stageIdx):
+        '''
+        Connect interfaces between stage stageIdx and stageIdx+1, one interface net per link in a single pass
+            Tcl cmd <connect two interfaces>: connect_bd_intf_net [get_bd_intf_pins <IP_Instance_a>/<Intf_a>] [get_bd_intf_pins <IP_Instance_b>/<Intf_b>]
+        '''
+        src_intf, dst_intf = self.get_link_intf()
+        fmt = 'connect_bd_intf_net [get_bd_intf_pins %s_%%d/%s_%%s] [get_bd_intf_pins %s_%%d/%s_%%s]\n' \
+            % (self.pfx_list[stageIdx], src_intf, self.pfx_list[stageIdx+1], dst_intf)
 
-        # dout to din
-        with open(self.tcl_fn, 'a') as file:
-            for pair in pin_pairs:
-                src_pin = pair[0] # srcSwId: src_pin[0]; srcPortId: src_pin[1]
-                dst_pin = pair[1] # dstSwId: dst_pin[0]; dstPortId: dst_pin[1]
+        yield 'startgroup\n'
+        for pair in self.gen_stage_pin_pairs(stageIdx):
+            yield fmt % pair
 
-                cmd = 'connect_bd_net [get_bd_pins '+self.pfx_list[stageIdx]+'_'+str(src_pin[0])+'/dout_'+chr(ord('a')+src_pin[1])+'] ' \
-				'[get_bd_pins '+self.pfx_list[stageIdx+1]+'_'+str(dst_pin[0])+'/din_'+chr(ord('a')+dst_pin[1])+']\n'
+        yield '\n'
+        yield 'endgroup\n\n'
 
-                file.write(cmd)
 
-            file.write('\n')
+    def gen_verilog_as_file(self, v_fn, module_name=None, data_width=32):
+        '''
+        Generate the structural verilog top module of the network as file, an alternative to the block design tcl
+            v_fn: file name (gzip compressed if it ends with '.gz'), '-' for stdout or an opened file-like object
+            Note: see gen_verilog for module_name & data_width
+        '''
+        lines = self.profile_lines('verilog', self.gen_verilog(module_name, data_width))
+        with open_output(v_fn) as file:
+            write_lines(file, lines)
 
-        # ofw_input to ofw_output
-        with open(self.tcl_fn, 'a') as file:
-            for pair in pin_pairs:
-                src_pin = pair[0] # srcSwId: src_pin[0]; srcPortId: src_pin[1]
-                dst_pin = pair[1] # dstSwId: dst_pin[0]; dstPortId: dst_pin[1]
 
-                cmd = 'connect_bd_net [get_bd_pins '+self.pfx_list[stageIdx]+'_'+str(src_pin[0])+'/ofw_output_'+chr(ord('a')+src_pin[1])+'] ' \
-				'[get_bd_pins '+self.pfx_list[stageIdx+1]+'_'+str(dst_pin[0])+'/ofw_input_'+chr(ord('a')+dst_pin[1])+']\n'
+    def gen_verilog(self, module_name=None, data_width=32):
+        '''
+        Generate the structural verilog top module lines, streamed stage by stage
+            module_name: name of the top module, default get_net_name()
+            data_width: default width of din & dout, parameter DATA_WIDTH of the top module
+            Note: switch node j of stage i is instance <pfx_list[i]>_<j> of module <pfx_list[i]>, the external ports
+                  are named as the ones created by gen_tcl_crt_rn_ext_ports
+        '''
+        assert self.pfx_list is not None, "Switch nodes prefix name list not specified"
+        if module_name is None:
+            module_name = self.get_net_name()
+
+        last = self.n_stage - 1
+        list_ext_ports = [name for _, name in LIST_EXT_IN_PORTS + LIST_EXT_OUT_PORTS]
+
+        yield '// %s: %d stages of %s switch nodes\n' % (module_name, self.n_stage, ', '.join('%dX%d' % (r, r) for r in self.type_list))
+        yield '\n'
+        yield 'module %s #(\n' % module_name
+        yield '    parameter DATA_WIDTH = %d\n' % data_width
+        yield ') (\n'
+        yield '    input  wire clk,\n'
+        yield '    input  wire rst_n'
+        for name in list_ext_ports:
+            width = '[DATA_WIDTH-1:0] ' if name in LIST_DATA_PINS else ''
+            fmt = ',\n    %-6s wire %s%s_%%d' % (DICT_EXT_PORT_DIR[name], width, name)
+            for i in range(self.n_port):
+                yield fmt % i
+        yield '\n);\n\n'
 
-                file.write(cmd)
+        # wires between stage i and i+1 are indexed by uniSrcId
+        for i in range(self.n_stage-1):
+            yield 'wire [%d:0] link%d_vld;\n' % (self.n_port-1, i)
+            yield 'wire [DATA_WIDTH-1:0] link%d_data [0:%d];\n' % (i, self.n_port-1)
+            yield 'wire [%d:0] link%d_ofw;\n' % (self.n_port-1, i)
+        yield '\n'
 
-            file.write('\n')
-            
-            file.write('endgroup\n\n')
+        for i in range(self.n_stage):
+            n_ports = self.type_list[i]
+            sfx = [get_port_suffix(k) for k in range(n_ports)]
+
+            # nets of input pins by uniDstId, nets of output pins by uniSrcId
+            if i == 0:
+                in_nets = ['ivld_%d', 'din_%d', 'ofw_%d']
+                in_ids = range(self.n_port)
+            else:
+                in_nets = ['link%d_vld[%%d]' % (i-1), 'link%d_data[%%d]' % (i-1), 'link%d_ofw[%%d]' % (i-1)]
+                in_ids = np.argsort(self.get_stage_perm(i-1)).tolist()
+            if i == last:
+                out_nets = ['ovld_%d', 'dout_%d', 'bp_%d']
+            else:
+                out_nets = ['link%d_vld[%%d]' % i, 'link%d_data[%%d]' % i, 'link%d_ofw[%%d]' % i]
+
+            yield '// stage %d: %dX%d switch nodes\n' % (i, n_ports, n_ports)
+            for j in range(self.n_port // n_ports):
+                yield '%s %s_%d (\n' % (self.pfx_list[i], self.pfx_list[i], j)
+                yield '    .clk(clk),\n'
+                yield '    .rst_n(rst_n)'
+                for k in range(n_ports):
+                    srcId = in_ids[j*n_ports + k]
+                    for (_, pin), net in zip(LIST_LINK_SIGNALS, in_nets):
+                        yield ',\n    .%s_%s(%s)' % (pin, sfx[k], net % srcId)
+                for k in range(n_ports):
+                    for (pin, _), net in zip(LIST_LINK_SIGNALS, out_nets):
+                        yield ',\n    .%s_%s(%s)' % (pin, sfx[k], net % (j*n_ports + k))
+                yield '\n);\n'
+            yield '\n'
 
+        yield 'endmodule\n'
@@ -0,0 +1,187 @@
+# Content-Addressed On-Disk Cache of Generated Topologies and Artifacts
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+
+import numpy as np
+
+
+# bump whenever the generated connectivity, tcl or image of an unchanged configuration may differ,
+# entries of older versions are never hit again and are evicted as least recently used
+GENERATOR_VERSION = 2
+
+# file name of the stacked (uniSrcId, uniDstId) pin pairs of an entry, see ButterflyNet.get_pin_pairs
+PIN_PAIRS_FN = 'uni_pairs.npy'
+META_FN = 'meta.json'
+
+
+class TopologyCache(object):
+    '''
+    Cache directory of generated networks, one sub-directory per configuration named by its hash
+        An entry holds the pin pairs of every stage as one .npy array (loaded memory-mapped) and any artifact
+        (tcl file of each mode, images ...) stored under it. Files are written to a temporary name then renamed,
+        so concurrent jobs sharing the directory never see partial files.
+        Entries are ranked by the modification time of their directory, refreshed on every hit, and the least
+        recently used ones are removed once the total size exceeds max_bytes (None for unbounded).
+    '''
+
+    def __init__(self, cache_dir, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.n_hit = 0
+        self.n_miss = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+
+    def get_key(self, **config):
+        '''
+        Get the key of a configuration, i.e. sha256 of its canonical json and GENERATOR_VERSION
+        '''
+        text = json.dumps(dict(config, generator_version=GENERATOR_VERSION), sort_keys=True)
+
+        return hashlib.sha256(text.encode()).hexdigest()
+
+
+    def get_entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+
+    def touch(self, key):
+        '''
+        Mark the entry of key as most recently used
+        '''
+        try:
+            os.utime(self.get_entry_dir(key))
+        except FileNotFoundError:
+            pass
+
+
+    def get_path(self, key, name):
+        '''
+        Get the path of artifact name of the entry of key, None on a miss
+        '''
+        path = os.path.join(self.get_entry_dir(key), name)
+        if not os.path.isfile(path):
+            self.n_miss += 1
+            return None
+
+        self.n_hit += 1
+        self.touch(key)
+        return path
+
+
+    def put_file(self, key, name, write, config=None):
+        '''
+        Store artifact name of the entry of key, return its path
+            write: function called with the temporary path to fill, e.g. lambda fn: plt.savefig(fn)
+            config: recorded in the meta file of a new entry for inspection
+        '''
+        entry_dir = self.get_entry_dir(key)
+        os.makedirs(entry_dir, exist_ok=True)
+
+        meta_fn = os.path.join(entry_dir, META_FN)
+        if config is not None and not os.path.isfile(meta_fn):
+            self.write_atomic(meta_fn, lambda fn: self.write_meta(fn, config))
+
+        path = os.path.join(entry_dir, name)
+        self.write_atomic(path, write)
+
+        self.touch(key)
+        self.evict(keep=key)
+        return path
+
+
+    def write_atomic(self, path, write):
+        '''
+        Call write with a temporary path next to path, then rename it to path
+        '''
+        ext = os.path.splitext(path)[1]
+        fd, tmp_fn = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp_', suffix=ext)
+        os.close(fd)
+        try:
+            write(tmp_fn)
+            # mkstemp creates the file private to the owner, entries are shared by other jobs
+            os.chmod(tmp_fn, 0o644)
+            os.replace(tmp_fn, path)
+        finally:
+            if os.path.exists(tmp_fn):
+                os.remove(tmp_fn)
+
+
+    def write_meta(self, fn, config):
+        with open(fn, 'w') as file:
+            json.dump(dict(config, generator_version=GENERATOR_VERSION), file, indent=2)
+            file.write('\n')
+
+
+    def load_pin_pairs(self, key):
+        '''
+        Load the pin pairs of the entry of key memory-mapped as list of read-only (n_port, 2) arrays, None on a miss
+        '''
+        path = self.get_path(key, PIN_PAIRS_FN)
+        if path is None:
+            return None
+
+        array = np.load(path, mmap_mode='r')
+        return [array[i] for i in range(len(array))]
+
+
+    def store_pin_pairs(self, key, list_uni_pairs, config=None):
+        '''
+        Store the pin pairs of every stage of the entry of key as one array of shape (n_stage-1, n_port, 2)
+        '''
+        array = np.stack(list_uni_pairs) if list_uni_pairs else np.zeros((0, 0, 2), dtype=np.int32)
+
+        return self.put_file(key, PIN_PAIRS_FN, lambda fn: np.save(fn, array), config=config)
+
+
+    def list_entries(self):
+        '''
+        Get (mtime, size in bytes, key) of every entry, least recently used first
+        '''
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry_dir = self.get_entry_dir(key)
+            try:
+                mtime = os.stat(entry_dir).st_mtime
+                size = sum(e.stat().st_size for e in os.scandir(entry_dir) if e.is_file())
+            except FileNotFoundError:
+                # removed by a concurrent job
+                continue
+            entries.append((mtime, size, key))
+
+        return sorted(entries)
+
+
+    def get_size(self):
+        return sum(size for _, size, _ in self.list_entries())
+
+
+    def evict(self, keep=None):
+        '''
+        Remove least recently used entries until the total size fits in max_bytes, the entry of keep is never removed
+        '''
+        if self.max_bytes is None:
+            return
+
+        entries = self.list_entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self.get_entry_dir(key), ignore_errors=True)
+            total -= size
+
+
+    def clear(self):
+        '''
+        Remove every entry
+        '''
+        for _, _, key in self.list_entries():
+            shutil.rmtree(self.get_entry_dir(key), ignore_errors=True)
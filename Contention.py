@@ -0,0 +1,103 @@
+# Permutation Contention Analyzer of the Butterfly Network
+
+import numpy as np
+
+
+# standard permutation patterns, see gen_pattern
+LIST_PATTERNS = ['identity', 'bitrev', 'bitcomp', 'transpose', 'shuffle', 'unshuffle', 'neighbor', 'random']
+
+
+def gen_pattern(name, n_port, n_perm=1, seed=None):
+    '''
+    Generate permutations of a standard pattern as int64 array of shape (n_perm, n_port), input port s sends to [., s]
+        identity: s; neighbor: s+1 mod n_port; random: uniformly random permutations
+        bitrev / bitcomp / transpose / shuffle / unshuffle: on the log2(n_port) bits of s, reversed / complemented /
+        rotated by half the width / rotated left by one / rotated right by one
+        Note: deterministic patterns are repeated n_perm times
+    '''
+    assert name in LIST_PATTERNS, "Invalid pattern, allowed values are %s" % ', '.join(LIST_PATTERNS)
+
+    if name == 'random':
+        rng = np.random.default_rng(seed)
+        return np.argsort(rng.random((n_perm, n_port)), axis=1)
+
+    n_bit = n_port.bit_length() - 1
+    assert n_port == 1 << n_bit, "Bit permutation patterns require n_port to be a power of two"
+
+    src = np.arange(n_port, dtype=np.int64)
+    mask = n_port - 1
+    def rotl(x, k):
+        k %= max(n_bit, 1)
+        return ((x << k) | (x >> (n_bit - k))) & mask if k else x
+
+    if name == 'identity':
+        dst = src
+    elif name == 'neighbor':
+        dst = (src + 1) % n_port
+    elif name == 'bitcomp':
+        dst = src ^ mask
+    elif name == 'bitrev':
+        dst = np.zeros_like(src)
+        for b in range(n_bit):
+            dst |= ((src >> b) & 1) << (n_bit - 1 - b)
+    elif name == 'transpose':
+        dst = rotl(src, n_bit // 2)
+    elif name == 'shuffle':
+        dst = rotl(src, 1)
+    else:
+        dst = rotl(src, n_bit - 1)
+
+    return np.tile(dst, (n_perm, 1))
+
+
+def analyze_contention(bfNet, perms, chunk=1024):
+    '''
+    Count the link conflicts of every permutation routed on the network
+        perms: integer array of shape (n_perm, n_port) or (n_port,), input port s sends to output port perms[., s]
+        Return dictionary of arrays of shape (n_perm, n_stage), the links of stage i are its output pins:
+            max_conflict: maximum number of paths sharing one link, 1 if the permutation is conflict-free
+            n_conflict: number of links shared by more than one path
+            n_excess: number of paths that have to wait for a shared link, i.e. sum of (paths - 1) over shared links
+        Note: paths are traced for chunk permutations at once, see Routing.RouteIndex.trace_paths
+    '''
+    perms = np.atleast_2d(np.asarray(perms))
+    n_perm, n_port = perms.shape
+    assert n_port == bfNet.n_port, "Length of permutations does not match n_port of the network"
+
+    route_index = bfNet.get_route_index()
+    result = {key: np.zeros((n_perm, bfNet.n_stage), dtype=np.int64) for key in ['max_conflict', 'n_conflict', 'n_excess']}
+
+    srcIds = np.arange(n_port)
+    for start in range(0, n_perm, chunk):
+        dstIds = perms[start:start+chunk]
+        n = len(dstIds)
+        paths = route_index.trace_paths(srcIds, dstIds)
+
+        # count the paths of every link, links of different permutations are kept apart by an offset
+        ofst = (np.arange(n, dtype=np.int64) * n_port)[:, None]
+        for i in range(bfNet.n_stage):
+            load = np.bincount((paths[..., i] + ofst).ravel(), minlength=n*n_port).reshape(n, n_port)
+
+            result['max_conflict'][start:start+n, i] = load.max(axis=1)
+            result['n_conflict'][start:start+n, i] = (load > 1).sum(axis=1)
+            result['n_excess'][start:start+n, i] = np.maximum(load - 1, 0).sum(axis=1)
+
+    return result
+
+
+def summarize_contention(result):
+    '''
+    Summarize analyze_contention result over the permutations as a dictionary
+        max_conflict: per stage maximum, mean_max_conflict: mean over permutations of the worst stage,
+        mean_n_conflict & mean_n_excess: per stage means, conflict_free: fraction of conflict-free permutations
+    '''
+    worst = result['max_conflict'].max(axis=1)
+
+    return {
+        'n_perm': len(worst),
+        'max_conflict': result['max_conflict'].max(axis=0).tolist(),
+        'mean_max_conflict': float(worst.mean()),
+        'mean_n_conflict': result['n_conflict'].mean(axis=0).tolist(),
+        'mean_n_excess': result['n_excess'].mean(axis=0).tolist(),
+        'conflict_free': float((worst <= 1).mean()),
+    }
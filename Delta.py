@@ -0,0 +1,242 @@
+# Incremental TCL Delta between a Saved Connectivity State and the Current ButterflyNet
+
+import json
+import hashlib
+
+import numpy as np
+
+from Butterfly import LIST_LINK_SIGNALS, LIST_EXT_IN_PORTS, LIST_EXT_OUT_PORTS, get_port_suffix, open_output, write_lines
+
+
+# bumped whenever the layout of the saved state changes
+STATE_VERSION = 1
+
+
+def get_stage_digest(pfx_pair, type_pair, link_intf, uni_pairs):
+    '''
+    Get the digest of the links between two consecutive stages, equal digests mean equal nets
+    '''
+    digest = hashlib.sha256(json.dumps([list(pfx_pair), list(type_pair), link_intf]).encode())
+    digest.update(np.ascontiguousarray(uni_pairs, dtype=np.int32).tobytes())
+
+    return digest.hexdigest()
+
+
+def get_state(bfNet, tcl_mode='flat'):
+    '''
+    Get the connectivity state of bfNet as dictionary {'meta', 'list_uni_pairs'}
+        meta: json-able dictionary of n_port, type_list, pfx_list, link_intf ([output, input] interface names
+              for tcl_mode intf, None for pin nets) & the digest of every stage, see get_stage_digest
+        list_uni_pairs: pin pairs of every stage, see ButterflyNet.get_pin_pairs
+    '''
+    assert bfNet.pfx_list is not None, "Switch nodes prefix name list not specified"
+    link_intf = list(bfNet.get_link_intf()) if tcl_mode == 'intf' else None
+
+    list_digests = []
+    for i in range(bfNet.n_stage-1):
+        list_digests.append(get_stage_digest(bfNet.pfx_list[i:i+2], bfNet.type_list[i:i+2], link_intf, bfNet.list_uni_pairs[i]))
+
+    meta = {
+        'version': STATE_VERSION,
+        'n_port': bfNet.n_port,
+        'type_list': list(bfNet.type_list),
+        'pfx_list': list(bfNet.pfx_list),
+        'link_intf': link_intf,
+        'list_digests': list_digests,
+    }
+    return {'meta': meta, 'list_uni_pairs': list(bfNet.list_uni_pairs)}
+
+
+def save_state(state, fn):
+    '''
+    Save the state of get_state as .npz file fn, the meta as json text & the pin pairs of stage i as pairs_<i>
+    '''
+    arrays = {'pairs_%d' % i: uni_pairs for i, uni_pairs in enumerate(state['list_uni_pairs'])}
+    # a file object keeps numpy from appending .npz to fn
+    with open(fn, 'wb') as file:
+        np.savez(file, meta=np.array(json.dumps(state['meta'])), **arrays)
+
+
+def load_state(fn):
+    with np.load(fn) as data:
+        meta = json.loads(str(data['meta']))
+        assert meta['version'] == STATE_VERSION, "Incompatible state file %s of version %s" % (fn, meta['version'])
+        list_uni_pairs = [data['pairs_%d' % i] for i in range(len(meta['list_digests']))]
+
+    return {'meta': meta, 'list_uni_pairs': list_uni_pairs}
+
+
+def get_ext_ports(meta):
+    '''
+    Get dictionary of external port name to the pin (<IP_Instance>/<Pin>) it is connected to, see ButterflyNet.gen_tcl_crt_rn_ext_ports
+    '''
+    n_port = meta['n_port']
+    last = len(meta['type_list']) - 1
+
+    ext_ports = {}
+    for stageIdx, list_ports in [(0, LIST_EXT_IN_PORTS), (last, LIST_EXT_OUT_PORTS)]:
+        pfx = meta['pfx_list'][stageIdx]
+        n_ports = meta['type_list'][stageIdx]
+        sfx = [get_port_suffix(k) for k in range(n_ports)]
+        for pin, name in list_ports:
+            for i in range(n_port):
+                ext_ports['%s_%d' % (name, i)] = '%s_%d/%s_%s' % (pfx, i // n_ports, pin, sfx[i % n_ports])
+
+    return ext_ports
+
+
+def get_cells(groups):
+    '''
+    Get the switch node instances of the (pfx, n_nodes) groups in stage order
+    '''
+    return ['%s_%d' % (pfx, j) for pfx, n_nodes in groups for j in range(n_nodes)]
+
+
+def get_cell_groups(meta):
+    return [(pfx, meta['n_port'] // n_ports) for pfx, n_ports in zip(meta['pfx_list'], meta['type_list'])]
+
+
+def get_stage_links(meta, list_uni_pairs, stageIdx):
+    '''
+    Get the links of stage stageIdx as (srcSwId pin prefix, srcPortSuffix, dstSwId pin prefix, dstPortSuffix, link_intf)
+    '''
+    n_src, n_dst = meta['type_list'][stageIdx:stageIdx+2]
+    pfx_src, pfx_dst = meta['pfx_list'][stageIdx:stageIdx+2]
+    src_sfx = [get_port_suffix(k) for k in range(n_src)]
+    dst_sfx = [get_port_suffix(k) for k in range(n_dst)]
+    link_intf = tuple(meta['link_intf']) if meta['link_intf'] is not None else None
+
+    uni_pairs = list_uni_pairs[stageIdx]
+    srcSwId, srcPortId = (a.tolist() for a in np.divmod(uni_pairs[:, 0], n_src))
+    dstSwId, dstPortId = (a.tolist() for a in np.divmod(uni_pairs[:, 1], n_dst))
+
+    return [('%s_%d' % (pfx_src, s), src_sfx[p], '%s_%d' % (pfx_dst, d), dst_sfx[q], link_intf)
+            for s, p, d, q in zip(srcSwId, srcPortId, dstSwId, dstPortId)]
+
+
+def get_ext_key(meta):
+    '''
+    Get what the external ports depend on: n_port and the prefix names & types of the first and the last stage
+    '''
+    return meta['n_port'], meta['pfx_list'][0], meta['type_list'][0], meta['pfx_list'][-1], meta['type_list'][-1]
+
+
+def get_removed_added(old_items, new_items):
+    old_set, new_set = set(old_items), set(new_items)
+    return [item for item in old_items if item not in new_set], [item for item in new_items if item not in old_set]
+
+
+def get_delta(old_state, new_state):
+    '''
+    Get the differences between the states as dictionary of (removed, added) lists
+        links: links of the stages, see get_stage_links, only stages whose digest is not found in the other state
+               are expanded into links, the rest is skipped
+        cells: switch nodes whose clk & rst_n are connected, only groups of (prefix, number of nodes) not found
+               in the other state are expanded
+        ports: external (port name, pin) pairs, only expanded if get_ext_key differs
+    '''
+    old_meta, new_meta = old_state['meta'], new_state['meta']
+    old_digests, new_digests = set(old_meta['list_digests']), set(new_meta['list_digests'])
+
+    old_links = []
+    for i, digest in enumerate(old_meta['list_digests']):
+        if digest not in new_digests:
+            old_links.extend(get_stage_links(old_meta, old_state['list_uni_pairs'], i))
+    new_links = []
+    for i, digest in enumerate(new_meta['list_digests']):
+        if digest not in old_digests:
+            new_links.extend(get_stage_links(new_meta, new_state['list_uni_pairs'], i))
+
+    old_groups, new_groups = get_cell_groups(old_meta), get_cell_groups(new_meta)
+    old_cells = get_cells([group for group in old_groups if group not in new_groups])
+    new_cells = get_cells([group for group in new_groups if group not in old_groups])
+
+    old_ports, new_ports = [], []
+    if get_ext_key(old_meta) != get_ext_key(new_meta):
+        old_ports, new_ports = list(get_ext_ports(old_meta).items()), list(get_ext_ports(new_meta).items())
+
+    # a changed stage or group may still share items with the other state, e.g. if only one prefix name changed
+    return {
+        'links': get_removed_added(old_links, new_links),
+        'cells': get_removed_added(old_cells, new_cells),
+        'ports': get_removed_added(old_ports, new_ports),
+    }
+
+
+def gen_delta_tcl(delta):
+    '''
+    Generate the tcl command lines of the delta of get_delta, turning the block design of the old state into the new one
+        Removed nets come first: link nets & external ports are deleted by delete_bd_objs, clk & rst_n are
+        disconnected from removed switch nodes & external ports from the pins they no longer drive.
+        Then added nets are connected with the same commands as ButterflyNet.gen_connect_tcl_flat.
+        Note: the clk & rst_n ports are kept, the switch node instances themselves are neither created nor deleted
+    '''
+    removed_links, added_links = delta['links']
+    removed_cells, added_cells = delta['cells']
+    removed_ports, added_ports = delta['ports']
+    # a port moved to another pin is disconnected & connected instead of deleted & created
+    moved = {name for name, _ in removed_ports} & {name for name, _ in added_ports}
+
+    yield 'startgroup\n'
+    for src_cell, src_sfx, dst_cell, dst_sfx, link_intf in removed_links:
+        if link_intf is not None:
+            yield 'delete_bd_objs [get_bd_intf_nets -of_objects [get_bd_intf_pins %s/%s_%s]]\n' % (src_cell, link_intf[0], src_sfx)
+        else:
+            for src_pin, _ in LIST_LINK_SIGNALS:
+                yield 'delete_bd_objs [get_bd_nets -of_objects [get_bd_pins %s/%s_%s]]\n' % (src_cell, src_pin, src_sfx)
+
+    for cell in removed_cells:
+        for port in ['clk', 'rst_n']:
+            yield 'disconnect_bd_net [get_bd_nets -of_objects [get_bd_ports %s]] [get_bd_pins %s/%s]\n' % (port, cell, port)
+
+    for name, pin in removed_ports:
+        if name in moved:
+            yield 'disconnect_bd_net [get_bd_nets -of_objects [get_bd_ports %s]] [get_bd_pins %s]\n' % (name, pin)
+        else:
+            yield 'delete_bd_objs [get_bd_nets -of_objects [get_bd_ports %s]] [get_bd_ports %s]\n' % (name, name)
+    yield 'endgroup\n\n'
+
+    yield 'startgroup\n'
+    for name, pin in added_ports:
+        if name in moved:
+            yield 'connect_bd_net [get_bd_ports %s] [get_bd_pins %s]\n' % (name, pin)
+        else:
+            yield 'make_bd_pins_external -name %s [get_bd_pins %s]\n' % (name, pin)
+
+    for cell in added_cells:
+        for port in ['clk', 'rst_n']:
+            yield 'connect_bd_net [get_bd_ports %s] [get_bd_pins %s/%s]\n' % (port, cell, port)
+
+    for src_cell, src_sfx, dst_cell, dst_sfx, link_intf in added_links:
+        if link_intf is not None:
+            yield 'connect_bd_intf_net [get_bd_intf_pins %s/%s_%s] [get_bd_intf_pins %s/%s_%s]\n' \
+                % (src_cell, link_intf[0], src_sfx, dst_cell, link_intf[1], dst_sfx)
+        else:
+            for src_pin, dst_pin in LIST_LINK_SIGNALS:
+                yield 'connect_bd_net [get_bd_pins %s/%s_%s] [get_bd_pins %s/%s_%s]\n' % (src_cell, src_pin, src_sfx, dst_cell, dst_pin, dst_sfx)
+    yield 'endgroup\n'
+
+
+def gen_delta_tcl_as_file(bfNet, state_fn, tcl_fn, tcl_mode='flat'):
+    '''
+    Generate the tcl delta of bfNet against the state saved in state_fn as file, then save the state of bfNet to state_fn
+        Return the delta of get_delta, None if there was no saved state
+        Note: without a state_fn file the whole network is emitted as by ButterflyNet.gen_connect_tcl_as_file
+    '''
+    assert tcl_mode in ['flat', 'intf'], "The tcl delta is only available for tcl_mode flat & intf"
+    new_state = get_state(bfNet, tcl_mode)
+
+    try:
+        old_state = load_state(state_fn)
+    except FileNotFoundError:
+        bfNet.gen_connect_tcl_as_file(tcl_fn, tcl_mode=tcl_mode)
+        save_state(new_state, state_fn)
+        return None
+
+    with bfNet.profile_phase('tcl_delta_diff'):
+        delta = get_delta(old_state, new_state)
+    with open_output(tcl_fn) as file:
+        write_lines(file, bfNet.profile_lines('tcl_delta', gen_delta_tcl(delta)))
+    save_state(new_state, state_fn)
+
+    return delta
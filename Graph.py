@@ -0,0 +1,177 @@
+# Sparse Graph Export / Import of the Butterfly Network as Memory-Mappable Flat Arrays
+
+import os
+import json
+
+import numpy as np
+
+from Butterfly import ButterflyNet
+from Cache import GENERATOR_VERSION, PIN_PAIRS_FN
+
+
+# bumped whenever the arrays or the header change
+GRAPH_VERSION = 1
+
+HEADER_FN = 'graph.json'
+
+# scalar layout attributes of ButterflyNet, restored by load_net instead of recomputed
+LIST_LAYOUT_ATTRS = ['scale_factor', 'zoom_factor', 'H_margin', 'V_margin', 'TNode_height', 'TNode_vspace',
+                     'FNode_height', 'FNode_vspace', 'Node_width', 'Node_hspace', 'pin_dx']
+
+# description of every array of the graph, written into the header
+DICT_GRAPH_ARRAYS = {
+    'node_ofst': 'int64 (n_stage+1,): node Id of switch node j of stage i is node_ofst[i] + j',
+    'node_stage': 'int32 (n_node,): stage of every node',
+    'node_sw': 'int32 (n_node,): switch node Id within its stage',
+    'node_radix': 'int32 (n_node,): number of i/o ports, prefix name is pfx_list[node_stage] of the header',
+    'node_x': 'float64 (n_node,): x of the central point in the layout',
+    'node_y': 'float64 (n_node,): y of the central point in the layout',
+    'node_slot': 'int32 (n_node,): slot of the node in its stage, only with a placement',
+    'pin_ofst': 'float64 (sum(type_list),): y-offsets of the pins of stage i at pin_ofst[sum(type_list[:i]):][:type_list[i]]',
+    'edge_stage': 'int32 (n_edge,): stage of the src pin, the dst pin is on the next stage',
+    'edge_src_sw': 'int32 (n_edge,): switch node Id of the src pin',
+    'edge_src_port': 'int32 (n_edge,): output port of the src pin',
+    'edge_dst_sw': 'int32 (n_edge,): switch node Id of the dst pin',
+    'edge_dst_port': 'int32 (n_edge,): input port of the dst pin',
+    'csr_indptr': 'int64 (n_node+1,): out-edges of node v are the entries csr_indptr[v]:csr_indptr[v+1]',
+    'csr_indices': 'int32 (n_edge,): dst node Id of every entry',
+    'csr_edge': 'int64 (n_edge,): edge Id of every entry',
+    'uni_pairs': 'int32 (n_stage-1, n_port, 2): (uniSrcId, uniDstId) of the edges of every stage, edge Id i*n_port+k is row k of stage i',
+}
+
+
+def get_graph_arrays(bfNet):
+    '''
+    Get the flat arrays of the graph of bfNet as dictionary of name to array, see DICT_GRAPH_ARRAYS
+        Nodes are the switch nodes in stage ascending order, edges the links in the order of list_uni_pairs
+    '''
+    n_stage, n_port = bfNet.n_stage, bfNet.n_port
+    list_n_nodes = [n_port // n_ports for n_ports in bfNet.type_list]
+
+    arrays = {}
+    arrays['node_ofst'] = np.concatenate(([0], np.cumsum(list_n_nodes))).astype(np.int64)
+    arrays['node_stage'] = np.repeat(np.arange(n_stage, dtype=np.int32), list_n_nodes)
+    arrays['node_sw'] = np.concatenate([np.arange(n_nodes, dtype=np.int32) for n_nodes in list_n_nodes])
+    arrays['node_radix'] = np.repeat(np.array(bfNet.type_list, dtype=np.int32), list_n_nodes)
+    arrays['node_x'] = np.repeat(np.array(bfNet.list_node_x, dtype=np.float64), list_n_nodes)
+    arrays['node_y'] = np.concatenate(bfNet.list_node_y).astype(np.float64)
+    if bfNet.placement is not None:
+        arrays['node_slot'] = np.concatenate(bfNet.placement).astype(np.int32)
+    arrays['pin_ofst'] = np.concatenate(bfNet.list_pin_ofst).astype(np.float64)
+
+    uni_pairs = np.stack(bfNet.list_uni_pairs).astype(np.int32) if n_stage > 1 else np.zeros((0, n_port, 2), dtype=np.int32)
+    radix = np.array(bfNet.type_list, dtype=np.int32)
+    arrays['edge_stage'] = np.repeat(np.arange(n_stage-1, dtype=np.int32), n_port)
+    arrays['edge_src_sw'], arrays['edge_src_port'] = np.divmod(uni_pairs[:, :, 0], radix[:-1, None])
+    arrays['edge_dst_sw'], arrays['edge_dst_port'] = np.divmod(uni_pairs[:, :, 1], radix[1:, None])
+    for name in ['edge_src_sw', 'edge_src_port', 'edge_dst_sw', 'edge_dst_port']:
+        arrays[name] = arrays[name].ravel().astype(np.int32)
+
+    # every node but the last stage has radix out-edges, entries of a node in output port order
+    src_node = arrays['node_ofst'][arrays['edge_stage']] + arrays['edge_src_sw']
+    dst_node = arrays['node_ofst'][arrays['edge_stage'] + 1] + arrays['edge_dst_sw']
+    order = np.lexsort((arrays['edge_src_port'], src_node))
+    arrays['csr_indptr'] = np.concatenate(([0], np.cumsum(np.bincount(src_node, minlength=len(arrays['node_stage']))))).astype(np.int64)
+    arrays['csr_indices'] = dst_node[order].astype(np.int32)
+    arrays['csr_edge'] = order.astype(np.int64)
+
+    arrays['uni_pairs'] = uni_pairs
+
+    return arrays
+
+
+def get_header(bfNet, arrays):
+    '''
+    Get the json header of the graph: network configuration, layout scalars & dtype / shape of every array
+    '''
+    config = {
+        'n_stage': bfNet.n_stage,
+        'n_port': bfNet.n_port,
+        'type_list': list(bfNet.type_list),
+        'bfly_type_list': list(bfNet.bfly_type_list),
+        'topology': bfNet.topology,
+        'pfx_list': list(bfNet.pfx_list) if bfNet.pfx_list is not None else None,
+        'monitor_def': list(bfNet.monitor_def),
+        'intf_map': bfNet.intf_map,
+    }
+
+    layout = {name: float(getattr(bfNet, name)) for name in LIST_LAYOUT_ATTRS}
+    layout['list_node_x'] = [float(x) for x in bfNet.list_node_x]
+
+    return {
+        'version': GRAPH_VERSION,
+        'generator_version': GENERATOR_VERSION,
+        'config': config,
+        'layout': layout,
+        'n_node': len(arrays['node_stage']),
+        'n_edge': len(arrays['edge_stage']),
+        'arrays': {name: {'fn': get_array_fn(name), 'dtype': array.dtype.str, 'shape': list(array.shape), 'desc': DICT_GRAPH_ARRAYS[name]}
+                   for name, array in arrays.items()},
+    }
+
+
+def get_array_fn(name):
+    # the pin pairs have the same file as in the cache, see Cache.TopologyCache.store_pin_pairs
+    return PIN_PAIRS_FN if name == 'uni_pairs' else name + '.npy'
+
+
+def export_graph(bfNet, graph_dir):
+    '''
+    Export the graph of bfNet into directory graph_dir, one .npy file per array & the json header graph.json
+        Note: the header is written last, a directory without it is incomplete
+    '''
+    os.makedirs(graph_dir, exist_ok=True)
+    header_fn = os.path.join(graph_dir, HEADER_FN)
+    if os.path.exists(header_fn):
+        os.remove(header_fn)
+
+    with bfNet.profile_phase('export_graph', nodes=sum(bfNet.n_port // n for n in bfNet.type_list), nets=bfNet.n_port*(bfNet.n_stage-1)):
+        arrays = get_graph_arrays(bfNet)
+        for name, array in arrays.items():
+            np.save(os.path.join(graph_dir, get_array_fn(name)), array)
+
+        with open(header_fn, 'w') as file:
+            json.dump(get_header(bfNet, arrays), file, indent=2)
+            file.write('\n')
+
+
+def load_graph(graph_dir, mmap_mode='r'):
+    '''
+    Load the header & the arrays of the graph in graph_dir, return (header, dictionary of name to array)
+        Arrays are memory-mapped (read-only by default), None for mmap_mode loads them into memory
+    '''
+    with open(os.path.join(graph_dir, HEADER_FN)) as file:
+        header = json.load(file)
+    assert header['version'] == GRAPH_VERSION, "Incompatible graph %s of version %s" % (graph_dir, header['version'])
+
+    arrays = {name: np.load(os.path.join(graph_dir, entry['fn']), mmap_mode=mmap_mode) for name, entry in header['arrays'].items()}
+
+    return header, arrays
+
+
+def load_net(graph_dir, tcl_fn=None, headless=True, cache=None, profiler=None):
+    '''
+    Rebuild a ButterflyNet from the graph in graph_dir without recomputing the layout or the pin pairs
+        The per-stage arrays (list_node_y, list_pin_ofst & list_uni_pairs) are views of the memory-mapped arrays,
+        so nothing is copied until used
+    '''
+    header, arrays = load_graph(graph_dir)
+    config = header['config']
+
+    n_stage = config['n_stage']
+    node_ofst = arrays['node_ofst'].tolist()
+    pin_ofst = np.concatenate(([0], np.cumsum(config['type_list']))).tolist()
+    placement = None
+    if 'node_slot' in arrays:
+        placement = [arrays['node_slot'][node_ofst[i]:node_ofst[i+1]] for i in range(n_stage)]
+
+    layout = {name: header['layout'][name] for name in LIST_LAYOUT_ATTRS}
+    layout['list_node_x'] = header['layout']['list_node_x']
+    layout['list_node_y'] = [arrays['node_y'][node_ofst[i]:node_ofst[i+1]] for i in range(n_stage)]
+    layout['list_pin_ofst'] = [arrays['pin_ofst'][pin_ofst[i]:pin_ofst[i+1]] for i in range(n_stage)]
+
+    # n_stage & type_list of the constructor are those of the butterfly stages, see ButterflyNet
+    return ButterflyNet(len(config['bfly_type_list']), config['n_port'], config['bfly_type_list'], config['monitor_def'],
+                        pfx_list=config['pfx_list'], tcl_fn=tcl_fn, headless=headless, intf_map=config['intf_map'],
+                        cache=cache, profiler=profiler, topology=config['topology'], placement=placement,
+                        layout=layout, list_uni_pairs=[arrays['uni_pairs'][i] for i in range(n_stage-1)])
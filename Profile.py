@@ -0,0 +1,166 @@
+# Per-Phase Profiling of the Butterfly Network Generation
+
+import sys
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class Profiler(object):
+    '''
+    Record wall time, peak traced memory and item counts of every phase of a ButterflyNet
+        A phase record is a dictionary {'name', 'parent' (name of the enclosing phase, None for an outermost phase),
+        'wall_time' & 'self_time' (s, the latter without the time of the nested phases), 'peak_mem' & 'mem_delta'
+        (bytes above & change of the traced memory at the start of the phase, None without trace_memory), 'counts'
+        (e.g. nodes, pins, nets, lines)}, appended to list_phases when the phase ends and passed to hook if given,
+        e.g. to stream progress.
+        Note: phases may be nested, e.g. the render phases within save_image. The peak of an enclosing phase is kept
+              over the peaks of its nested phases. Memory is traced by tracemalloc which slows allocations down
+              while enabled
+    '''
+
+    def __init__(self, trace_memory=True, hook=None):
+        self.trace_memory = trace_memory
+        self.hook = hook
+        self.list_phases = []
+        # records of the phases being run, outermost first
+        self.stack = []
+
+        # only stop tracing on close if it was started here
+        self.own_tracing = trace_memory and not tracemalloc.is_tracing()
+        if self.own_tracing:
+            tracemalloc.start()
+
+
+    def close(self):
+        if self.own_tracing:
+            tracemalloc.stop()
+            self.own_tracing = False
+
+
+    def start_record(self, name, counts):
+        record = {'name': name, 'parent': self.stack[-1]['name'] if self.stack else None, 'wall_time': 0.0, 'self_time': 0.0,
+                  'peak_mem': None, 'mem_delta': None, 'counts': dict(counts), 'child_time': 0.0}
+        if self.trace_memory:
+            record['mem_start'] = record['peak_abs'] = tracemalloc.get_traced_memory()[0]
+
+        return record
+
+
+    def update_peaks(self):
+        '''
+        Keep the traced peak since the last reset in the records of the phases being run
+        '''
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            for record in self.stack:
+                record['peak_abs'] = max(record['peak_abs'], peak)
+
+
+    def enter(self, record):
+        '''
+        Run record on top of the phases being run, the traced peak restarts from the current memory
+        '''
+        self.update_peaks()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        self.stack.append(record)
+        record['t_enter'] = time.perf_counter()
+
+
+    def leave(self, record):
+        '''
+        Stop running record, the top of the phases being run, its time is added to its wall_time & to the child time of its parent
+        '''
+        elapsed = time.perf_counter() - record.pop('t_enter')
+        self.update_peaks()
+        self.stack.pop()
+        record['wall_time'] += elapsed
+        if self.stack:
+            self.stack[-1]['child_time'] += elapsed
+
+
+    def end_record(self, record):
+        record['self_time'] = record['wall_time'] - record.pop('child_time')
+        if self.trace_memory:
+            mem_start = record.pop('mem_start')
+            record['peak_mem'] = record.pop('peak_abs') - mem_start
+            record['mem_delta'] = tracemalloc.get_traced_memory()[0] - mem_start
+
+        self.list_phases.append(record)
+        if self.hook is not None:
+            self.hook(record)
+
+
+    @contextmanager
+    def phase(self, name, **counts):
+        '''
+        Context of phase name, counts are recorded as given
+        '''
+        record = self.start_record(name, counts)
+        self.enter(record)
+        try:
+            yield record
+        finally:
+            self.leave(record)
+            self.end_record(record)
+
+
+    def gen_lines(self, name, lines, **counts):
+        '''
+        Generate lines as phase name, only the time spent producing the lines is recorded and they are counted
+            Note: the time of the consumer, e.g. writing the lines, is left out, the phase is only run while a line is produced
+        '''
+        record = self.start_record(name, counts)
+        n_line = 0
+
+        lines = iter(lines)
+        while True:
+            self.enter(record)
+            try:
+                line = next(lines)
+            except StopIteration:
+                break
+            finally:
+                self.leave(record)
+            n_line += 1
+            yield line
+
+        record['counts']['lines'] = n_line
+        self.end_record(record)
+
+
+    def get_report(self):
+        '''
+        Get the recorded phases as a dictionary, phases of the same name are also summed up in totals
+            Note: the overall wall_time sums the outermost phases only, so nested phases are not counted twice,
+                  the overall peak_mem is the largest peak of the phases
+        '''
+        totals = {}
+        for record in self.list_phases:
+            total = totals.setdefault(record['name'], {'n_call': 0, 'wall_time': 0.0, 'self_time': 0.0, 'peak_mem': None})
+            total['n_call'] += 1
+            total['wall_time'] += record['wall_time']
+            total['self_time'] += record['self_time']
+            if record['peak_mem'] is not None:
+                total['peak_mem'] = max(total['peak_mem'] or 0, record['peak_mem'])
+
+        return {
+            'wall_time': sum(record['wall_time'] for record in self.list_phases if record['parent'] is None),
+            'peak_mem': max((record['peak_mem'] for record in self.list_phases if record['peak_mem'] is not None), default=None),
+            'phases': self.list_phases,
+            'totals': totals,
+        }
+
+
+    def dump_json(self, fn):
+        '''
+        Write the report of get_report as json, fn is a file name or '-' for stderr (stdout may carry the tcl output)
+        '''
+        text = json.dumps(self.get_report(), indent=2)
+        if fn == '-':
+            print(text, file=sys.stderr)
+        else:
+            with open(fn, 'w') as file:
+                file.write(text + '\n')
@@ -0,0 +1,134 @@
+# Destination-Tag Routing Index of the Butterfly Network
+
+import numpy as np
+
+from Butterfly import open_output, write_lines
+
+
+class RouteIndex(object):
+    '''
+    Precomputed paths of a ButterflyNet, one path per (input port, output port) pair
+        A path is recorded as the uniId of the output pin used at every stage, i.e. switch node uniId // type_list[i]
+        and output port uniId % type_list[i] of stage i. Rows of one input port are computed on first use and kept
+        (lazy=True), or the whole [n_port, n_port, n_stage] array is computed at once (lazy=False).
+        Note: use ButterflyNet.get_route_index to share the index cached on the network
+    '''
+
+    def __init__(self, bfNet, lazy=True):
+        self.bfNet = bfNet
+        self.n_stage = bfNet.n_stage
+        self.n_port = bfNet.n_port
+        self.type_list = bfNet.type_list
+        # uniIds are smaller than n_port
+        self.dtype = np.uint16 if self.n_port <= 1 << 16 else np.int32
+
+        self.list_perm = [bfNet.get_stage_perm(i) for i in range(self.n_stage-1)]
+
+        self.paths = None
+        self.dict_rows = {}
+        if not lazy:
+            self.build_all()
+
+
+    def trace_paths(self, srcId, dstId):
+        '''
+        Trace the paths from input ports srcId to output ports dstId stage by stage
+            srcId & dstId: integers or integer arrays of broadcastable shapes
+            Return array of shape broadcast(srcId, dstId).shape + (n_stage,), uniId of the output pin used at every stage
+        '''
+        srcId, dstId = np.broadcast_arrays(np.asarray(srcId, dtype=np.int64), np.asarray(dstId, dtype=np.int64))
+        paths = np.empty(srcId.shape + (self.n_stage,), dtype=self.dtype)
+
+        uniId = srcId
+        for i in range(self.n_stage):
+            n_ports = self.type_list[i]
+            swId = uniId // n_ports
+            uniId = swId * n_ports + self.bfNet.get_route_ports(i, swId, dstId)
+            paths[..., i] = uniId
+            if i < self.n_stage-1:
+                uniId = self.list_perm[i][uniId]
+
+        return paths
+
+
+    def build_all(self, out=None, chunk=256):
+        '''
+        Compute the paths of all (input port, output port) pairs as array of shape [n_port, n_port, n_stage]
+            out: array (e.g. a np.memmap) to fill, a new array is allocated if not given
+            Note: input ports are traced chunk by chunk to bound the temporary memory
+        '''
+        if out is None:
+            out = np.empty((self.n_port, self.n_port, self.n_stage), dtype=self.dtype)
+
+        dstIds = np.arange(self.n_port)
+        for src in range(0, self.n_port, chunk):
+            srcIds = np.arange(src, min(src+chunk, self.n_port))[:, None]
+            out[src:src+chunk] = self.trace_paths(srcIds, dstIds)
+
+        self.paths = out
+        self.dict_rows = {}
+        return out
+
+
+    def get_row(self, srcId):
+        '''
+        Get the paths from input port srcId to every output port as array of shape [n_port, n_stage]
+        '''
+        if self.paths is not None:
+            return self.paths[srcId]
+
+        row = self.dict_rows.get(srcId)
+        if row is None:
+            row = self.trace_paths(srcId, np.arange(self.n_port))
+            self.dict_rows[srcId] = row
+
+        return row
+
+
+    def get_path(self, srcId, dstId):
+        '''
+        Get the path from input port srcId to output port dstId as a list of (swId, portId), one per stage
+        '''
+        uniIds = self.get_row(srcId)[dstId].tolist()
+
+        return [divmod(uniId, n_ports) for uniId, n_ports in zip(uniIds, self.type_list)]
+
+
+    def clear(self):
+        '''
+        Drop all computed paths
+        '''
+        self.paths = None
+        self.dict_rows = {}
+
+
+    def export(self, fn):
+        '''
+        Export the paths of all (input port, output port) pairs as file
+            .npy: uint16/int32 array of shape [n_port, n_port, n_stage] of output pin uniIds, filled chunk by chunk
+            other: csv text with one src,dst,stage,swId,portId row per hop, '-' for stdout, gzip if ending with '.gz'
+        '''
+        if isinstance(fn, str) and fn.endswith('.npy'):
+            out = np.lib.format.open_memmap(fn, mode='w+', dtype=self.dtype, shape=(self.n_port, self.n_port, self.n_stage))
+            self.build_all(out=out)
+            out.flush()
+            # keep the index usable without holding the file open
+            self.paths = np.load(fn, mmap_mode='r')
+            return
+
+        with open_output(fn) as file:
+            write_lines(file, self.gen_csv_lines())
+
+
+    def gen_csv_lines(self):
+        '''
+        Generate the csv lines of export, streamed input port by input port
+        '''
+        yield 'src,dst,stage,swId,portId\n'
+
+        stageIds = list(range(self.n_stage))
+        for srcId in range(self.n_port):
+            row = self.get_row(srcId) if self.paths is not None else self.trace_paths(srcId, np.arange(self.n_port))
+            for dstId, uniIds in enumerate(row.tolist()):
+                for stageIdx, uniId, n_ports in zip(stageIds, uniIds, self.type_list):
+                    yield '%d,%d,%d,%d,%d\n' % (srcId, dstId, stageIdx, uniId // n_ports, uniId % n_ports)
@@ -0,0 +1,276 @@
+# Long-Running Generator Service with a Warm In-Memory Network Cache, JSON-RPC over a Unix Socket
+
+import io
+import os
+import sys
+import json
+import time
+import socket
+import hashlib
+import argparse
+import tempfile
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+
+
+# default socket path of the service, one per user unless set by BUTTERFLY_SOCKET
+SOCKET_FN = os.environ.get('BUTTERFLY_SOCKET', os.path.join(tempfile.gettempdir(), 'butterfly-%d.sock' % os.getuid()))
+
+# methods of the service, see GenService.dispatch
+LIST_METHODS = ['gen', 'stats', 'shutdown']
+
+# path arguments of gen resolved against the working directory of the client
+LIST_PATH_ARGS = ['tcl_fn', 'v_fn', 'route_fn', 'tile_dir', 'graph_dir', 'tcl_state', 'tcl_parts', 'placement_fn', 'cache_dir']
+
+# output arguments of gen written to the stdout of the client for '-'
+LIST_STDOUT_ARGS = ['tcl_fn', 'v_fn', 'route_fn']
+
+# matplotlib is not thread-safe, png images are rendered one at a time
+PNG_LOCK = threading.Lock()
+
+
+class RequestArgumentParser(argparse.ArgumentParser):
+    '''
+    Argument parser raising ValueError with the usage instead of exiting the service
+    '''
+
+    def error(self, message):
+        raise ValueError('%s\n%s: error: %s' % (self.format_usage().rstrip(), self.prog, message))
+
+    def exit(self, status=0, message=None):
+        raise ValueError(message or self.format_help())
+
+
+class NetworkLRU(object):
+    '''
+    Least recently used cache of at most max_nets ButterflyNet, keyed by configuration
+        Concurrent requests of a network under construction wait for it instead of building it again
+    '''
+
+    def __init__(self, max_nets=16):
+        self.max_nets = max_nets
+        self.dict_nets = OrderedDict()
+        self.lock = threading.Lock()
+        self.n_hit = 0
+        self.n_miss = 0
+
+
+    def get(self, key, build):
+        '''
+        Get the network of key, build() it on a miss, return (network, True on a hit)
+        '''
+        with self.lock:
+            future = self.dict_nets.get(key)
+            hit = future is not None
+            if hit:
+                self.dict_nets.move_to_end(key)
+                self.n_hit += 1
+            else:
+                future = Future()
+                self.dict_nets[key] = future
+                self.n_miss += 1
+                while len(self.dict_nets) > self.max_nets:
+                    self.dict_nets.popitem(last=False)
+
+        if not hit:
+            try:
+                future.set_result(build())
+            except BaseException as e:
+                future.set_exception(e)
+                with self.lock:
+                    if self.dict_nets.get(key) is future:
+                        del self.dict_nets[key]
+
+        return future.result(), hit
+
+
+    def get_stats(self):
+        with self.lock:
+            return {'n_net': len(self.dict_nets), 'max_nets': self.max_nets, 'n_hit': self.n_hit, 'n_miss': self.n_miss}
+
+
+def get_net_key(args, placement):
+    '''
+    Get the key of the network of the gen args, outputs are left out
+    '''
+    config = [args.n_port, args.type_list, args.pfx_list, args.monitor_def, args.intf_map, args.topology, placement,
+              args.cache_dir, args.cache_size]
+
+    return hashlib.sha256(json.dumps(config).encode()).hexdigest()
+
+
+class GenService(object):
+    '''
+    Serve gen requests of main.py on a Unix socket, networks are kept in a NetworkLRU between requests
+        Protocol: one json object per line in both directions, a connection may send several requests
+        Request: {'id', 'method' (one of LIST_METHODS), 'params'}, gen params are {'argv': gen args as on the
+                 command line, 'cwd': working directory of the client}
+        Response: {'id', 'result'} or {'id', 'error': {'type', 'message'}}, the gen result is {'stdout', 'stderr',
+                  'hit' (network found in the cache), 'time' (s)}
+        Note: requests run on a pool of n_worker threads, outputs of '-' are returned as stdout
+    '''
+
+    def __init__(self, socket_fn=SOCKET_FN, max_nets=16, n_worker=None):
+        self.socket_fn = socket_fn
+        self.nets = NetworkLRU(max_nets)
+        self.pool = ThreadPoolExecutor(max_workers=n_worker or os.cpu_count())
+        self.n_request = 0
+        self.stopped = threading.Event()
+        self.sock = None
+
+
+    def serve_forever(self):
+        '''
+        Listen on socket_fn until a shutdown request, a stale socket file is replaced
+        '''
+        import main
+        self.main = main
+
+        if os.path.exists(self.socket_fn):
+            os.remove(self.socket_fn)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.socket_fn)
+        self.sock.listen()
+
+        try:
+            while not self.stopped.is_set():
+                try:
+                    conn, _ = self.sock.accept()
+                except OSError:
+                    # the listening socket is closed by shutdown
+                    break
+                self.pool.submit(self.handle_conn, conn)
+        finally:
+            self.pool.shutdown(wait=True)
+            self.sock.close()
+            if os.path.exists(self.socket_fn):
+                os.remove(self.socket_fn)
+
+
+    def shutdown(self):
+        self.stopped.set()
+        self.sock.shutdown(socket.SHUT_RDWR)
+        self.sock.close()
+
+
+    def handle_conn(self, conn):
+        with conn, conn.makefile('rb') as reader:
+            for line in reader:
+                request = {}
+                try:
+                    request = json.loads(line)
+                    response = {'id': request.get('id'), 'result': self.dispatch(request.get('method'), request.get('params') or {})}
+                except Exception as e:
+                    response = {'id': request.get('id') if isinstance(request, dict) else None,
+                                'error': {'type': type(e).__name__, 'message': str(e) or traceback.format_exc()}}
+                conn.sendall(json.dumps(response).encode() + b'\n')
+                if isinstance(request, dict) and request.get('method') == 'shutdown' and 'result' in response:
+                    self.shutdown()
+                    return
+
+
+    def dispatch(self, method, params):
+        assert method in LIST_METHODS, "Invalid method %s, allowed values are %s" % (method, ', '.join(LIST_METHODS))
+        self.n_request += 1
+
+        if method == 'gen':
+            return self.run_gen(params['argv'], params.get('cwd', os.getcwd()))
+        if method == 'stats':
+            return dict(self.nets.get_stats(), n_request=self.n_request, pid=os.getpid())
+        return {}
+
+
+    def run_gen(self, argv, cwd):
+        '''
+        Run main.py gen with argv in directory cwd on a network of the cache
+        '''
+        main = self.main
+        t = time.perf_counter()
+
+        parser = RequestArgumentParser(prog='main.py')
+        main.add_gen_args(parser)
+        args = parser.parse_args(argv)
+        main.check_args(args)
+        assert args.profile is None, "Profiling is not available in the service, networks are built once for many requests"
+
+        for name in LIST_PATH_ARGS:
+            value = getattr(args, name)
+            if value is not None and value != '-':
+                setattr(args, name, os.path.join(cwd, value))
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        for name in LIST_STDOUT_ARGS:
+            if getattr(args, name) == '-':
+                setattr(args, name, stdout)
+
+        placement = main.load_placement(args)
+        bfNet, hit = self.nets.get(get_net_key(args, placement),
+                                   lambda: main.build_net(args, placement, headless=True, cache=main.get_cache(args)))
+
+        if args.save_img and args.img_fmt == 'png':
+            with PNG_LOCK:
+                main.write_outputs(bfNet, args, img_dir=cwd, log=stderr)
+        else:
+            main.write_outputs(bfNet, args, img_dir=cwd, log=stderr)
+
+        return {'stdout': stdout.getvalue(), 'stderr': stderr.getvalue(), 'hit': hit, 'time': time.perf_counter() - t}
+
+
+def call(method, params=None, socket_fn=SOCKET_FN):
+    '''
+    Send one request to the service, return its result or raise RuntimeError with the error of the service
+    '''
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_fn)
+        sock.sendall(json.dumps({'id': 1, 'method': method, 'params': params or {}}).encode() + b'\n')
+        with sock.makefile('rb') as reader:
+            response = json.loads(reader.readline())
+
+    if 'error' in response:
+        raise RuntimeError('%s: %s' % (response['error']['type'], response['error']['message']))
+
+    return response['result']
+
+
+def add_client_args(parser):
+    parser.usage = '%(prog)s [--socket SOCKET] [--stats | --shutdown] <arguments of gen>'
+    parser.add_argument('--socket', type=str, default=SOCKET_FN, help='path of the unix socket of main.py serve (default: %s)' % SOCKET_FN)
+    parser.add_argument('--stats', action='store_true', help='print the statistics of the service instead')
+    parser.add_argument('--shutdown', action='store_true', help='stop the service instead')
+
+
+def client_main(args):
+    '''
+    Run the client args of add_client_args, args.argv are the arguments of gen, return the exit code
+    '''
+    if args.stats or args.shutdown:
+        print(json.dumps(call('stats' if args.stats else 'shutdown', socket_fn=args.socket), indent=2))
+        return 0
+
+    return run_client(args.argv, args.socket)
+
+
+def run_client(argv, socket_fn=SOCKET_FN):
+    '''
+    Run main.py gen argv on the service as if on the command line, return the exit code
+    '''
+    try:
+        result = call('gen', {'argv': list(argv), 'cwd': os.getcwd()}, socket_fn)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    sys.stdout.write(result['stdout'])
+    sys.stderr.write(result['stderr'])
+    return 0
+
+
+if __name__ == '__main__':
+    # thin client without numpy & the network modules, same arguments as main.py client
+    parser = argparse.ArgumentParser(prog='Service.py', description='Run gen on the service of main.py serve', allow_abbrev=False)
+    add_client_args(parser)
+    args, gen_argv = parser.parse_known_args()
+    args.argv = gen_argv
+    sys.exit(client_main(args))
@@ -0,0 +1,108 @@
+# Parallel Sharded TCL Emission, Part Files Concatenated in Order or Sourced by a Master Script
+
+import os
+import shutil
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from Butterfly import ButterflyNet, open_output, write_lines
+
+
+# network of the worker process, see init_worker
+_worker_net = None
+
+
+def init_worker(net_config):
+    global _worker_net
+    _worker_net = ButterflyNet(headless=True, **net_config)
+
+
+def write_shard_job(job):
+    '''
+    Write the lines of shard (method name, args) of ButterflyNet.get_tcl_shards into part file part_fn
+    '''
+    method, args, part_fn = job
+    with open(part_fn, 'w') as file:
+        write_lines(file, getattr(_worker_net, method)(*args))
+
+    return part_fn
+
+
+def get_part_fns(bfNet, part_dir, intf=False):
+    '''
+    Get the (method name, args, part file name) of every shard, part files are <part_dir>/<index>_<shard name>.tcl
+    '''
+    shards = bfNet.get_tcl_shards(intf)
+    width = len(str(len(shards)-1))
+
+    return [(method, args, os.path.join(part_dir, '%0*d_%s.tcl' % (width, i, name))) for i, (name, method, args) in enumerate(shards)]
+
+
+def gen_part_files(bfNet, part_dir, tcl_mode='flat', n_worker=None):
+    '''
+    Write the shards of bfNet into part files of part_dir on a process pool, yield the part file names in order
+        Every worker rebuilds the network headlessly, a part is yielded as soon as it and all parts before it are written
+    '''
+    assert tcl_mode in ['flat', 'intf'], "Sharded tcl emission is only available for tcl_mode flat & intf"
+    if tcl_mode == 'intf':
+        # check the interface mapping before anything is emitted
+        bfNet.get_link_intf()
+    assert bfNet.pfx_list is not None, "Switch nodes prefix name list not specified"
+
+    jobs = get_part_fns(bfNet, part_dir, intf=(tcl_mode == 'intf'))
+
+    # the workers rebuild the network from its butterfly stages, see ButterflyNet
+    net_config = {'n_stage': len(bfNet.bfly_type_list), 'n_port': bfNet.n_port, 'type_list': list(bfNet.bfly_type_list),
+                  'monitor_def': list(bfNet.monitor_def), 'pfx_list': list(bfNet.pfx_list), 'intf_map': dict(bfNet.intf_map),
+                  'topology': bfNet.topology}
+    # spawned, a fork of a threaded caller (e.g. Service.GenService) may copy locks held by its other threads
+    with ProcessPoolExecutor(max_workers=n_worker or os.cpu_count(), mp_context=multiprocessing.get_context('spawn'),
+                             initializer=init_worker, initargs=(net_config,)) as pool:
+        yield from pool.map(write_shard_job, jobs)
+
+
+def write_tcl_shards(bfNet, file, tcl_mode='flat', n_worker=None):
+    '''
+    Write the tcl of gen_connect_tcl_flat into the opened text file by sharded emission, byte-identical to the serial one
+        Part files are written into a temporary directory and appended in shard order
+    '''
+    with tempfile.TemporaryDirectory(prefix='bfly_tcl_') as part_dir:
+        with bfNet.profile_phase('tcl_shards', nets=bfNet.n_port*(bfNet.n_stage-1)):
+            for part_fn in gen_part_files(bfNet, part_dir, tcl_mode, n_worker):
+                with open(part_fn) as part:
+                    shutil.copyfileobj(part, file)
+                os.remove(part_fn)
+
+
+def gen_master_tcl(part_fns, tcl_fn):
+    '''
+    Generate the lines of the master script sourcing the part files in order
+        Parts are found relative to the master script file tcl_fn, by absolute path if it is stdout or a file-like object
+    '''
+    part_dir = os.path.dirname(part_fns[0])
+    if isinstance(tcl_fn, str) and tcl_fn != '-':
+        rel_dir = os.path.relpath(part_dir, os.path.dirname(os.path.abspath(tcl_fn)))
+        yield 'set bfly_part_dir [file join [file dirname [info script]] {%s}]\n' % rel_dir
+    else:
+        yield 'set bfly_part_dir {%s}\n' % os.path.abspath(part_dir)
+
+    for part_fn in part_fns:
+        yield 'source [file join $bfly_part_dir %s]\n' % os.path.basename(part_fn)
+
+
+def gen_tcl_parts_as_file(bfNet, part_dir, tcl_fn, tcl_mode='flat', n_worker=None):
+    '''
+    Write the shards of bfNet as part files into part_dir & the master script sourcing them as tcl_fn
+        Sourcing the master script has the effect of the serial tcl of gen_connect_tcl_as_file, whose lines are
+        the part files concatenated in order. Return the part file names
+        Note: stale part files of another network in part_dir are not removed
+    '''
+    os.makedirs(part_dir, exist_ok=True)
+    with bfNet.profile_phase('tcl_shards', nets=bfNet.n_port*(bfNet.n_stage-1)):
+        part_fns = list(gen_part_files(bfNet, part_dir, tcl_mode, n_worker))
+
+    with open_output(tcl_fn) as file:
+        write_lines(file, gen_master_tcl(part_fns, tcl_fn))
+
+    return part_fns
@@ -0,0 +1,489 @@
+# Cycle-Level Traffic Simulator of the Butterfly Network with Backpressure
+
+import numpy as np
+
+
+# a chunked run simulates up to CHUNK_MAX_BATCH networks in lockstep, see run
+CHUNK_MAX_BATCH = 256
+
+
+def blend(values, new, mask, tmp):
+    '''
+    Replace values by new in place where the uint8 mask is 0xFF (0x00 elsewhere), arrays are broadcast against values
+        Note: a bitwise select is much faster than a masked copy (np.copyto with where) on random masks
+    '''
+    np.bitwise_xor(values, new, out=tmp)
+    np.bitwise_and(tmp, mask, out=tmp)
+    np.bitwise_xor(values, tmp, out=values)
+
+
+class ButterflySim(object):
+    '''
+    Cycle-level simulation of a ButterflyNet built from its stage permutations & routing tables
+        Every input pin of every switch node owns a FIFO of buf_depth flits. In each cycle the head flit (ivld) of
+        a FIFO requests the output port on its path, one request per output port is granted in rotating priority,
+        and a granted flit moves on only if the FIFO behind the output port is not full (ofw, i.e. backpressure).
+        Stages are updated from the last to the first one, so a flit advances at most one stage per cycle.
+        All ports of n_batch independent copies of the network are updated at once by array operations.
+        Note: the state of a stage is kept in arrays of shape (..., n_port, n_batch), so a stage permutation moves
+              whole rows & a switch node is a block of type_list[i] rows. A flit is stored as uint8 byte planes,
+              the bytes of its destination then the 2 bytes of its birth cycle modulo 65536, see check_age
+    '''
+
+    def __init__(self, bfNet, buf_depth=4, inj_rate=1.0, traffic='uniform', sink_rate=1.0, n_batch=1, seed=None):
+        '''
+            bfNet: ButterflyNet to simulate, may be headless
+            buf_depth: FIFO depth of every switch input pin
+            inj_rate: injection probability per cycle, scalar or one value per input port
+            traffic: 'uniform' for uniformly random destinations, 'perm' for one random permutation per batch,
+                     or an integer array of destinations, shape (n_port,) or (n_batch, n_port)
+            sink_rate: probability per cycle that an output port accepts a flit (the bp external port is low)
+            n_batch: number of independent copies simulated in lockstep, hundreds of them amortize the array call overhead
+                     of a cycle, e.g. to simulate a million network-cycles in seconds
+            Note: run splits the cycles of a few copies into chunks simulated in lockstep, so a single network gets the
+                  same speed, step always simulates one cycle of the n_batch copies
+        '''
+        self.bfNet = bfNet
+        self.n_stage = bfNet.n_stage
+        self.n_port = bfNet.n_port
+        self.type_list = bfNet.type_list
+        self.buf_depth = buf_depth
+        self.sink_rate = sink_rate
+        self.n_batch = n_batch
+        self.rng = np.random.default_rng(seed)
+
+        assert 1 <= buf_depth < 256, "Invalid buffer depth, allowed range is [1, 255]"
+        assert 0 < sink_rate <= 1, "Invalid sink rate, allowed range is (0, 1]"
+
+        self.inj_rate = np.broadcast_to(np.asarray(inj_rate, dtype=np.float64), (self.n_port,))
+        assert ((self.inj_rate >= 0) & (self.inj_rate <= 1)).all(), "Invalid injection rate, allowed range is [0, 1]"
+
+        # byte planes of a flit: destination bytes, then birth cycle low & high bytes
+        self.n_dst_byte = max(1, ((self.n_port-1).bit_length() + 7) // 8)
+        self.n_plane = self.n_dst_byte + 2
+
+        if isinstance(traffic, str):
+            assert traffic in ['uniform', 'perm'], "Invalid traffic pattern, allowed values are uniform, perm or an array"
+            self.traffic = traffic
+            if traffic == 'perm':
+                self.dst_table = np.argsort(self.rng.random((n_batch, self.n_port)), axis=1)
+        else:
+            self.traffic = 'fixed'
+            self.dst_table = np.broadcast_to(np.asarray(traffic), (n_batch, self.n_port))
+            assert ((self.dst_table >= 0) & (self.dst_table < self.n_port)).all(), "Invalid destination found in traffic"
+        if self.traffic != 'uniform':
+            dst = self.dst_table.T.astype(np.int64)
+            self.dst_planes = np.array([(dst >> (8*b)) & 0xFF for b in range(self.n_dst_byte)], dtype=np.uint8)
+
+        self.build_tables()
+        self.reset()
+
+
+    def build_tables(self):
+        '''
+        Precompute the tables of every stage & of every rotation of the arbitration priority
+        '''
+        route_tables = self.bfNet.get_route_tables()
+
+        self.list_digit_pos = []   # (byte plane, bit offset) of the sub-block digit in the destination, see arbitrate
+        self.list_sub_block = []   # sub-block reached by output port k of switch node j, shape (n_nodes, n_ports, 1, 1)
+        self.list_next_pin = []    # input pin of stage i+1 behind every output pin of stage i
+        self.list_prev_pin = []    # output pin of stage i in front of every input pin of stage i+1
+        self.list_rot_order = []   # [rot] input ports of a switch node in decreasing priority
+        for i in range(self.n_stage):
+            n_ports = self.type_list[i]
+            shift = (self.n_port // int(np.prod(self.type_list[0:i+1]))).bit_length() - 1
+            self.list_digit_pos.append((shift // 8, shift % 8))
+
+            sub_block = np.argsort(route_tables[i], axis=1).astype(np.uint8)
+            self.list_sub_block.append(sub_block.reshape(-1, n_ports, 1, 1))
+
+            if i < self.n_stage-1:
+                perm = self.bfNet.get_stage_perm(i).astype(np.intp)
+                self.list_next_pin.append(perm)
+                self.list_prev_pin.append(np.argsort(perm))
+
+            self.list_rot_order.append([[(rot + p) % n_ports for p in range(n_ports)] for rot in range(n_ports)])
+
+        self.slot_ids = np.arange(self.buf_depth, dtype=np.uint8).reshape(-1, 1, 1)
+
+        # injection & sink thresholds of uint16 random numbers, see gen_random
+        self.inj_thr = np.round(self.inj_rate * 65536).astype(np.uint32).reshape(-1, 1)
+        self.sink_thr = np.uint32(round(self.sink_rate * 65536))
+
+
+    def reset(self):
+        '''
+        Empty all FIFOs & clear the statistics
+            Note: the FIFOs of a stage are a shift register of shape (buf_depth, n_plane, n_port, n_batch),
+                  slot 0 holds the head flits
+        '''
+        shape = (self.n_port, self.n_batch)
+
+        self.cycle = 0
+        self.list_count = [np.zeros(shape, dtype=np.uint8) for _ in range(self.n_stage)]
+        self.list_fifo = [np.zeros((self.buf_depth, self.n_plane) + shape, dtype=np.uint8) for _ in range(self.n_stage)]
+
+        self.build_views()
+        self.clear_stats()
+
+
+    def clear_stats(self):
+        self.n_cycle_stats = 0
+        self.n_offered = 0
+        self.n_injected = 0
+        self.n_delivered = 0
+        self.list_n_head = [0] * self.n_stage
+        self.list_n_blocked = [0] * self.n_stage
+        self.list_n_ofw = [0] * self.n_stage
+        self.latency_hist = np.zeros(0, dtype=np.int64)
+
+
+    def get_buf(self, name, shape, dtype=np.bool_):
+        '''
+        Get the work array name of shape, allocated on first use, stages of the same switch type share it
+        '''
+        key = (name, shape)
+        if key not in self.buf:
+            self.buf[key] = np.empty(shape, dtype=dtype)
+        return self.buf[key]
+
+
+    def build_views(self):
+        '''
+        Allocate the work arrays & precompute their views of every stage, a cycle only runs ufuncs into them
+        '''
+        n_port, B = self.n_port, self.n_batch
+        shape = (n_port, B)
+        D, V = self.buf_depth, self.n_plane
+
+        self.buf = {}
+        for name in ['occ', 'ready', 'win', 'vld', 'offer', 'full']:
+            self.buf[name] = np.empty(shape, dtype=np.bool_)
+        self.buf['count'] = np.empty(shape, dtype=np.uint8)
+        self.buf['digit'] = np.empty(shape, dtype=np.uint8)
+        self.buf['digit_high'] = np.empty(shape, dtype=np.uint8)
+        self.buf['pop_mask'] = np.empty(shape, dtype=np.uint8)
+        self.buf['latency'] = np.empty(shape, dtype=np.uint16)
+        self.buf['tail'] = np.empty((D,) + shape, dtype=np.bool_)
+        self.buf['tail_mask'] = np.empty((D,) + shape, dtype=np.uint8)
+        self.buf['planes'] = np.empty((V,) + shape, dtype=np.uint8)
+        self.buf['blend'] = np.empty((V,) + shape, dtype=np.uint8)
+
+        self.list_views = []
+        for i in range(self.n_stage):
+            n_ports = self.type_list[i]
+            node_shape = (n_port // n_ports, n_ports, B)
+            req_shape = node_shape[:2] + node_shape[1:]
+            fifo = self.list_fifo[i]
+            head = fifo[0]
+            plane, offset = self.list_digit_pos[i]
+
+            # req[j, k, c]: input port c of switch node j requests its output port k, which is ready
+            req = self.get_buf('req', req_shape)
+            grant_mask = self.get_buf('grant_mask', req_shape, np.uint8)
+            out = self.get_buf('out', (V,) + node_shape, np.uint8)
+            self.list_views.append({
+                'dst': head[plane],
+                'dst_high': head[plane+1] if offset + n_ports.bit_length() - 1 > 8 else None,
+                'digit': self.buf['digit'].reshape(node_shape)[:, None],
+                'occ': self.buf['occ'].reshape(node_shape)[:, None],
+                'ready': self.buf['ready'].reshape(node_shape)[:, :, None],
+                'req': req,
+                'req_c': [req[:, :, c] for c in range(n_ports)],
+                'seen': self.get_buf('seen', node_shape),
+                'win': self.buf['win'].reshape(node_shape),
+                'req_k': [req[:, k] for k in range(n_ports)],
+                'grant_mask': grant_mask,
+                'mask_c': [grant_mask[:, :, c] for c in range(n_ports)],
+                'head_c': [head.reshape((V,) + node_shape)[:, :, c, None] for c in range(n_ports)],
+                'cross': self.get_buf('cross', (V,) + node_shape, np.uint8),
+                'out': out,
+                'out_pins': out.reshape((V,) + shape),
+            })
+
+
+    def gen_random(self):
+        '''
+        Get uniform uint16 random numbers of every input port, shape (n_port, n_batch)
+        '''
+        return np.frombuffer(self.rng.bytes(2 * self.n_port * self.n_batch), dtype=np.uint16).reshape(self.n_port, self.n_batch)
+
+
+    def gen_destinations(self):
+        '''
+        Get the destination byte planes of the flits offered by every input port, shape (n_dst_byte, n_port, n_batch)
+        '''
+        if self.traffic != 'uniform':
+            return self.dst_planes
+
+        shape = (self.n_dst_byte, self.n_port, self.n_batch)
+        dst = np.frombuffer(self.rng.bytes(int(np.prod(shape))), dtype=np.uint8).reshape(shape)
+        # n_port is a power of 2, clear the bits of the top byte above it
+        top_mask = (self.n_port-1) >> (8 * (self.n_dst_byte-1))
+        if top_mask != 0xFF:
+            dst = np.bitwise_and(dst, np.array([0xFF] * (self.n_dst_byte-1) + [top_mask], dtype=np.uint8).reshape(-1, 1, 1))
+        return dst
+
+
+    def get_births(self, planes, out=None):
+        '''
+        Get the birth cycles modulo 65536 of the flits of byte planes as uint16, into out if given
+        '''
+        birth = np.left_shift(planes[self.n_dst_byte+1], 8, dtype=np.uint16, out=out)
+        return np.bitwise_or(birth, planes[self.n_dst_byte], out=birth)
+
+
+    def push(self, i):
+        '''
+        Append the flits of the byte planes buffer to the FIFOs of the input pins of stage i where the vld buffer is True
+            The slot behind the tail of a FIFO is not occupied, so it is written whatever vld
+        '''
+        buf = self.buf
+        count = self.list_count[i]
+        tail = np.equal(count, self.slot_ids, out=buf['tail'])
+        mask = np.negative(tail.view(np.int8), out=buf['tail_mask'].view(np.int8)).view(np.uint8)
+        fifo = self.list_fifo[i]
+        for d in range(self.buf_depth):
+            blend(fifo[d], buf['planes'], mask[d], buf['blend'])
+        np.add(count, buf['vld'].view(np.uint8), out=count)
+
+
+    def pop(self, i):
+        '''
+        Remove the head flit of the FIFOs of the input pins of stage i where the win buffer is True
+        '''
+        buf = self.buf
+        mask = np.negative(buf['win'].view(np.int8), out=buf['pop_mask'].view(np.int8)).view(np.uint8)
+        fifo = self.list_fifo[i]
+        for d in range(self.buf_depth-1):
+            blend(fifo[d], fifo[d+1], mask, buf['blend'])
+        np.subtract(self.list_count[i], buf['win'].view(np.uint8), out=self.list_count[i])
+
+
+    def arbitrate(self, i, rot):
+        '''
+        Grant every ready output pin of stage i to the requesting input pin of highest priority of its switch node
+            Input port order[p] of a switch node has the p_th highest priority, order = list_rot_order[i][rot].
+            Along the input ports in priority order, the running OR of the requests of an output port becomes True
+            exactly at its winner, so there is one winner per output port whatever the order of array writes.
+            Inputs are the occ & ready buffers, outputs the win buffer (granted input pins), the seen view (output
+            pins a flit leaves by) & the out view (byte planes of the flit on every output pin, garbage if not seen)
+        '''
+        view = self.list_views[i]
+        n_ports = self.type_list[i]
+        plane, offset = self.list_digit_pos[i]
+
+        # sub-block digit of the destination of the head flits
+        digit = np.right_shift(view['dst'], offset, out=self.buf['digit'])
+        if view['dst_high'] is not None:
+            np.bitwise_or(digit, np.left_shift(view['dst_high'], 8 - offset, out=self.buf['digit_high']), out=digit)
+        np.bitwise_and(digit, n_ports-1, out=digit)
+
+        req = view['req']
+        np.equal(view['digit'], self.list_sub_block[i], out=req)
+        np.bitwise_and(req, view['occ'], out=req)
+        np.bitwise_and(req, view['ready'], out=req)
+
+        # keep the first request of every output port in priority order, req becomes the grants
+        order = self.list_rot_order[i][rot]
+        req_c, seen = view['req_c'], view['seen']
+        np.copyto(seen, req_c[order[0]])
+        for c in order[1:]:
+            np.greater(req_c[c], seen, out=req_c[c])
+            np.bitwise_or(seen, req_c[c], out=seen)
+        # the win of an input port is the OR of its grants, its flit goes to the output port of its grant
+        win, out = view['win'], view['out']
+        np.copyto(win, view['req_k'][0])
+        for k in range(1, n_ports):
+            np.bitwise_or(win, view['req_k'][k], out=win)
+
+        mask = np.negative(req.view(np.int8), out=view['grant_mask'].view(np.int8)).view(np.uint8)
+        np.bitwise_and(view['head_c'][0], view['mask_c'][0], out=out)
+        for c in range(1, n_ports):
+            np.bitwise_or(out, np.bitwise_and(view['head_c'][c], view['mask_c'][c], out=view['cross']), out=out)
+
+
+    def step(self, record=True):
+        '''
+        Simulate one cycle
+        '''
+        t = self.cycle
+        last = self.n_stage - 1
+        D = self.buf_depth
+        buf = self.buf
+
+        for i in range(last, -1, -1):
+            view = self.list_views[i]
+            count = self.list_count[i]
+            np.not_equal(count, 0, out=buf['occ'])
+
+            # an output pin is ready if the FIFO behind it is not full
+            if i < last:
+                np.less(np.take(self.list_count[i+1], self.list_next_pin[i], axis=0, out=buf['count']), D, out=buf['ready'])
+            elif self.sink_rate < 1:
+                np.less(self.gen_random(), self.sink_thr, out=buf['ready'])
+            else:
+                buf['ready'].fill(True)
+
+            self.arbitrate(i, t % self.type_list[i])
+
+            if record:
+                n_occ = int(np.count_nonzero(buf['occ']))
+                n_win = int(np.count_nonzero(buf['win']))
+                self.list_n_head[i] += n_occ
+                self.list_n_blocked[i] += n_occ - n_win
+                self.list_n_ofw[i] += int(np.count_nonzero(np.equal(count, D, out=buf['full'])))
+
+                if i == last:
+                    latency = self.get_births(self.list_fifo[i][0], out=buf['latency'])
+                    np.subtract(np.uint16((t+1) & 0xFFFF), latency, out=latency)
+                    # a delivered flit is at least 1 cycle old, clear the latency of the others & drop bin 0
+                    np.multiply(latency, buf['win'], out=latency)
+                    hist = np.bincount(latency.ravel())
+                    hist[0] = 0
+                    self.add_latency_hist(hist)
+                    self.n_delivered += n_win
+
+            self.pop(i)
+
+            if i < last:
+                # move the flits leaving stage i into the FIFOs of stage i+1
+                prev_pin = self.list_prev_pin[i]
+                np.take(view['seen'].reshape(buf['vld'].shape), prev_pin, axis=0, out=buf['vld'])
+                np.take(view['out_pins'], prev_pin, axis=1, out=buf['planes'])
+                self.push(i+1)
+
+        # inject new flits into the first stage
+        inj = np.less(self.list_count[0], D, out=buf['vld'])
+        if (self.inj_thr >= 65536).all():
+            n_offered = self.n_port * self.n_batch
+        else:
+            offer = np.less(self.gen_random(), self.inj_thr, out=buf['offer'])
+            n_offered = int(np.count_nonzero(offer))
+            np.bitwise_and(inj, offer, out=inj)
+        if record:
+            self.n_offered += n_offered
+            self.n_injected += int(np.count_nonzero(inj))
+            self.n_cycle_stats += 1
+
+        planes = buf['planes']
+        planes[:self.n_dst_byte] = self.gen_destinations()
+        planes[self.n_dst_byte] = t & 0xFF
+        planes[self.n_dst_byte+1] = (t >> 8) & 0xFF
+        self.push(0)
+
+        self.cycle += 1
+        if self.cycle % 32768 == 0:
+            self.check_age()
+
+
+    def check_age(self):
+        '''
+        Check that no buffered flit is 32767 cycles old, its birth cycle modulo 65536 would become ambiguous
+            Note: called every 32768 cycles, so every latency is exact as long as the check passes
+        '''
+        for i in range(self.n_stage):
+            for d in range(self.buf_depth):
+                age = np.subtract(np.uint16(self.cycle & 0xFFFF), self.get_births(self.list_fifo[i][d]))
+                assert not ((age >= 32767) & (self.list_count[i] > d)).any(), "Flit buffered for 32767 cycles in stage %d, latency overflow" % i
+
+
+    def add_latency_hist(self, hist):
+        if len(hist) > len(self.latency_hist):
+            hist[:len(self.latency_hist)] += self.latency_hist
+            self.latency_hist = hist
+        else:
+            self.latency_hist[:len(hist)] += hist
+
+
+    def run(self, n_cycle, n_warmup=0, n_chunk=None):
+        '''
+        Simulate n_warmup cycles without statistics then n_cycle cycles, return the report, see get_report
+            n_chunk: split the n_cycle cycles into n_chunk runs of independent copies of every batch, simulated in lockstep,
+                     None to pick it from n_cycle & n_batch, see get_n_chunk
+            Note: every chunk is warmed up for no less than get_chunk_warmup cycles, so the chunks sample the same steady
+                  state as one long run; a chunked run only adds statistics, the FIFOs & cycle are left as they are
+        '''
+        if n_chunk is None:
+            n_chunk = self.get_n_chunk(n_cycle, n_warmup)
+        assert n_chunk >= 1, "Invalid number of chunks, should be no less than 1"
+
+        if n_chunk > 1:
+            traffic = self.traffic if self.traffic == 'uniform' else np.repeat(self.dst_table, n_chunk, axis=0)
+            sim = ButterflySim(self.bfNet, self.buf_depth, self.inj_rate, traffic, self.sink_rate, self.n_batch * n_chunk, self.rng)
+            sim.run(-(-n_cycle // n_chunk), max(n_warmup, self.get_chunk_warmup()), n_chunk=1)
+            self.add_stats(sim, n_chunk)
+            return self.get_report()
+
+        for _ in range(n_warmup):
+            self.step(record=False)
+        for _ in range(n_cycle):
+            self.step()
+
+        return self.get_report()
+
+
+    def get_n_chunk(self, n_cycle, n_warmup=0):
+        '''
+        Get the number of chunks of a run of n_cycle cycles after n_warmup cycles, up to CHUNK_MAX_BATCH copies in total
+            Note: a chunk is no shorter than 4 times its warm-up, so warm-up cycles are at most a fifth of the simulated ones
+        '''
+        warmup = max(n_warmup, self.get_chunk_warmup())
+
+        return max(1, min(CHUNK_MAX_BATCH // self.n_batch, n_cycle // (4 * warmup)))
+
+
+    def get_chunk_warmup(self):
+        '''
+        Get the least warm-up cycles of a chunk, the FIFOs along a path fill up many times over
+        '''
+        return 16 * self.n_stage * self.buf_depth
+
+
+    def add_stats(self, sim, n_chunk):
+        '''
+        Add the statistics of sim, the chunked run of n_chunk chunks of every batch, see run
+        '''
+        self.n_cycle_stats += sim.n_cycle_stats * n_chunk
+        self.n_offered += sim.n_offered
+        self.n_injected += sim.n_injected
+        self.n_delivered += sim.n_delivered
+        for i in range(self.n_stage):
+            self.list_n_head[i] += sim.list_n_head[i]
+            self.list_n_blocked[i] += sim.list_n_blocked[i]
+            self.list_n_ofw[i] += sim.list_n_ofw[i]
+        self.add_latency_hist(sim.latency_hist.copy())
+
+
+    def get_report(self, percentiles=(50, 90, 99)):
+        '''
+        Get the statistics of the simulated cycles as a dictionary
+            throughput: delivered flits per output port per cycle
+            accept_rate: injected / offered flits, offered flits are dropped if the first FIFO is full
+            latency_p<N>: latency percentiles in cycles, from injection to leaving the last stage
+            block_rate: per stage, fraction of head flits not granted in a cycle
+            ofw_rate: per stage, fraction of FIFO cycles spent full (ofw asserted)
+        '''
+        n_port_cycle = self.n_cycle_stats * self.n_batch * self.n_port
+        report = {
+            'n_cycle': self.n_cycle_stats,
+            'n_batch': self.n_batch,
+            'n_port': self.n_port,
+            'type_list': list(self.type_list),
+            'buf_depth': self.buf_depth,
+            'offered': self.n_offered,
+            'injected': self.n_injected,
+            'delivered': self.n_delivered,
+            'throughput': self.n_delivered / n_port_cycle if n_port_cycle else 0.0,
+            'accept_rate': self.n_injected / self.n_offered if self.n_offered else 0.0,
+            'block_rate': [b / h if h else 0.0 for b, h in zip(self.list_n_blocked, self.list_n_head)],
+            'ofw_rate': [o / n_port_cycle if n_port_cycle else 0.0 for o in self.list_n_ofw],
+        }
+
+        cdf = np.cumsum(self.latency_hist)
+        report['latency_mean'] = float((self.latency_hist * np.arange(len(cdf))).sum() / cdf[-1]) if self.n_delivered else 0.0
+        for p in percentiles:
+            report['latency_p%g' % p] = int(np.searchsorted(cdf, cdf[-1] * p / 100)) if self.n_delivered else 0
+
+        return report
@@ -0,0 +1,99 @@
+# Design-Space Sweep over the Valid type_list of a Butterfly Network
+
+import os
+import math
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from Butterfly import ButterflyNet
+from Contention import gen_pattern, analyze_contention
+from Wire import estimate_wire, get_totals
+
+
+# columns of the sweep table, see score_type_list
+LIST_SWEEP_COLUMNS = ['type_list', 'n_stage', 'n_switch', 'wirelength', 'max_span', 'crossings', 'mean_max_conflict', 'worst_conflict']
+
+
+def gen_type_lists(n_port, radices=(2, 4)):
+    '''
+    Enumerate every type_list (stage ascending order matters) made of radices whose product is n_port
+    '''
+    radices = sorted(set(radices))
+
+    def extend(remain):
+        if remain == 1:
+            yield []
+            return
+        for r in radices:
+            if remain % r == 0:
+                for tail in extend(remain // r):
+                    yield [r] + tail
+
+    yield from extend(n_port)
+
+
+def score_type_list(type_list, n_perm=100, seed=0, monitor_def=(2560, 1440)):
+    '''
+    Build the network of type_list headlessly and score it, run in a worker process
+        n_switch: number of switch nodes; wirelength, max_span & crossings: totals of Wire.estimate_wire
+        mean_max_conflict: mean over n_perm random permutations of the maximum link conflict degree
+        worst_conflict: maximum link conflict degree over the standard permutation patterns
+    '''
+    n_port = math.prod(type_list)
+    bfNet = ButterflyNet(n_stage=len(type_list), n_port=n_port, type_list=list(type_list),
+                         monitor_def=list(monitor_def), headless=True)
+
+    totals = get_totals(estimate_wire(bfNet))
+
+    random_conflict = analyze_contention(bfNet, gen_pattern('random', n_port, n_perm=n_perm, seed=seed))['max_conflict']
+    worst_conflict = 1
+    for name in ['identity', 'bitrev', 'transpose', 'shuffle', 'unshuffle', 'neighbor']:
+        worst_conflict = max(worst_conflict, int(analyze_contention(bfNet, gen_pattern(name, n_port))['max_conflict'].max()))
+
+    return {
+        'type_list': list(type_list),
+        'n_stage': len(type_list),
+        'n_switch': sum(n_port // r for r in type_list),
+        'wirelength': float(totals['wirelength']),
+        'max_span': float(totals['max_span']),
+        'crossings': totals['crossings'],
+        'mean_max_conflict': float(random_conflict.max(axis=1).mean()),
+        'worst_conflict': worst_conflict,
+    }
+
+
+def sweep(n_port, radices=(2, 4), n_worker=None, n_perm=100, seed=0, sort_by=('n_switch', 'mean_max_conflict', 'wirelength'), callback=None):
+    '''
+    Score every valid type_list of n_port on a process pool, return the rows ranked by sort_by
+        callback: called with every row as soon as its worker finishes, e.g. to stream partial results
+        Note: workers return small score dictionaries only, networks are never sent back to the parent
+    '''
+    list_type_list = list(gen_type_lists(n_port, radices))
+    assert list_type_list, "No valid type_list found for n_port %d with radices %s" % (n_port, list(radices))
+    for key in sort_by:
+        assert key in LIST_SWEEP_COLUMNS[1:], "Invalid sort key %s, allowed values are %s" % (key, ', '.join(LIST_SWEEP_COLUMNS[1:]))
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=n_worker or os.cpu_count()) as pool:
+        futures = [pool.submit(score_type_list, type_list, n_perm, seed) for type_list in list_type_list]
+        for future in as_completed(futures):
+            row = future.result()
+            rows.append(row)
+            if callback is not None:
+                callback(row)
+
+    rows.sort(key=lambda row: tuple(row[key] for key in sort_by) + (row['type_list'],))
+    for rank, row in enumerate(rows):
+        row['rank'] = rank + 1
+
+    return rows
+
+
+def gen_sweep_table(rows, sep=','):
+    '''
+    Generate the lines of the ranked sweep table, sep=',' for csv
+    '''
+    yield sep.join(['rank'] + LIST_SWEEP_COLUMNS) + '\n'
+    for row in rows:
+        values = [str(row['rank']), ' '.join(map(str, row['type_list']))]
+        values += ['%.6g' % row[key] if isinstance(row[key], float) else str(row[key]) for key in LIST_SWEEP_COLUMNS[1:]]
+        yield sep.join(values) + '\n'
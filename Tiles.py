@@ -0,0 +1,303 @@
+# Tiled Level-of-Detail Rendering of the Butterfly Network as a Zoom Pyramid
+
+import os
+import json
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from Butterfly import ButterflyNet
+from Vector import get_canvas_size, NODE_LINE_WIDTH, PIN_LINE_WIDTH, LINK_LINE_WIDTH
+
+
+# size of a square tile in pixels
+TILE_PX = 256
+
+# detail levels of a tile, chosen by the pixels per data unit of its zoom level, see TilePyramid.get_detail
+#     block: one filled block per stage and one band per inter-stage link mesh
+#     node: switch node outlines and links, pins are omitted
+#     pin: everything as in ButterflyNet.render
+LIST_DETAILS = ['block', 'node', 'pin']
+
+# pin (node) spacing in pixels above which pins (nodes) are drawn
+PIN_MIN_PX = 4
+NODE_MIN_PX = 3
+
+# finest zoom level draws pins PIN_MAX_PX pixels apart
+PIN_MAX_PX = 12
+
+# line widths are capped to this fraction of the pin spacing, otherwise the thick lines of the full image merge
+LINE_PITCH_RATIO = 0.3
+
+# fill colors of the block detail
+BLOCK_COLOR = '0.25'
+BAND_COLOR = '#9999ff'
+
+# pyramid of the worker process, see init_worker
+_worker_pyramid = None
+
+
+class TilePyramid(object):
+    '''
+    Zoom pyramid of square TILE_PX tiles rendered from the coordinate arrays of a ButterflyNet
+        Level 0 is one tile covering the whole canvas width, level k has 2^k x 2^k tiles of 1/2^k the side.
+        Tile (k, tx, ty) is saved as <tile_dir>/<k>/<tx>/<ty>.png, tx from left & ty from top (XYZ scheme).
+        Tiles are only rendered when requested, from the switch nodes, pins and links overlapping them; tiles
+        without any element are not written.
+    '''
+
+    def __init__(self, bfNet, tile_dir, tile_px=TILE_PX):
+        self.bfNet = bfNet
+        self.tile_dir = tile_dir
+        self.tile_px = tile_px
+
+        self.Width, self.Height = get_canvas_size(bfNet)
+        # side of the level 0 tile in data units, its top edge is the top edge of the canvas
+        self.world_side = max(self.Width, self.Height)
+
+        bf = bfNet
+        self.hw = bf.Node_width / 2
+        self.list_hh = [n_ports / 5 * bf.zoom_factor * bf.scale_factor for n_ports in bf.type_list]
+        self.pin_pitch = 0.4 * bf.zoom_factor * bf.scale_factor
+        self.node_pitch = min(bf.get_node_height(n_ports) for n_ports in bf.type_list)
+        # y of the switch nodes sorted per stage, the order of list_node_y follows the placement
+        self.list_node_y = [np.sort(y) for y in bf.list_node_y]
+
+        self.max_level = max(0, math.ceil(math.log2(PIN_MAX_PX * self.world_side / (tile_px * self.pin_pitch))))
+
+        # link segments & their y ranges of every stage, computed on first use
+        self.dict_links = {}
+
+
+    def get_detail(self, level):
+        '''
+        Get the detail of the tiles of zoom level, one of LIST_DETAILS
+        '''
+        px_per_unit = self.get_px_per_unit(level)
+        if self.pin_pitch * px_per_unit >= PIN_MIN_PX:
+            return 'pin'
+        if self.node_pitch * px_per_unit >= NODE_MIN_PX:
+            return 'node'
+        return 'block'
+
+
+    def get_px_per_unit(self, level):
+        return self.tile_px * 2**level / self.world_side
+
+
+    def get_tile_bounds(self, level, tx, ty):
+        '''
+        Get (x0, y0, x1, y1) of tile (level, tx, ty) in data units
+        '''
+        side = self.world_side / 2**level
+        return tx * side, self.Height - (ty+1) * side, (tx+1) * side, self.Height - ty * side
+
+
+    def get_tile_range(self, level):
+        '''
+        Get the number of tile columns & rows of zoom level covering the canvas
+        '''
+        side = self.world_side / 2**level
+        return math.ceil(self.Width / side - 1e-9), math.ceil(self.Height / side - 1e-9)
+
+
+    def get_tile_path(self, level, tx, ty):
+        return os.path.join(self.tile_dir, str(level), str(tx), '%d.png' % ty)
+
+
+    def get_links(self, stageIdx):
+        '''
+        Get the link segments of stage stageIdx with their lower & upper y, see ButterflyNet.get_link_segments
+        '''
+        links = self.dict_links.get(stageIdx)
+        if links is None:
+            segments = self.bfNet.get_link_segments(stageIdx)
+            y = segments[:, :, 1]
+            links = (segments, y.min(axis=1), y.max(axis=1))
+            self.dict_links[stageIdx] = links
+
+        return links
+
+
+    def get_elements(self, bounds, detail):
+        '''
+        Get the elements overlapping bounds as a dictionary of arrays
+            rects: (n, 4, 2) switch nodes (or stage blocks), bands: (n, 4, 2) link meshes of the block detail,
+            pins: (n, 2, 2) & links: (n, 2, 2) line segments
+        '''
+        bf = self.bfNet
+        x0, y0, x1, y1 = bounds
+        hw = self.hw
+        pin_dx = bf.pin_dx
+
+        rects, bands, pins, links = [], [], [], []
+        for i in range(bf.n_stage):
+            xi = bf.list_node_x[i]
+            node_y = self.list_node_y[i]
+            hh = self.list_hh[i]
+
+            if xi + pin_dx >= x0 and xi - pin_dx <= x1:
+                if detail == 'block':
+                    if node_y[0] - hh <= y1 and node_y[-1] + hh >= y0:
+                        rects.append(get_rect_verts(xi - hw, node_y[0] - hh, xi + hw, node_y[-1] + hh))
+                else:
+                    # nodes are sorted by y, so the overlapping ones are consecutive
+                    lo, hi = np.searchsorted(node_y, [y0 - hh, y1 + hh])
+                    y = node_y[lo:hi]
+                    rects.append(get_rect_verts(xi - hw, y - hh, xi + hw, y + hh))
+                    if detail == 'pin':
+                        pin_y = (y[:, None] + bf.list_pin_ofst[i]).ravel()
+                        for xa, xb in [(xi - pin_dx, xi - hw), (xi + hw, xi + pin_dx)]:
+                            pins.append(np.stack(np.broadcast_arrays(xa, pin_y, xb, pin_y), axis=-1).reshape(-1, 2, 2))
+
+            if i < bf.n_stage-1 and xi + pin_dx <= x1 and bf.list_node_x[i+1] - pin_dx >= x0:
+                if detail == 'block':
+                    y_lo = min(node_y[0], self.list_node_y[i+1][0])
+                    y_hi = max(node_y[-1], self.list_node_y[i+1][-1])
+                    if y_lo <= y1 and y_hi >= y0:
+                        bands.append(get_rect_verts(xi + pin_dx, y_lo, bf.list_node_x[i+1] - pin_dx, y_hi))
+                else:
+                    segments, seg_lo, seg_hi = self.get_links(i)
+                    links.append(segments[(seg_lo <= y1) & (seg_hi >= y0)])
+
+        def concat(arrays, shape):
+            return np.concatenate(arrays) if arrays else np.zeros((0,) + shape)
+
+        return {
+            'rects': concat(rects, (4, 2)),
+            'bands': concat(bands, (4, 2)),
+            'pins': concat(pins, (2, 2)),
+            'links': concat(links, (2, 2)),
+        }
+
+
+    def get_tile(self, level, tx, ty, overwrite=False):
+        '''
+        Get the path of tile (level, tx, ty), rendered on first request, None if the tile is empty
+        '''
+        path = self.get_tile_path(level, tx, ty)
+        if os.path.isfile(path) and not overwrite:
+            return path
+
+        bounds = self.get_tile_bounds(level, tx, ty)
+        elements = self.get_elements(bounds, self.get_detail(level))
+        if not any(len(array) for array in elements.values()):
+            return None
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.render_tile(path, bounds, elements, self.get_px_per_unit(level))
+        return path
+
+
+    def render_tile(self, path, bounds, elements, px_per_unit):
+        '''
+        Render the elements within bounds as a png tile by matplotlib, without the pyplot global state
+        '''
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib import collections as mc
+
+        # line widths scale with the zoom, in data units as the full image: 1 point is 1/72 data unit
+        dpi = 100
+        max_px = LINE_PITCH_RATIO * self.pin_pitch * px_per_unit
+        def get_lw(width):
+            return max(min(width / 72 * px_per_unit, max_px), 0.5) * 72 / dpi
+
+        fig = Figure(figsize=(self.tile_px / dpi, self.tile_px / dpi), dpi=dpi)
+        FigureCanvasAgg(fig)
+        ax = fig.add_axes([0, 0, 1, 1])
+        ax.set_axis_off()
+        ax.set_xlim(bounds[0], bounds[2])
+        ax.set_ylim(bounds[1], bounds[3])
+
+        if len(elements['bands']):
+            ax.add_collection(mc.PolyCollection(elements['bands'], facecolors=BAND_COLOR, edgecolors='none'))
+        if len(elements['links']):
+            ax.add_collection(mc.LineCollection(elements['links'], colors='b', linewidth=get_lw(LINK_LINE_WIDTH)))
+        if len(elements['pins']):
+            ax.add_collection(mc.LineCollection(elements['pins'], colors='k', linewidth=get_lw(PIN_LINE_WIDTH)))
+        if len(elements['rects']):
+            if len(elements['bands']):
+                ax.add_collection(mc.PolyCollection(elements['rects'], facecolors=BLOCK_COLOR, edgecolors='none'))
+            else:
+                ax.add_collection(mc.PolyCollection(elements['rects'], facecolors='none', edgecolors='k',
+                                                    linewidths=get_lw(NODE_LINE_WIDTH)))
+
+        fig.savefig(path, dpi=dpi)
+
+
+    def gen_tile_ids(self, levels=None):
+        '''
+        Generate (level, tx, ty) of every tile of levels (default all levels up to max_level)
+        '''
+        for level in (range(self.max_level+1) if levels is None else levels):
+            n_col, n_row = self.get_tile_range(level)
+            for tx in range(n_col):
+                for ty in range(n_row):
+                    yield level, tx, ty
+
+
+    def get_meta(self):
+        '''
+        Get the description of the pyramid for tile viewers as a dictionary
+        '''
+        return {
+            'name': self.bfNet.get_net_name(),
+            'tile_px': self.tile_px,
+            'max_level': self.max_level,
+            'world_side': self.world_side,
+            'canvas': [self.Width, self.Height],
+            'levels': [{'level': level, 'detail': self.get_detail(level), 'tiles': list(self.get_tile_range(level))}
+                       for level in range(self.max_level+1)],
+            'path': '{z}/{x}/{y}.png',
+        }
+
+
+def get_rect_verts(x0, y0, x1, y1):
+    '''
+    Build rectangle vertices from broadcastable corner coordinates as float array of shape (n, 4, 2)
+    '''
+    x0, y0, x1, y1 = np.broadcast_arrays(x0, y0, x1, y1)
+    return np.stack([np.stack((x0, y0), axis=-1), np.stack((x1, y0), axis=-1),
+                     np.stack((x1, y1), axis=-1), np.stack((x0, y1), axis=-1)], axis=-2).reshape(-1, 4, 2)
+
+
+def init_worker(net_config, tile_dir, tile_px):
+    global _worker_pyramid
+    bfNet = ButterflyNet(headless=True, **net_config)
+    _worker_pyramid = TilePyramid(bfNet, tile_dir, tile_px)
+
+
+def render_tile_job(tile_ids):
+    return sum(_worker_pyramid.get_tile(*tile_id) is not None for tile_id in tile_ids)
+
+
+def render_tiles(bfNet, tile_dir, levels=None, tile_px=TILE_PX, n_worker=None, chunk=64):
+    '''
+    Render the tiles of levels (default all) into tile_dir on a process pool, return the number of written tiles
+        Every worker rebuilds the network headlessly & renders chunk tiles per job, existing tiles are kept
+        Note: tiles.json describes the pyramid, see TilePyramid.get_meta
+    '''
+    pyramid = TilePyramid(bfNet, tile_dir, tile_px)
+    if levels is not None:
+        for level in levels:
+            assert 0 <= level <= pyramid.max_level, "Invalid tile level %d, allowed range is 0 to %d" % (level, pyramid.max_level)
+
+    os.makedirs(tile_dir, exist_ok=True)
+    with open(os.path.join(tile_dir, 'tiles.json'), 'w') as file:
+        json.dump(pyramid.get_meta(), file, indent=2)
+        file.write('\n')
+
+    tile_ids = list(pyramid.gen_tile_ids(levels))
+    jobs = [tile_ids[start:start+chunk] for start in range(0, len(tile_ids), chunk)]
+
+    # the workers rebuild the network from its butterfly stages, see ButterflyNet
+    net_config = {'n_stage': len(bfNet.bfly_type_list), 'n_port': bfNet.n_port, 'type_list': list(bfNet.bfly_type_list),
+                  'monitor_def': list(bfNet.monitor_def), 'topology': bfNet.topology,
+                  'placement': None if bfNet.placement is None else [slots.tolist() for slots in bfNet.placement]}
+    # spawned, a fork of a threaded caller (e.g. Service.GenService) may copy locks held by its other threads
+    with ProcessPoolExecutor(max_workers=n_worker or os.cpu_count(), mp_context=multiprocessing.get_context('spawn'),
+                             initializer=init_worker, initargs=(net_config, tile_dir, tile_px)) as pool:
+        return sum(pool.map(render_tile_job, jobs))
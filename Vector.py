@@ -0,0 +1,194 @@
+# Vector (SVG / PDF) Renderer of the Butterfly Network Streamed from the Coordinate Arrays
+
+import sys
+import zlib
+
+import numpy as np
+
+from Butterfly import open_output, write_lines
+
+
+# image formats of ButterflyNet.save_network_image, png is rendered by matplotlib
+LIST_IMG_FORMATS = ['png', 'svg', 'pdf']
+
+# number of segments formatted by one string operation
+SEGMENT_CHUNK = 4096
+
+# line widths in points as drawn by matplotlib, see ButterflyNet.draw_switch_nodes & draw_pin_connection
+NODE_LINE_WIDTH = 8
+PIN_LINE_WIDTH = 6
+LINK_LINE_WIDTH = 6
+
+# largest page side of a pdf viewer in points, larger canvases are scaled down
+PDF_MAX_PAGE = 14400
+
+
+def get_canvas_size(bfNet):
+    '''
+    Get (Width, Height) of the canvas in data units (inches), the same as ButterflyNet.create_canvas
+    '''
+    return 216.0 * bfNet.scale_factor, 128.0 * bfNet.scale_factor
+
+
+def get_node_rects(bfNet, stageIdx):
+    '''
+    Get the outlines of the switch nodes of stage stageIdx as float array of shape (n_nodes, 4), each row as (x, y, w, h)
+    '''
+    hw = bfNet.Node_width / 2
+    hh = bfNet.type_list[stageIdx] / 5 * bfNet.zoom_factor * bfNet.scale_factor
+    y = bfNet.list_node_y[stageIdx]
+
+    return np.stack(np.broadcast_arrays(bfNet.list_node_x[stageIdx] - hw, y - hh, 2*hw, 2*hh), axis=1)
+
+
+def get_pin_segments(bfNet, stageIdx, output=True):
+    '''
+    Get the i/o pin line segments of stage stageIdx as float array of shape (n_port, 2, 2), pins ordered by uniId
+    '''
+    hw = bfNet.Node_width / 2
+    x = bfNet.list_node_x[stageIdx]
+    y = (bfNet.list_node_y[stageIdx][:, None] + bfNet.list_pin_ofst[stageIdx]).ravel()
+    x0, x1 = (x + hw, x + bfNet.pin_dx) if output else (x - bfNet.pin_dx, x - hw)
+
+    return np.stack(np.broadcast_arrays(x0, y, x1, y), axis=-1).reshape(-1, 2, 2)
+
+
+def gen_formatted(fmt, array, chunk=SEGMENT_CHUNK):
+    '''
+    Generate fmt applied to every row of the 2-d array, chunk rows are formatted by one string operation
+    '''
+    for start in range(0, len(array), chunk):
+        part = array[start:start+chunk]
+        yield (fmt * len(part)) % tuple(part.ravel().tolist())
+
+
+def gen_svg(bfNet, chunk=SEGMENT_CHUNK):
+    '''
+    Generate the lines of the network image as svg, in the same layout as the matplotlib rendering
+        Switch nodes & pins of a stage are one <path> each, every link is its own <path id="l<i>_<uniSrcId>">
+        so that a single net can be addressed; elements are grouped by <g class="stage<i>"> for stage i
+        Note: nothing is drawn by matplotlib, the elements are formatted from the coordinate arrays chunk by chunk
+    '''
+    Width, Height = get_canvas_size(bfNet)
+    # 1 data unit is 1 inch, i.e. 10 pixels of the png image & 72 points of line width
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" viewBox="0 0 %g %g">\n' % (
+        round(Width*10), round(Height*10), Width, Height)
+    yield '<title>%s</title>\n' % bfNet.get_net_name()
+    yield '<style>\n'
+    yield '  path { fill: none; stroke-linecap: butt; }\n'
+    yield '  .node { stroke: #000; stroke-width: %g; }\n' % (NODE_LINE_WIDTH / 72)
+    yield '  .pin { stroke: #000; stroke-width: %g; }\n' % (PIN_LINE_WIDTH / 72)
+    yield '  .link { stroke: #00f; stroke-width: %g; }\n' % (LINK_LINE_WIDTH / 72)
+    yield '  .link path:hover, .link path:target { stroke: #f00; }\n'
+    yield '</style>\n'
+    # y axis points upwards as in matplotlib
+    yield '<g transform="matrix(1 0 0 -1 0 %g)">\n' % Height
+
+    for i in range(bfNet.n_stage):
+        yield '<g class="stage%d">\n' % i
+
+        yield '<path class="node" d="'
+        yield from gen_formatted('M%.3f %.3fh%.3fv%.3fH%.3fz', get_node_rects(bfNet, i)[:, [0, 1, 2, 3, 0]], chunk)
+        yield '"/>\n'
+
+        yield '<path class="pin" d="'
+        for output in [False, True]:
+            yield from gen_formatted('M%.3f %.3fL%.3f %.3f', get_pin_segments(bfNet, i, output).reshape(-1, 4), chunk)
+        yield '"/>\n'
+
+        if i < bfNet.n_stage-1:
+            yield '<g class="link">\n'
+            rows = np.column_stack((bfNet.list_uni_pairs[i][:, 0], bfNet.get_link_segments(i).reshape(-1, 4)))
+            yield from gen_formatted('<path id="l%d_%%d" d="M%%.3f %%.3fL%%.3f %%.3f"/>\n' % i, rows, chunk)
+            yield '</g>\n'
+
+        yield '</g>\n'
+
+    yield '</g>\n'
+    yield '</svg>\n'
+
+
+def save_svg(bfNet, fn):
+    '''
+    Save the network image as svg file, fn is a file name (gzip compressed if it ends with '.gz'), '-' for stdout or a file-like object
+    '''
+    with open_output(fn) as file:
+        write_lines(file, gen_svg(bfNet), batch=64)
+
+
+def gen_pdf_content(bfNet, scale, chunk=SEGMENT_CHUNK):
+    '''
+    Generate the content stream operators of the network image as pdf, see gen_svg
+    '''
+    yield b'%g 0 0 %g 0 0 cm\n' % (scale, scale)
+    yield b'0 J\n'
+
+    for i in range(bfNet.n_stage):
+        yield b'0 G %g w\n' % (NODE_LINE_WIDTH / 72)
+        for text in gen_formatted('%.3f %.3f %.3f %.3f re\n', get_node_rects(bfNet, i), chunk):
+            yield text.encode()
+        yield b'S\n'
+
+        yield b'%g w\n' % (PIN_LINE_WIDTH / 72)
+        for output in [False, True]:
+            for text in gen_formatted('%.3f %.3f m %.3f %.3f l\n', get_pin_segments(bfNet, i, output).reshape(-1, 4), chunk):
+                yield text.encode()
+        yield b'S\n'
+
+        if i < bfNet.n_stage-1:
+            yield b'0 0 1 RG %g w\n' % (LINK_LINE_WIDTH / 72)
+            for text in gen_formatted('%.3f %.3f m %.3f %.3f l\n', bfNet.get_link_segments(i).reshape(-1, 4), chunk):
+                yield text.encode()
+            yield b'S\n'
+
+
+def save_pdf(bfNet, fn):
+    '''
+    Save the network image as a single page pdf file, fn is a file name or '-' for stdout
+        The content stream is compressed on the fly, the page is scaled down to fit PDF_MAX_PAGE points
+    '''
+    Width, Height = get_canvas_size(bfNet)
+    scale = min(72, PDF_MAX_PAGE / max(Width, Height))
+
+    file = sys.stdout.buffer if fn == '-' else open(fn, 'wb')
+    try:
+        offsets = []
+        pos = 0
+        def write(data):
+            nonlocal pos
+            file.write(data)
+            pos += len(data)
+        def begin_obj():
+            offsets.append(pos)
+            write(b'%d 0 obj\n' % len(offsets))
+
+        write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        begin_obj()
+        write(b'<< /Type /Catalog /Pages 2 0 R >>\nendobj\n')
+        begin_obj()
+        write(b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>\nendobj\n')
+        begin_obj()
+        write(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] /Contents 4 0 R >>\nendobj\n' % (Width*scale, Height*scale))
+
+        # the length of the compressed stream is only known at the end, so it is an indirect object
+        begin_obj()
+        write(b'<< /Length 5 0 R /Filter /FlateDecode >>\nstream\n')
+        start = pos
+        compressor = zlib.compressobj(6)
+        for data in gen_pdf_content(bfNet, scale):
+            write(compressor.compress(data))
+        write(compressor.flush())
+        length = pos - start
+        write(b'\nendstream\nendobj\n')
+        begin_obj()
+        write(b'%d\nendobj\n' % length)
+
+        xref = pos
+        write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(offsets)+1))
+        for ofst in offsets:
+            write(b'%010d 00000 n \n' % ofst)
+        write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(offsets)+1, xref))
+    finally:
+        if file is not sys.stdout.buffer:
+            file.close()
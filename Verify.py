@@ -0,0 +1,204 @@
+# Exhaustive Verification of the Butterfly Network Wiring by Packed Bit Reachability
+
+import re
+import gzip
+import time
+
+import numpy as np
+
+from Butterfly import LIST_LINK_SIGNALS, get_port_suffix
+
+
+# at most this many failures of one kind are reported in detail
+MAX_REPORTED = 8
+
+# connection commands of the flat & intf tcl, see ButterflyNet.gen_tcl_connect_consec_stages(_intf)
+RE_TCL_NET = re.compile(r'^connect_bd_net \[get_bd_pins (\S+)_(\d+)/(\w+)_([a-z]+)\] \[get_bd_pins (\S+)_(\d+)/(\w+)_([a-z]+)\]$')
+RE_TCL_INTF_NET = re.compile(r'^connect_bd_intf_net \[get_bd_intf_pins (\S+)_(\d+)/(\w+)_([a-z]+)\] \[get_bd_intf_pins (\S+)_(\d+)/(\w+)_([a-z]+)\]$')
+RE_TCL_LIST = re.compile(r'^set pin_pairs_(\d+) \{$')
+
+
+def popcount(words):
+    '''
+    Count the set bits of every row of a uint64 array of shape (n, n_words)
+    '''
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+    return np.unpackbits(words.view(np.uint8), axis=-1).sum(axis=-1, dtype=np.int64)
+
+
+def check_pin_pairs(bfNet):
+    '''
+    Check that every output pin of stage i drives exactly one input pin of stage i+1 and every input pin is driven exactly once
+        Return list of error messages, empty if the pin pairs of all stages are bijections
+    '''
+    errors = []
+    for i in range(bfNet.n_stage-1):
+        uni_pairs = np.asarray(bfNet.list_uni_pairs[i])
+        if uni_pairs.shape != (bfNet.n_port, 2):
+            errors.append('stage %d: pin pairs of shape %s, expected (%d, 2)' % (i, uni_pairs.shape, bfNet.n_port))
+            continue
+
+        for col, name in [(0, 'output pin %%d of stage %d' % i), (1, 'input pin %%d of stage %d' % (i+1))]:
+            ids = uni_pairs[:, col]
+            out_of_range = ids[(ids < 0) | (ids >= bfNet.n_port)]
+            counts = np.bincount(ids[(ids >= 0) & (ids < bfNet.n_port)], minlength=bfNet.n_port)
+            for uniId in out_of_range[:MAX_REPORTED].tolist():
+                errors.append('%s out of range' % (name % uniId))
+            for uniId in np.flatnonzero(counts != 1)[:MAX_REPORTED].tolist():
+                errors.append('%s is in %d links' % (name % uniId, counts[uniId]))
+
+    return errors
+
+
+def check_paths(bfNet, unique=True):
+    '''
+    Check that every network input reaches every network output by exactly one path (at least one if not unique)
+        The inputs reaching each pin are a packed bit set, a row of n_port bits as uint64 words: a switch node
+        passes the union of the sets of its input pins to all its output pins, the links permute the rows.
+        By induction all paths are unique iff the sets of the input pins of every switch node are disjoint, i.e.
+        the popcount of the union is the sum of the popcounts; every pair is reachable iff the sets of the last
+        stage are full. Each stage costs O(n_port^2 / 64) word operations.
+        Return list of error messages, requires check_pin_pairs to pass
+    '''
+    n_port = bfNet.n_port
+    n_words = (n_port + 63) // 64
+
+    # network input s is input pin s of stage 0
+    reach = np.zeros((n_port, n_words), dtype=np.uint64)
+    ids = np.arange(n_port)
+    reach[ids, ids // 64] = np.left_shift(np.uint64(1), (ids % 64).astype(np.uint64))
+
+    errors = []
+    for i in range(bfNet.n_stage):
+        n_ports = bfNet.type_list[i]
+        pins = reach.reshape(n_port // n_ports, n_ports, n_words)
+        node_reach = np.bitwise_or.reduce(pins, axis=1)
+
+        if unique:
+            n_overlap = popcount(pins).sum(axis=1) - popcount(node_reach)
+            for swId in np.flatnonzero(n_overlap)[:MAX_REPORTED].tolist():
+                errors.append('stage %d: %d network inputs reach switch node %d by more than one path' % (i, n_overlap[swId], swId))
+
+        if i < bfNet.n_stage-1:
+            uni_pairs = np.asarray(bfNet.list_uni_pairs[i])
+            reach = np.empty_like(reach)
+            reach[uni_pairs[:, 1]] = node_reach[uni_pairs[:, 0] // n_ports]
+
+    # every output pin of the last stage carries the set of its switch node
+    full = np.full(n_words, np.uint64(0xFFFFFFFFFFFFFFFF))
+    if n_port % 64:
+        full[-1] = np.uint64((1 << (n_port % 64)) - 1)
+    n_missing = n_port - popcount(node_reach & full)
+    for swId in np.flatnonzero(n_missing)[:MAX_REPORTED].tolist():
+        errors.append('stage %d: %d network inputs do not reach switch node %d' % (bfNet.n_stage-1, n_missing[swId], swId))
+
+    return errors
+
+
+def open_tcl(tcl_fn):
+    return gzip.open(tcl_fn, 'rt') if tcl_fn.endswith('.gz') else open(tcl_fn)
+
+
+def parse_tcl_links(bfNet, lines):
+    '''
+    Parse the inter-stage connections of the tcl lines of any tcl mode, see ButterflyNet.gen_connect_tcl
+        Return (dictionary of (stage, signal) to list of ((srcSwId, srcPortId), (dstSwId, dstPortId)), list of error messages)
+        signal is the (src pin, dst pin) of LIST_LINK_SIGNALS or of the link interfaces, compact pin pair lists
+        stand for all LIST_LINK_SIGNALS
+    '''
+    dict_stage = {pfx: i for i, pfx in enumerate(bfNet.pfx_list)}
+    dict_port = {get_port_suffix(k): k for k in range(max(bfNet.type_list))}
+
+    dict_links = {}
+    errors = []
+    list_name = None
+    for line_no, line in enumerate(lines, 1):
+        line = line.strip()
+
+        # compact: tcl lists of uniIds
+        if list_name is not None:
+            if line == '}':
+                i = list_name
+                values = np.array(list_values, dtype=np.int64).reshape(-1, 2)
+                src = zip(*(a.tolist() for a in np.divmod(values[:, 0], bfNet.type_list[i])))
+                dst = zip(*(a.tolist() for a in np.divmod(values[:, 1], bfNet.type_list[i+1])))
+                links = list(zip(src, dst))
+                for signal in LIST_LINK_SIGNALS:
+                    dict_links.setdefault((i, signal), []).extend(links)
+                list_name = None
+            else:
+                list_values.extend(line.split())
+            continue
+        match = RE_TCL_LIST.match(line)
+        if match:
+            list_name, list_values = int(match.group(1)), []
+            continue
+
+        match = RE_TCL_NET.match(line) or RE_TCL_INTF_NET.match(line)
+        if not match:
+            continue
+        src_pfx, src_sw, src_pin, src_sfx, dst_pfx, dst_sw, dst_pin, dst_sfx = match.groups()
+        i = dict_stage.get(src_pfx)
+        if i is None or dict_stage.get(dst_pfx) != i+1:
+            errors.append('line %d: not a connection between consecutive stages: %s' % (line_no, line))
+            continue
+        link = ((int(src_sw), dict_port.get(src_sfx, -1)), (int(dst_sw), dict_port.get(dst_sfx, -1)))
+        dict_links.setdefault((i, (src_pin, dst_pin)), []).append(link)
+
+    return dict_links, errors
+
+
+def check_tcl(bfNet, tcl_fn):
+    '''
+    Check that the inter-stage connections of the tcl file tcl_fn (any tcl mode, gzip if ending with '.gz') are
+    exactly dict_connect_pin_pairs for every signal, each connection once
+        Return list of error messages
+    '''
+    assert bfNet.pfx_list is not None, "Switch nodes prefix name list is required to check the tcl"
+
+    with open_tcl(tcl_fn) as file:
+        dict_links, errors = parse_tcl_links(bfNet, file)
+
+    # intf mode connects the link interfaces, the other modes every pin of LIST_LINK_SIGNALS
+    found_signals = set(signal for _, signal in dict_links)
+    list_signals = list(LIST_LINK_SIGNALS)
+    if bfNet.n_stage > 1 and found_signals - set(LIST_LINK_SIGNALS) and bfNet.intf_map:
+        list_signals = [bfNet.get_link_intf()]
+    for signal in sorted(found_signals - set(list_signals)):
+        errors.append('%s->%s: unexpected inter-stage signal' % signal)
+
+    for signal in list_signals:
+        for i in range(bfNet.n_stage-1):
+            expected = set((tuple(src), tuple(dst)) for src, dst in bfNet.dict_connect_pin_pairs[(i, i+1)])
+            links = dict_links.get((i, signal), [])
+            found = set(links)
+            if len(found) != len(links):
+                errors.append('stage %d %s->%s: %d duplicated connections' % (i, signal[0], signal[1], len(links) - len(found)))
+            for link in sorted(expected - found)[:MAX_REPORTED]:
+                errors.append('stage %d %s->%s: missing connection %s -> %s' % ((i,) + signal + link))
+            for link in sorted(found - expected)[:MAX_REPORTED]:
+                errors.append('stage %d %s->%s: unexpected connection %s -> %s' % ((i,) + signal + link))
+
+    return errors
+
+
+def verify(bfNet, tcl_fn=None):
+    '''
+    Verify the wiring of bfNet, and the tcl file tcl_fn if given, return a report dictionary
+        Report: {'passed', 'time' (s), & the error messages of every check: 'pin_pairs' (check_pin_pairs),
+        'paths' (check_paths, paths of a benes network are only checked to exist), 'tcl' (check_tcl)}
+    '''
+    t = time.perf_counter()
+
+    report = {'pin_pairs': check_pin_pairs(bfNet)}
+    if not report['pin_pairs']:
+        with bfNet.profile_phase('verify_paths', pins=bfNet.n_port*bfNet.n_stage):
+            report['paths'] = check_paths(bfNet, unique=(bfNet.topology == 'butterfly'))
+    if tcl_fn is not None:
+        report['tcl'] = check_tcl(bfNet, tcl_fn)
+
+    report['passed'] = not report['pin_pairs'] and not report.get('paths') and not report.get('tcl')
+    report['time'] = time.perf_counter() - t
+
+    return report
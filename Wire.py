@@ -0,0 +1,209 @@
+# Wirelength & Crossing Estimator of the Layout and Stage Ordering / Node Placement Optimizer
+
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from Butterfly import ButterflyNet
+
+
+# metrics of estimate_wire, also the objectives of optimize_layout
+LIST_WIRE_METRICS = ['wirelength', 'max_span', 'crossings']
+
+
+def count_inversions(seq):
+    '''
+    Count the pairs i < j with seq[i] > seq[j] by a bottom-up merge sort in O(n log^2 n)
+        Every level merges all pairs of sorted blocks at once: the elements of a left block greater than an
+        element of its right block are counted by one searchsorted over all blocks, keyed by block offsets
+    '''
+    # dense ranks, equal values are no inversion
+    _, ranks = np.unique(np.asarray(seq), return_inverse=True)
+    n = len(ranks)
+    size = 1 << max(0, (n-1).bit_length())
+    # padded with values above all ranks at the end, which adds no inversion
+    a = np.concatenate((ranks.ravel().astype(np.int64), np.arange(n, size, dtype=np.int64)))
+
+    count = 0
+    width = 1
+    while width < size:
+        blocks = a.reshape(-1, 2, width)
+        ofst = (np.arange(len(blocks), dtype=np.int64) * size)[:, None]
+        # left blocks are sorted, so are their keys over all blocks
+        left = (blocks[:, 0] + ofst).ravel()
+        n_not_greater = np.searchsorted(left, (blocks[:, 1] + ofst).ravel(), side='right')
+        n_left_end = ((np.arange(len(blocks)) + 1) * width).repeat(width)
+        count += int((n_left_end - n_not_greater).sum())
+
+        a = np.sort(blocks.reshape(-1, 2*width), axis=1).ravel()
+        width *= 2
+
+    return count
+
+
+def get_link_dy(bfNet, list_y, stageIdx):
+    '''
+    Get the (src y, dst y) of the links of stage stageIdx with switch nodes at list_y, in the order of list_uni_pairs
+    '''
+    uni_pairs = bfNet.list_uni_pairs[stageIdx]
+    src_sw, src_port = np.divmod(uni_pairs[:, 0], bfNet.type_list[stageIdx])
+    dst_sw, dst_port = np.divmod(uni_pairs[:, 1], bfNet.type_list[stageIdx+1])
+
+    src_y = list_y[stageIdx][src_sw] + bfNet.list_pin_ofst[stageIdx][src_port]
+    dst_y = list_y[stageIdx+1][dst_sw] + bfNet.list_pin_ofst[stageIdx+1][dst_port]
+
+    return src_y, dst_y
+
+
+def estimate_wire(bfNet, list_y=None):
+    '''
+    Estimate the wiring of the layout of get_all_coordinates, return dictionary of metric to list of per-stage values
+        wirelength: total length of the links of stage i; max_span: length of the longest one;
+        crossings: number of link pairs crossing each other, i.e. inversions of the dst pins in src pin order
+        list_y: y of the switch nodes by swId of every stage, default list_node_y, e.g. to score another placement
+        Note: links run straight between the pin columns of consecutive stages, so two of them cross iff their
+              src & dst pins are in opposite y order
+    '''
+    if list_y is None:
+        list_y = bfNet.list_node_y
+
+    metrics = {name: [] for name in LIST_WIRE_METRICS}
+    for i in range(bfNet.n_stage-1):
+        dx = bfNet.list_node_x[i+1] - bfNet.list_node_x[i] - 2*bfNet.pin_dx
+        src_y, dst_y = get_link_dy(bfNet, list_y, i)
+        length = np.hypot(dx, dst_y - src_y)
+
+        metrics['wirelength'].append(float(length.sum()))
+        metrics['max_span'].append(float(length.max()))
+        metrics['crossings'].append(count_inversions(dst_y[np.argsort(src_y)]))
+
+    return metrics
+
+
+def get_totals(metrics):
+    '''
+    Get the network totals of the per-stage metrics of estimate_wire: sum, but max for max_span
+    '''
+    return {name: max(values, default=0.0) if name == 'max_span' else sum(values) for name, values in metrics.items()}
+
+
+def get_score(totals, objective):
+    '''
+    Get the sort key of totals, objective first and the other metrics as tie breaks
+    '''
+    return tuple(totals[name] for name in [objective] + [name for name in LIST_WIRE_METRICS if name != objective])
+
+
+def place_barycenter(bfNet, objective='wirelength', n_iter=4):
+    '''
+    Place the switch nodes of every stage by the barycenter heuristic, return (placement, totals) of the best round
+        A forward sweep sorts the nodes of stage i+1 by the mean y of the src pins of their links, shifted by the
+        pin offsets so that a node centered there meets its links straight; a backward sweep does the same from
+        the dst pins. Each of the n_iter rounds (a forward & backward sweep) is scored by estimate_wire.
+        placement: list of int arrays, placement[i][j] is the slot of switch node j of stage i, see ButterflyNet
+        Note: the slots (y of the nodes) of the layout are kept, only the node to slot assignment changes
+    '''
+    assert objective in LIST_WIRE_METRICS, "Invalid objective, allowed values are %s" % ', '.join(LIST_WIRE_METRICS)
+
+    list_slot_y = [np.sort(y) for y in bfNet.list_node_y]
+    placement = [np.searchsorted(slot_y, y) for slot_y, y in zip(list_slot_y, bfNet.list_node_y)]
+    list_y = [slot_y[slots] for slot_y, slots in zip(list_slot_y, placement)]
+
+    def place(stageIdx, bary):
+        placement[stageIdx] = np.empty(len(bary), dtype=np.int64)
+        placement[stageIdx][np.argsort(bary, kind='stable')] = np.arange(len(bary))
+        list_y[stageIdx] = list_slot_y[stageIdx][placement[stageIdx]]
+
+    best = ([slots.copy() for slots in placement], get_totals(estimate_wire(bfNet, list_y)))
+    for _ in range(n_iter):
+        for i in range(bfNet.n_stage-1):
+            src_y, _ = get_link_dy(bfNet, list_y, i)
+            dst_sw, dst_port = np.divmod(bfNet.list_uni_pairs[i][:, 1], bfNet.type_list[i+1])
+            place(i+1, np.bincount(dst_sw, weights=src_y - bfNet.list_pin_ofst[i+1][dst_port]))
+        for i in range(bfNet.n_stage-2, -1, -1):
+            _, dst_y = get_link_dy(bfNet, list_y, i)
+            src_sw, src_port = np.divmod(bfNet.list_uni_pairs[i][:, 0], bfNet.type_list[i])
+            place(i, np.bincount(src_sw, weights=dst_y - bfNet.list_pin_ofst[i][src_port]))
+
+        totals = get_totals(estimate_wire(bfNet, list_y))
+        if get_score(totals, objective) < get_score(best[1], objective):
+            best = ([slots.copy() for slots in placement], totals)
+
+    return best
+
+
+def gen_orderings(type_list):
+    '''
+    Enumerate the distinct orderings of the switch node types of type_list
+    '''
+    counts = {}
+    for n_ports in type_list:
+        counts[n_ports] = counts.get(n_ports, 0) + 1
+
+    def extend(remain):
+        if remain == 0:
+            yield []
+            return
+        for n_ports in sorted(counts):
+            if counts[n_ports] > 0:
+                counts[n_ports] -= 1
+                for tail in extend(remain - 1):
+                    yield [n_ports] + tail
+                counts[n_ports] += 1
+
+    yield from extend(len(type_list))
+
+
+def score_layout(type_list, objective='wirelength', n_iter=4, monitor_def=(2560, 1440), topology='butterfly'):
+    '''
+    Build the network of type_list headlessly, place its switch nodes and score it, run in a worker process
+        Return a row of type_list, placement (lists), the totals of the placement & base (the totals of the default layout)
+    '''
+    n_port = int(np.prod(type_list))
+    bfNet = ButterflyNet(n_stage=len(type_list), n_port=n_port, type_list=list(type_list),
+                         monitor_def=list(monitor_def), headless=True, topology=topology)
+
+    placement, totals = place_barycenter(bfNet, objective, n_iter)
+    row = {'type_list': list(type_list), 'placement': [slots.tolist() for slots in placement]}
+    row.update(totals)
+    row['base'] = get_totals(estimate_wire(bfNet))
+
+    return row
+
+
+def optimize_layout(type_list, objective='wirelength', n_iter=4, reorder=True, monitor_def=(2560, 1440), topology='butterfly', n_worker=None, callback=None):
+    '''
+    Search the ordering of type_list (every distinct ordering if reorder) and the node placement minimizing objective
+        Every ordering is placed by place_barycenter on a process pool, return the rows of score_layout ranked by
+        get_score, callback is called with every row as soon as its worker finishes
+        Note: benes orderings permute the butterfly stages, the mirror stages follow them
+    '''
+    assert objective in LIST_WIRE_METRICS, "Invalid objective, allowed values are %s" % ', '.join(LIST_WIRE_METRICS)
+    list_type_list = list(gen_orderings(type_list)) if reorder else [list(type_list)]
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=n_worker or os.cpu_count()) as pool:
+        futures = [pool.submit(score_layout, order, objective, n_iter, monitor_def, topology) for order in list_type_list]
+        for future in as_completed(futures):
+            row = future.result()
+            rows.append(row)
+            if callback is not None:
+                callback(row)
+
+    rows.sort(key=lambda row: get_score(row, objective) + (row['type_list'],))
+    for rank, row in enumerate(rows):
+        row['rank'] = rank + 1
+
+    return rows
+
+
+def gen_layout_table(rows, sep=','):
+    '''
+    Generate the lines of the ranked layout table with the metrics of the default layout as base_<metric>, sep=',' for csv
+    '''
+    yield sep.join(['rank', 'type_list'] + LIST_WIRE_METRICS + ['base_' + name for name in LIST_WIRE_METRICS]) + '\n'
+    for row in rows:
+        values = [str(row['rank']), ' '.join(map(str, row['type_list']))]
+        values += ['%.6g' % row[name] for name in LIST_WIRE_METRICS] + ['%.6g' % row['base'][name] for name in LIST_WIRE_METRICS]
+        yield sep.join(values) + '\n'
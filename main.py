@@ -1,27 +1,32 @@
 #!/opt/anaconda3/bin/python
 
+import sys
 import math
+import json
 import argparse
 
-from Butterfly import ButterflyNet
+from Butterfly import ButterflyNet, LIST_TCL_MODES, LIST_TOPOLOGIES
 
-def check_args(args):
+def check_net_args(args):
     '''
-    Check if the input args from cmd line is legal
+    Check if the network args (n_stage, n_port, type_list, pfx_list, monitor_def) from cmd line are legal
     '''
     # check n_stage & type_list & pfx_list
     assert args.n_stage == len(args.type_list), "Number of stages does not match the length of switch nodes type list"
     if args.pfx_list is not None:
-        assert args.n_stage == len(args.pfx_list), "Number of stages does not match the length of switch nodes prefix name list"
+        # a benes network has 2*n_stage-1 stages, see ButterflyNet
+        if getattr(args, 'topology', 'butterfly') == 'benes':
+            assert 2*args.n_stage-1 == len(args.pfx_list), "Number of benes stages (2*n_stage-1) does not match the length of switch nodes prefix name list"
+        else:
+            assert args.n_stage == len(args.pfx_list), "Number of stages does not match the length of switch nodes prefix name list"
 
     # check switch nodes type_list
     for _ in args.type_list:
-        assert _ == 2 or _ == 4, "Invalid value found in switch nodes type list, allowed values are 2 or 4"
+        assert _ >= 2 and _ & (_-1) == 0, "Invalid value found in switch nodes type list, allowed values are powers of two, i.e. 2, 4, 8, 16 ..."
 
     # check type_list & n_port
     product = math.prod(args.type_list)
     assert args.n_port == product, "Number of i/o ports derived from type_list does not match input argument n_port"
-    assert args.n_port <= 256, "Invalid argument: n_port, supported number of ports should be no greater than 256"
 
     # check monitor definition
     assert args.monitor_def[0] >= 1280 and args.monitor_def[0] <= 3840, "Invalid monitor width, allowed range is 1280 to 3840"
@@ -29,30 +34,469 @@ def check_args(args):
 
     return
 
-def main():
-    parser = argparse.ArgumentParser(description='Automatically Generating Network Topology for Hi-GP')
+def check_args(args):
+    '''
+    Check if the input args from cmd line is legal
+    '''
+    check_net_args(args)
+
+    # check interface mapping
+    if args.intf_map is not None:
+        for _ in args.intf_map:
+            assert _.count('=') == 1, "Invalid item found in interface mapping, expected format is <Pin>=<Intf>"
+
+    # check verilog options
+    assert args.data_width >= 1, "Invalid data width, should be no less than 1"
+    if args.v_fn is not None:
+        assert args.pfx_list is not None, "Switch nodes prefix name list is required by the verilog top module"
+    if args.tcl_state is not None:
+        assert args.tcl_fn is not None, "Output tcl command file name is required by the tcl delta"
+        assert args.tcl_mode != 'compact', "The tcl delta is only available for tcl_mode flat & intf"
+    if args.tcl_workers is not None or args.tcl_parts is not None:
+        assert args.tcl_mode != 'compact', "Sharded tcl emission is only available for tcl_mode flat & intf"
+        assert args.tcl_state is None, "Sharded tcl emission is not available for the tcl delta"
+    if args.tcl_workers is not None:
+        assert args.tcl_workers >= 1, "Invalid number of tcl workers, should be no less than 1"
+    if args.tcl_parts is not None:
+        assert args.tcl_fn is not None, "Output tcl command file name is required by the master script of the tcl parts"
+        assert args.pfx_list is not None, "Switch nodes prefix name list not specified"
+    if args.route_fn is not None:
+        assert args.topology == 'butterfly', "Routing table of all port pairs requires the butterfly topology, see sub-command benes"
+
+    # check cache options
+    if args.cache_size is not None:
+        assert args.cache_dir is not None, "Cache directory is required by the cache size limit"
+        assert args.cache_size > 0, "Invalid cache size, should be positive"
+
+    return
+
+def add_net_args(parser, monitor_required=True):
+    '''
+    Add the network args shared by all sub-commands
+    '''
     parser.add_argument('-ns', '--n_stage', type=int, required=True, help='number of stages/ranks in the interconnection network')
     parser.add_argument('-np', '--n_port', type=int, required=True, help='number of i/o ports of the interconnection network, power of two')
     parser.add_argument('-tl', '--type_list', nargs='+', type=int, required=True, help='type list of switch nodes in stage ascending order')
-    parser.add_argument('-df', '--monitor_def', nargs=2, type=int, required=True, help='definition (Width Height in pixels) of used monitor which will determine the canvas size etc, e.g. 1920 1080')
-    
+    if monitor_required:
+        parser.add_argument('-df', '--monitor_def', nargs=2, type=int, required=True, help='definition (Width Height in pixels) of used monitor which will determine the canvas size etc, e.g. 1920 1080')
+    else:
+        parser.add_argument('-df', '--monitor_def', nargs=2, type=int, default=[2560, 1440], help='definition (Width Height in pixels) of used monitor which will determine the canvas size etc, default 2560 1440')
+
     parser.add_argument('--pfx_list', nargs='+', type=str, help='prefix name of the switch nodes in stage ascending order')
-    parser.add_argument('--tcl_fn', type=str, help='output tcl command file name for automatic connection')
 
-    args = parser.parse_args()
-    check_args(args)
+def add_gen_args(parser):
+    add_net_args(parser)
+
+    parser.add_argument('--topology', type=str, default='butterfly', choices=LIST_TOPOLOGIES, help='butterfly, or benes: the butterfly followed by its mirror (2*n_stage-1 stages), rearrangeable for every permutation (default: butterfly)')
+    parser.add_argument('--placement_fn', type=str, help='switch node placement json written by sub-command layout, its type_list & topology must match')
+    parser.add_argument('--tcl_fn', type=str, help='output tcl command file name for automatic connection, - for stdout, gzip compressed if ending with .gz')
+    parser.add_argument('--tcl_mode', type=str, default='flat', choices=LIST_TCL_MODES, help='flat: one tcl command per net; compact: connectivity tables driven by foreach loops, much faster to source in Vivado; intf: one interface net per inter-stage link')
+    parser.add_argument('--tcl_workers', type=int, help='emit the tcl (tcl_mode flat & intf) in shards by stage & signal on this many worker processes, byte-identical to the serial output')
+    parser.add_argument('--tcl_parts', type=str, help='output directory of the tcl shards as part files, tcl_fn becomes a master script sourcing them in order (workers: tcl_workers, default number of cores)')
+    parser.add_argument('--tcl_state', type=str, help='connectivity state file of the previous tcl output, only the tcl delta against it (removed & added nets) is written to tcl_fn and the state is updated; created with the full tcl output if missing')
+    parser.add_argument('--intf_map', nargs='+', type=str, help='interface of the inter-stage pins used by tcl_mode intf as <Pin>=<Intf> items, e.g. ovld=m_axis ivld=s_axis (default: m_axis for ovld/dout/ofw_output, s_axis for ivld/din/ofw_input)')
+    parser.add_argument('--v_fn', type=str, help='output structural verilog top module file name, - for stdout, gzip compressed if ending with .gz')
+    parser.add_argument('--data_width', type=int, default=32, help='default data width of din/dout in the verilog top module')
+    parser.add_argument('--route_fn', type=str, help='output routing table file name of all (input, output) port pairs, .npy array of shape [n_port, n_port, n_stage] or csv text otherwise')
+    parser.add_argument('--graph_dir', type=str, help='output directory of the network graph as memory-mappable .npy arrays (nodes, edges, csr adjacency) with a json header')
+    parser.add_argument('--headless', action='store_true', help='build topology only, matplotlib is not imported unless an image is saved')
+    parser.add_argument('--save_img', action='store_true', help='save the network topology image')
+    parser.add_argument('--img_fmt', type=str, default='png', choices=['png', 'svg', 'pdf'], help='format of the saved image, svg & pdf are vector images written without matplotlib (default: png)')
+    parser.add_argument('--tile_dir', type=str, help='output directory of the zoom pyramid of png tiles <level>/<x>/<y>.png, for networks too large for one image')
+    parser.add_argument('--tile_levels', nargs='+', type=int, help='zoom levels of the tiles to render (default: all, level 0 is one tile)')
+    parser.add_argument('--n_worker', type=int, help='number of worker processes rendering the tiles (default: number of cores)')
+    parser.add_argument('--profile', nargs='?', const='-', type=str, help='record wall time, peak memory & item counts of every phase, written as json to the given file or stderr')
+    parser.add_argument('--cache_dir', type=str, help='directory of the on-disk cache of pin pairs, tcl files & images shared by repeated runs')
+    parser.add_argument('--cache_size', type=float, help='size limit of the cache directory in MB, least recently used entries are evicted (default: unbounded)')
+
+def load_placement(args):
+    '''
+    Load the placement of args.placement_fn, None if not given
+    '''
+    if args.placement_fn is None:
+        return None
+
+    with open(args.placement_fn) as file:
+        layout = json.load(file)
+    assert layout['type_list'] == args.type_list and layout['topology'] == args.topology, \
+        "Placement of %s does not match type_list & topology of the network" % args.placement_fn
+
+    return layout['placement']
 
-    bfNet = ButterflyNet(
+def build_net(args, placement=None, headless=None, cache=None, profiler=None):
+    '''
+    Build the ButterflyNet of the gen args, headless defaults to args.headless
+    '''
+    return ButterflyNet(
         n_stage=args.n_stage,
         n_port=args.n_port,
         type_list=args.type_list,
         monitor_def=args.monitor_def,
         pfx_list=args.pfx_list,
-        tcl_fn=args.tcl_fn
+        headless=args.headless if headless is None else headless,
+        intf_map=dict(_.split('=') for _ in args.intf_map) if args.intf_map is not None else None,
+        cache=cache,
+        profiler=profiler,
+        topology=args.topology,
+        placement=placement
+        )
+
+def write_outputs(bfNet, args, img_dir=None, log=sys.stderr):
+    '''
+    Write the outputs of the gen args of bfNet, images into img_dir (default the working directory), messages to log
+    '''
+    if args.save_img:
+        bfNet.save_network_image(img_fmt=args.img_fmt, img_dir=img_dir)
+    if args.v_fn is not None:
+        bfNet.gen_verilog_as_file(args.v_fn, data_width=args.data_width)
+    if args.route_fn is not None:
+        bfNet.get_route_index().export(args.route_fn)
+    if args.graph_dir is not None:
+        from Graph import export_graph
+        export_graph(bfNet, args.graph_dir)
+    if args.tile_dir is not None:
+        from Tiles import render_tiles
+        render_tiles(bfNet, args.tile_dir, levels=args.tile_levels, n_worker=args.n_worker)
+    if args.tcl_state is not None:
+        from Delta import gen_delta_tcl_as_file
+        delta = gen_delta_tcl_as_file(bfNet, args.tcl_state, args.tcl_fn, tcl_mode=args.tcl_mode)
+        if delta is not None:
+            print('tcl delta: %s' % ', '.join('%d/%d %s removed/added' % (len(delta[key][0]), len(delta[key][1]), key) for key in delta), file=log)
+    elif args.tcl_fn is not None or not (args.save_img or args.v_fn is not None or args.route_fn is not None or args.tile_dir is not None or args.graph_dir is not None):
+        if args.tcl_parts is not None:
+            from Shard import gen_tcl_parts_as_file
+            gen_tcl_parts_as_file(bfNet, args.tcl_parts, args.tcl_fn, tcl_mode=args.tcl_mode, n_worker=args.tcl_workers)
+        else:
+            bfNet.gen_connect_tcl_as_file(args.tcl_fn, tcl_mode=args.tcl_mode, n_worker=args.tcl_workers)
+
+def get_cache(args):
+    if args.cache_dir is None:
+        return None
+
+    from Cache import TopologyCache
+    return TopologyCache(args.cache_dir, max_bytes=int(args.cache_size * 2**20) if args.cache_size is not None else None)
+
+def run_gen(args):
+    check_args(args)
+
+    profiler = None
+    if args.profile is not None:
+        from Profile import Profiler
+        profiler = Profiler()
+
+    bfNet = build_net(args, load_placement(args), cache=get_cache(args), profiler=profiler)
+    write_outputs(bfNet, args)
+
+    if profiler is not None:
+        profiler.close()
+        profiler.dump_json(args.profile)
+
+def add_contention_args(parser):
+    from Contention import LIST_PATTERNS
+
+    add_net_args(parser, monitor_required=False)
+
+    parser.add_argument('-p', '--patterns', nargs='+', type=str, default=LIST_PATTERNS, choices=LIST_PATTERNS, help='permutation patterns to analyze (default: all)')
+    parser.add_argument('--perm_fn', type=str, help='user-supplied permutations, .npy integer array of shape (n_perm, n_port) or text with one permutation per line')
+    parser.add_argument('--n_perm', type=int, default=1000, help='number of random permutations')
+    parser.add_argument('--seed', type=int, help='seed of the random permutations')
+    parser.add_argument('--json_fn', type=str, help='output file name of the per-pattern summary as json, - for stdout')
+
+def run_contention(args):
+    import numpy as np
+    from Contention import gen_pattern, analyze_contention, summarize_contention
+
+    check_net_args(args)
+    assert args.n_perm >= 1, "Invalid number of random permutations, should be no less than 1"
+
+    bfNet = ButterflyNet(n_stage=args.n_stage, n_port=args.n_port, type_list=args.type_list,
+                         monitor_def=args.monitor_def, pfx_list=args.pfx_list, headless=True)
+
+    dict_perms = {}
+    for name in args.patterns:
+        dict_perms[name] = gen_pattern(name, args.n_port, n_perm=args.n_perm if name == 'random' else 1, seed=args.seed)
+    if args.perm_fn is not None:
+        perms = np.load(args.perm_fn) if args.perm_fn.endswith('.npy') else np.loadtxt(args.perm_fn, dtype=np.int64, ndmin=2)
+        perms = np.atleast_2d(perms)
+        assert perms.shape[1] == args.n_port, "Length of user-supplied permutations does not match n_port"
+        assert (np.sort(perms, axis=1) == np.arange(args.n_port)).all(), "User-supplied permutations are not permutations of the i/o ports"
+        dict_perms[args.perm_fn] = perms
+
+    summary = {}
+    print('%-12s %7s %9s %13s  %s' % ('pattern', 'n_perm', 'max_conf', 'conflict_free', 'mean conflicting links per stage'))
+    for name, perms in dict_perms.items():
+        summary[name] = summarize_contention(analyze_contention(bfNet, perms))
+        s = summary[name]
+        print('%-12s %7d %9d %13.3f  %s' % (name, s['n_perm'], max(s['max_conflict']), s['conflict_free'],
+                                             ' '.join('%.1f' % _ for _ in s['mean_n_conflict'])))
+
+    if args.json_fn is not None:
+        text = json.dumps(summary, indent=2)
+        if args.json_fn == '-':
+            print(text)
+        else:
+            with open(args.json_fn, 'w') as file:
+                file.write(text + '\n')
+
+def add_benes_args(parser):
+    from Contention import LIST_PATTERNS
+
+    add_net_args(parser, monitor_required=False)
+
+    parser.add_argument('-p', '--patterns', nargs='+', type=str, default=['random'], choices=LIST_PATTERNS, help='permutation patterns to route (default: random)')
+    parser.add_argument('--perm_fn', type=str, help='user-supplied permutations, .npy integer array of shape (n_perm, n_port) or text with one permutation per line')
+    parser.add_argument('--n_perm', type=int, default=1000, help='number of random permutations')
+    parser.add_argument('--seed', type=int, help='seed of the random permutations')
+    parser.add_argument('--config_fn', type=str, help='output switch settings file name, .npy uint8 array of shape [n_perm, 2*n_stage-1, n_port] or csv text otherwise, - for stdout')
+    parser.add_argument('--verify', action='store_true', help='trace every permutation through its switch settings')
+
+def run_benes(args):
+    import time
+    import numpy as np
+    from Contention import gen_pattern
+    from Benes import route_benes, apply_configs, export_configs
+
+    args.topology = 'benes'
+    check_net_args(args)
+    assert args.n_perm >= 1, "Invalid number of random permutations, should be no less than 1"
+
+    bfNet = ButterflyNet(n_stage=args.n_stage, n_port=args.n_port, type_list=args.type_list, monitor_def=args.monitor_def,
+                         pfx_list=args.pfx_list, headless=True, topology='benes')
+
+    list_perms = []
+    for name in args.patterns:
+        list_perms.append(gen_pattern(name, args.n_port, n_perm=args.n_perm if name == 'random' else 1, seed=args.seed))
+    if args.perm_fn is not None:
+        perms = np.load(args.perm_fn) if args.perm_fn.endswith('.npy') else np.loadtxt(args.perm_fn, dtype=np.int64, ndmin=2)
+        list_perms.append(np.atleast_2d(perms))
+    perms = np.concatenate(list_perms)
+
+    t = time.perf_counter()
+    configs = route_benes(bfNet, perms)
+    elapsed = time.perf_counter() - t
+    print('%d permutations routed in %.3f s (%.0f perm/s)' % (len(perms), elapsed, len(perms) / elapsed), file=sys.stderr)
+
+    if args.verify:
+        assert (apply_configs(bfNet, configs) == perms).all(), "Switch settings do not realize the permutations"
+        print('%d permutations verified' % len(perms), file=sys.stderr)
+    if args.config_fn is not None:
+        export_configs(bfNet, configs, args.config_fn)
+
+def add_layout_args(parser):
+    from Wire import LIST_WIRE_METRICS
+
+    add_net_args(parser, monitor_required=False)
+
+    parser.add_argument('--topology', type=str, default='butterfly', choices=LIST_TOPOLOGIES, help='topology of the network (default: butterfly)')
+    parser.add_argument('--objective', type=str, default='wirelength', choices=LIST_WIRE_METRICS, help='metric minimized first, the others break ties (default: wirelength)')
+    parser.add_argument('--n_iter', type=int, default=4, help='number of barycenter rounds of the node placement')
+    parser.add_argument('--keep_order', action='store_true', help='only place the switch nodes, keep the stage order of type_list')
+    parser.add_argument('--n_worker', type=int, help='number of worker processes (default: number of cores)')
+    parser.add_argument('--out_fn', type=str, default='-', help='output file name of the ranked table as csv, - for stdout (default)')
+    parser.add_argument('--placement_fn', type=str, help='output json of the best type_list & placement, input of gen --placement_fn')
+
+def run_layout(args):
+    from Wire import optimize_layout, gen_layout_table
+    from Butterfly import open_output, write_lines
+
+    check_net_args(args)
+    assert args.n_iter >= 0, "Invalid number of barycenter rounds, should be no less than 0"
+
+    def report(row):
+        print('%s placed' % ' '.join(map(str, row['type_list'])), file=sys.stderr)
+
+    rows = optimize_layout(args.type_list, objective=args.objective, n_iter=args.n_iter, reorder=not args.keep_order,
+                           monitor_def=args.monitor_def, topology=args.topology, n_worker=args.n_worker, callback=report)
+
+    with open_output(args.out_fn) as file:
+        write_lines(file, gen_layout_table(rows))
+
+    if args.placement_fn is not None:
+        best = rows[0]
+        with open(args.placement_fn, 'w') as file:
+            json.dump({'type_list': best['type_list'], 'topology': args.topology, 'placement': best['placement']}, file)
+            file.write('\n')
+
+def add_verify_args(parser):
+    add_net_args(parser, monitor_required=False)
+
+    parser.add_argument('--topology', type=str, default='butterfly', choices=LIST_TOPOLOGIES, help='topology of the network, paths of a benes network are only checked to exist (default: butterfly)')
+    parser.add_argument('--placement_fn', type=str, help='switch node placement json written by sub-command layout')
+    parser.add_argument('--intf_map', nargs='+', type=str, help='interface mapping the tcl file was generated with, as for gen')
+    parser.add_argument('--tcl_fn', type=str, help='tcl command file of gen (any tcl_mode, gzip if ending with .gz) whose inter-stage connections are checked against the network, requires pfx_list')
+    parser.add_argument('--json_fn', type=str, help='output file name of the report as json, - for stdout')
+
+def run_verify(args):
+    from Verify import verify
+
+    check_net_args(args)
+    if args.tcl_fn is not None:
+        assert args.pfx_list is not None, "Switch nodes prefix name list is required to check the tcl"
+
+    bfNet = ButterflyNet(n_stage=args.n_stage, n_port=args.n_port, type_list=args.type_list, monitor_def=args.monitor_def,
+                         pfx_list=args.pfx_list, headless=True,
+                         intf_map=dict(_.split('=') for _ in args.intf_map) if args.intf_map is not None else None,
+                         topology=args.topology, placement=load_placement(args))
+
+    report = verify(bfNet, args.tcl_fn)
+    for key in ['pin_pairs', 'paths', 'tcl']:
+        for message in report.get(key, []):
+            print('%s: %s' % (key, message), file=sys.stderr)
+    print('%s: %d ports, %d stages verified in %.3f s' % ('passed' if report['passed'] else 'FAILED', bfNet.n_port, bfNet.n_stage, report['time']), file=sys.stderr)
+
+    if args.json_fn is not None:
+        text = json.dumps(report, indent=2)
+        if args.json_fn == '-':
+            print(text)
+        else:
+            with open(args.json_fn, 'w') as file:
+                file.write(text + '\n')
+
+    if not report['passed']:
+        sys.exit(1)
+
+def add_serve_args(parser):
+    from Service import SOCKET_FN
+
+    parser.add_argument('--socket', type=str, default=SOCKET_FN, help='path of the unix socket (default: %s)' % SOCKET_FN)
+    parser.add_argument('--max_nets', type=int, default=16, help='number of networks kept in memory, least recently used ones are dropped')
+    parser.add_argument('--n_worker', type=int, help='number of threads serving requests (default: number of cores)')
+
+def run_serve(args):
+    from Service import GenService
+
+    assert args.max_nets >= 1, "Invalid number of cached networks, should be no less than 1"
+
+    service = GenService(args.socket, max_nets=args.max_nets, n_worker=args.n_worker)
+    print('serving on %s' % args.socket, file=sys.stderr)
+    service.serve_forever()
+
+def add_client_args(parser):
+    from Service import add_client_args
+
+    add_client_args(parser)
+
+def run_client(args):
+    from Service import client_main
+
+    sys.exit(client_main(args))
+
+def add_sweep_args(parser):
+    from Sweep import LIST_SWEEP_COLUMNS
+
+    parser.add_argument('-np', '--n_port', type=int, required=True, help='number of i/o ports of the interconnection network, power of two')
+    parser.add_argument('--radices', nargs='+', type=int, default=[2, 4], help='allowed switch nodes types (default: 2 4)')
+    parser.add_argument('--n_worker', type=int, help='number of worker processes (default: number of cores)')
+    parser.add_argument('--n_perm', type=int, default=100, help='number of random permutations of the contention score')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random permutations')
+    parser.add_argument('--sort_by', nargs='+', type=str, default=['n_switch', 'mean_max_conflict', 'wirelength'], choices=LIST_SWEEP_COLUMNS[1:], help='ranking keys in priority order')
+    parser.add_argument('--out_fn', type=str, default='-', help='output file name of the ranked table as csv, - for stdout (default)')
+
+def run_sweep(args):
+    from Sweep import sweep, gen_sweep_table
+    from Butterfly import open_output, write_lines
+
+    for _ in args.radices:
+        assert _ >= 2 and _ & (_-1) == 0, "Invalid value found in radices, allowed values are powers of two, i.e. 2, 4, 8, 16 ..."
+    assert args.n_perm >= 1, "Invalid number of random permutations, should be no less than 1"
+
+    n_done = [0]
+    def report(row):
+        n_done[0] += 1
+        print('[%d] %s done' % (n_done[0], ' '.join(map(str, row['type_list']))), file=sys.stderr)
+
+    rows = sweep(args.n_port, args.radices, n_worker=args.n_worker, n_perm=args.n_perm, seed=args.seed,
+                 sort_by=args.sort_by, callback=report)
+
+    with open_output(args.out_fn) as file:
+        write_lines(file, gen_sweep_table(rows))
+
+def add_bench_args(parser):
+    from Bench import LIST_BENCH_SIZES, LIST_BENCH_MIXES, LIST_BENCHES, BENCH_PNG_MAX_PORT, BENCH_REPEAT, BENCH_MIN_TIME, BENCH_ROUNDS, BENCH_RETRIES
+
+    parser.add_argument('--sizes', nargs='+', type=int, default=LIST_BENCH_SIZES, help='n_port of the benchmark matrix (default: %s)' % ' '.join(map(str, LIST_BENCH_SIZES)))
+    parser.add_argument('--mixes', nargs='+', type=str, default=LIST_BENCH_MIXES, choices=LIST_BENCH_MIXES, help='type_list mixes, r2: radix 2 only, r4: radix 4 only, mix: alternating 4 & 2 (default: all)')
+    parser.add_argument('--benches', nargs='+', type=str, default=LIST_BENCHES, choices=LIST_BENCHES, help='benchmarks to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=BENCH_REPEAT, help='least number of timed runs per round, the best one is kept (default: %d)' % BENCH_REPEAT)
+    parser.add_argument('--min_time', type=float, default=BENCH_MIN_TIME, help='least seconds of timed runs of each benchmark per round (default: %g)' % BENCH_MIN_TIME)
+    parser.add_argument('--rounds', type=int, default=BENCH_ROUNDS, help='number of runs over the whole matrix, the fastest round of each benchmark is kept (default: %d)' % BENCH_ROUNDS)
+    parser.add_argument('--png_max_port', type=int, default=BENCH_PNG_MAX_PORT, help='largest n_port of the png image benchmark')
+    parser.add_argument('--json_fn', type=str, help='output file name of the results as json, usable as a baseline, - for stdout')
+    parser.add_argument('--baseline', type=str, help='baseline json of a previous run, regressions & checksum mismatches make the run fail')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed relative increase of time & peak memory over the baseline (default: 0.2)')
+    parser.add_argument('--retries', type=int, default=BENCH_RETRIES, help='re-runs of a benchmark slower than the baseline before it fails (default: %d)' % BENCH_RETRIES)
+
+def run_bench(args):
+    from Bench import run_suite, load_report, save_report, recheck_reports, gen_report_table
+    from Butterfly import write_lines
+
+    for _ in args.sizes:
+        assert _ >= 4 and _ & (_-1) == 0, "Invalid value found in sizes, allowed values are powers of two no less than 4"
+    assert args.repeat >= 1, "Invalid number of runs, should be no less than 1"
+    assert args.rounds >= 1, "Invalid number of rounds, should be no less than 1"
+    assert args.min_time >= 0, "Invalid min_time, should be no less than 0"
+    assert args.threshold >= 0, "Invalid threshold, should be no less than 0"
+    assert args.retries >= 0, "Invalid number of retries, should be no less than 0"
+
+    baseline = load_report(args.baseline) if args.baseline is not None else None
+
+    def report_progress(key, result):
+        print('%s done in %.3f ms' % (key, result['time'] * 1e3), file=sys.stderr)
+
+    report = run_suite(args.sizes, args.mixes, args.benches, args.repeat, args.png_max_port, callback=report_progress,
+                       min_time=args.min_time, n_round=args.rounds)
+    if baseline is not None:
+        failures = recheck_reports(report, baseline, args.threshold, args.retries, repeat=args.repeat,
+                                   png_max_port=args.png_max_port, min_time=args.min_time)
+    write_lines(sys.stdout if args.json_fn != '-' else sys.stderr, gen_report_table(report, baseline))
+
+    if args.json_fn is not None:
+        save_report(report, args.json_fn)
+
+    if baseline is not None:
+        for key, name, message in failures:
+            print('FAIL %s %s: %s' % (key, name, message), file=sys.stderr)
+        if failures:
+            sys.exit(1)
+        print('no regression against %s' % args.baseline, file=sys.stderr)
+
+# sub-commands as name: (add args, run, help), 'gen' is the default one when no sub-command is given
+DICT_SUBCOMMANDS = {
+    'gen': (add_gen_args, run_gen, 'generate tcl / verilog / image / routing table outputs of the network (default)'),
+    'contention': (add_contention_args, run_contention, 'count link conflicts of standard and user-supplied permutations'),
+    'benes': (add_benes_args, run_benes, 'compute conflict-free switch settings of the benes network for batches of permutations'),
+    'layout': (add_layout_args, run_layout, 'estimate wirelength & link crossings, optimize the stage order and switch node placement'),
+    'verify': (add_verify_args, run_verify, 'check unique input/output paths by bit-parallel reachability and the tcl connections against the pin pairs'),
+    'serve': (add_serve_args, run_serve, 'keep networks in memory and serve gen requests of main.py client on a unix socket'),
+    'client': (add_client_args, run_client, 'run gen on the service of main.py serve, arguments as for gen'),
+    'sweep': (add_sweep_args, run_sweep, 'score every valid type_list of n_port in parallel and rank them'),
+    'bench': (add_bench_args, run_bench, 'time construction, pin pairs, tcl & images over a matrix of sizes and compare with a baseline'),
+}
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+
+    cmd = 'gen'
+    if argv and argv[0] in DICT_SUBCOMMANDS:
+        cmd = argv.pop(0)
+
+    add_args, run, cmd_help = DICT_SUBCOMMANDS[cmd]
+    parser = argparse.ArgumentParser(
+        prog='main.py' if cmd == 'gen' else 'main.py ' + cmd,
+        description='Automatically Generating Network Topology for Hi-GP' + ('' if cmd == 'gen' else ': ' + cmd_help),
+        epilog='sub-commands: ' + '; '.join('%s: %s' % (name, sub[2]) for name, sub in DICT_SUBCOMMANDS.items()),
+        # gen options of the client must not be taken as abbreviations of its own ones
+        allow_abbrev=(cmd != 'client')
         )
+    add_args(parser)
 
-    # bfNet.save_network_image()
-    bfNet.gen_connect_tcl_as_file()
+    if cmd == 'client':
+        # every other argument is passed on to gen on the service
+        args, gen_argv = parser.parse_known_args(argv)
+        args.argv = gen_argv
+    else:
+        args = parser.parse_args(argv)
+    run(args)
 
 if __name__ == '__main__':
     main()
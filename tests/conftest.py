@@ -0,0 +1,21 @@
+# the modules of the network generator live in the repository root
+import os
+import sys
+import math
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Butterfly import ButterflyNet
+
+
+@pytest.fixture
+def make_net():
+    '''
+    Factory of headless networks of type_list, other keyword arguments are passed to ButterflyNet
+    '''
+    def make(type_list, monitor_def=(1920, 1080), **kwargs):
+        return ButterflyNet(len(type_list), math.prod(type_list), list(type_list), list(monitor_def), headless=True, **kwargs)
+
+    return make
@@ -0,0 +1,52 @@
+import copy
+
+import pytest
+
+import Bench
+from Bench import run_suite, compare_reports, recheck_reports
+
+
+def get_report(results):
+    return {'meta': {}, 'results': {key: dict(time=time, peak_mem=peak_mem, checksum=checksum) for key, (time, peak_mem, checksum) in results.items()}}
+
+
+def test_compare_tolerances():
+    baseline = get_report({'a': (1e-3, 1 << 10, 'x'), 'b': (0.1, 1 << 20, 'x'), 'c': (0.1, 1 << 20, 'x')})
+    # a is below the smallest compared values, b within the threshold plus the tolerance
+    report = get_report({'a': (1.0, 1 << 20, 'x'), 'b': (0.121, (1 << 20) * 1.2 + (1 << 13), 'x'), 'c': (0.123, 1 << 22, 'y')})
+
+    failures = compare_reports(report, baseline)
+
+    assert [(key, name) for key, name, _ in failures] == [('c', 'checksum'), ('c', 'time'), ('c', 'peak_mem')]
+
+
+@pytest.fixture(scope='module')
+def report():
+    return run_suite([256], ['r4'], ['tcl_flat'], min_time=0.05, n_round=1)
+
+
+@pytest.fixture
+def compare_any_time(monkeypatch):
+    # the time of the benchmark depends on the machine, compare it whatever it is
+    monkeypatch.setitem(Bench.DICT_COMPARED, 'time', (0, 0))
+
+
+def test_slow_spell_is_rechecked(report, compare_any_time):
+    baseline = copy.deepcopy(report)
+    result = baseline['results']['tcl_flat/256/r4']
+    result['time'] *= 2
+    slow = copy.deepcopy(report)
+    slow['results']['tcl_flat/256/r4']['time'] *= 10
+
+    assert [name for _, name, _ in compare_reports(slow, baseline)] == ['time']
+    assert recheck_reports(slow, baseline, n_retry=3, wait=0, min_time=0.05) == []
+    assert slow['results']['tcl_flat/256/r4']['time'] < result['time']
+
+
+def test_regression_fails_every_recheck(report, compare_any_time):
+    baseline = copy.deepcopy(report)
+    baseline['results']['tcl_flat/256/r4']['time'] /= 10
+
+    failures = recheck_reports(copy.deepcopy(report), baseline, n_retry=1, wait=0, min_time=0.05)
+
+    assert [(key, name) for key, name, _ in failures] == [('tcl_flat/256/r4', 'time')]
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from Benes import route_benes, apply_configs
+
+
+@pytest.mark.parametrize('type_list', [[2, 2, 2], [4, 4], [2, 4, 2], [4, 2, 4, 2]])
+def test_routed_permutations_are_realised(make_net, type_list):
+    bfNet = make_net(type_list, topology='benes')
+    n_port = bfNet.n_port
+    rng = np.random.default_rng(n_port)
+    perms = np.array([rng.permutation(n_port) for _ in range(50)] + [np.arange(n_port), np.arange(n_port)[::-1]])
+
+    configs = route_benes(bfNet, perms)
+
+    assert configs.shape == (len(perms), bfNet.n_stage, n_port)
+    # apply_configs also asserts that no two input pins of a switch node take the same output port
+    assert (apply_configs(bfNet, configs) == perms).all()
+
+
+def test_single_permutation(make_net):
+    bfNet = make_net([2, 2, 2], topology='benes')
+    perm = np.array([3, 7, 0, 4, 6, 1, 5, 2])
+
+    assert (apply_configs(bfNet, route_benes(bfNet, perm))[0] == perm).all()
+
+
+def test_conflicting_settings_are_rejected(make_net):
+    bfNet = make_net([4, 4], topology='benes')
+    configs = route_benes(bfNet, np.arange(16))
+    # both first input pins of switch node 0 of the middle stage take the same output port
+    configs[0, 1, 1] = configs[0, 1, 0]
+
+    with pytest.raises(AssertionError):
+        apply_configs(bfNet, configs)
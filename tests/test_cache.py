@@ -0,0 +1,68 @@
+import os
+
+import numpy as np
+import pytest
+
+import Cache
+from Butterfly import LIST_TCL_MODES
+from Cache import TopologyCache
+
+
+TYPE_LIST = [4, 2, 4]
+PFX_LIST = ['a', 'b', 'c']
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return TopologyCache(str(tmp_path / 'cache'))
+
+
+def test_key_changes_with_version(make_net, cache, monkeypatch):
+    key = make_net(TYPE_LIST, pfx_list=PFX_LIST, cache=cache).cache_key
+    assert make_net(TYPE_LIST, pfx_list=PFX_LIST, cache=cache).cache_key == key
+    assert cache.n_hit == 1
+
+    monkeypatch.setattr(Cache, 'GENERATOR_VERSION', Cache.GENERATOR_VERSION + 1)
+    bfNet = make_net(TYPE_LIST, pfx_list=PFX_LIST, cache=cache)
+
+    assert bfNet.cache_key != key
+    # the entry of the old version is never hit again
+    assert (cache.n_hit, cache.n_miss) == (1, 2)
+    assert sorted(os.listdir(cache.cache_dir)) == sorted([key, bfNet.cache_key])
+
+
+def test_hit_is_memory_mapped(make_net, cache):
+    miss = make_net(TYPE_LIST, pfx_list=PFX_LIST, cache=cache)
+    hit = make_net(TYPE_LIST, pfx_list=PFX_LIST, cache=cache)
+
+    assert (cache.n_hit, cache.n_miss) == (1, 1)
+    assert not any(isinstance(uni_pairs, np.memmap) for uni_pairs in miss.list_uni_pairs)
+    for uni_pairs, ref in zip(hit.list_uni_pairs, miss.list_uni_pairs):
+        assert isinstance(uni_pairs, np.memmap) and not uni_pairs.flags.writeable
+        assert (uni_pairs == ref).all()
+
+
+def read_outputs(bfNet, out_dir):
+    os.makedirs(out_dir)
+    for tcl_mode in LIST_TCL_MODES:
+        bfNet.gen_connect_tcl_as_file(os.path.join(out_dir, '%s.tcl' % tcl_mode), tcl_mode=tcl_mode)
+    bfNet.gen_verilog_as_file(os.path.join(out_dir, 'net.v'))
+    bfNet.save_network_image('svg', img_dir=out_dir)
+
+    outputs = {}
+    for fn in sorted(os.listdir(out_dir)):
+        with open(os.path.join(out_dir, fn), 'rb') as file:
+            outputs[fn] = file.read()
+    return outputs
+
+
+def test_hit_and_miss_outputs_are_identical(make_net, cache, tmp_path):
+    ref = read_outputs(make_net(TYPE_LIST, pfx_list=PFX_LIST), str(tmp_path / 'ref'))
+    miss = read_outputs(make_net(TYPE_LIST, pfx_list=PFX_LIST, cache=cache), str(tmp_path / 'miss'))
+    n_miss = cache.n_miss
+    hit = read_outputs(make_net(TYPE_LIST, pfx_list=PFX_LIST, cache=cache), str(tmp_path / 'hit'))
+
+    # pin pairs, tcl files of every mode & the image
+    assert n_miss == len(LIST_TCL_MODES) + 2 and cache.n_miss == n_miss
+    assert len(ref) == len(LIST_TCL_MODES) + 2
+    assert miss == ref and hit == ref
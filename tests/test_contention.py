@@ -0,0 +1,50 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from Contention import LIST_PATTERNS, gen_pattern, analyze_contention, summarize_contention
+
+
+def trace_loads(bfNet, perm):
+    '''
+    Route perm by destination tags stage by stage, return the number of paths of every output pin, shape (n_stage, n_port)
+    '''
+    route_tables = bfNet.get_route_tables()
+    loads = []
+    pin = np.arange(bfNet.n_port)
+    span = bfNet.n_port
+    for i, n_ports in enumerate(bfNet.type_list):
+        span //= n_ports
+        out_pin = pin // n_ports * n_ports + route_tables[i][pin // n_ports, perm // span % n_ports]
+        loads.append(np.bincount(out_pin, minlength=bfNet.n_port))
+        pin = bfNet.get_stage_perm(i)[out_pin] if i < bfNet.n_stage-1 else out_pin
+
+    assert (pin == perm).all()
+    return np.array(loads)
+
+
+@pytest.mark.parametrize('type_list', [[2, 2, 2, 2], [4, 4], [2, 4, 2], [8, 2]])
+def test_conflicts_match_traced_paths(make_net, type_list):
+    bfNet = make_net(type_list)
+    perms = np.concatenate([gen_pattern(name, bfNet.n_port, n_perm=3, seed=1) for name in LIST_PATTERNS])
+
+    # a small chunk also covers permutations split over several chunks
+    result = analyze_contention(bfNet, perms, chunk=4)
+
+    for p, perm in enumerate(perms):
+        loads = trace_loads(bfNet, perm)
+        assert (result['max_conflict'][p] == loads.max(axis=1)).all()
+        assert (result['n_conflict'][p] == (loads > 1).sum(axis=1)).all()
+        assert (result['n_excess'][p] == np.maximum(loads - 1, 0).sum(axis=1)).all()
+
+
+def test_conflict_free_fraction(make_net):
+    bfNet = make_net([2, 2, 2])
+    perms = np.array(list(itertools.permutations(range(8))))
+
+    summary = summarize_contention(analyze_contention(bfNet, perms))
+
+    # paths are unique, so each of the 2^12 settings of the 12 switch nodes realises another permutation
+    assert summary['n_perm'] == 40320
+    assert summary['conflict_free'] == 2**12 / 40320
@@ -0,0 +1,75 @@
+import pytest
+
+from Delta import get_state, get_delta, get_stage_links, get_cells, get_cell_groups, get_ext_ports
+
+
+def get_connectivity(state):
+    '''
+    Get every link, clocked switch node & external port of the state, expanded from scratch
+    '''
+    meta = state['meta']
+    links = set()
+    for i in range(len(meta['list_digests'])):
+        links.update(get_stage_links(meta, state['list_uni_pairs'], i))
+
+    return {
+        'links': links,
+        'cells': set(get_cells(get_cell_groups(meta))),
+        'ports': set(get_ext_ports(meta).items()),
+    }
+
+
+def retarget(bfNet, stageIdx, a, b):
+    # swap the input pins driven by links a & b of stage stageIdx
+    uni_pairs = bfNet.list_uni_pairs[stageIdx].copy()
+    uni_pairs[[a, b], 1] = uni_pairs[[b, a], 1]
+    bfNet.list_uni_pairs[stageIdx] = uni_pairs
+    return bfNet
+
+
+# old & new network of every case, as (type_list, prefix names) or a function of the network factory
+CASES = {
+    'add_stage': (([4, 4], 'ab'), ([4, 2, 2], 'abc')),
+    'remove_stage': (([2, 2, 2, 2], 'abcd'), ([4, 2, 2], 'abc')),
+    'retarget': (([2, 4, 2], 'abc'), lambda make: retarget(make([2, 4, 2], pfx_list=list('abc')), 1, 3, 12)),
+    'rename': (([2, 4, 2], 'abc'), ([2, 4, 2], 'abx')),
+}
+
+
+def get_case_states(make_net, case):
+    states = []
+    for net in CASES[case]:
+        bfNet = net(make_net) if callable(net) else make_net(net[0], pfx_list=list(net[1]))
+        states.append(get_state(bfNet))
+    return states
+
+
+@pytest.mark.parametrize('case', sorted(CASES))
+def test_delta_turns_old_into_new(make_net, case):
+    old_state, new_state = get_case_states(make_net, case)
+    delta = get_delta(old_state, new_state)
+
+    old, new = get_connectivity(old_state), get_connectivity(new_state)
+    assert old != new
+    for key in ['links', 'cells', 'ports']:
+        removed, added = delta[key]
+        # only existing items are removed, only missing ones are added
+        assert set(removed) <= old[key]
+        assert not set(added) & (old[key] - set(removed))
+        assert (old[key] - set(removed)) | set(added) == new[key]
+
+
+def test_same_network_has_empty_delta(make_net):
+    delta = get_delta(*(get_state(make_net([2, 4, 2], pfx_list=list('abc'))) for _ in range(2)))
+
+    assert all(removed == [] and added == [] for removed, added in delta.values())
+
+
+def test_retarget_only_expands_its_stage(make_net):
+    delta = get_delta(*get_case_states(make_net, 'retarget'))
+
+    removed, added = delta['links']
+    # only the 2 retargeted links leaving stage 1 (prefix b) are replaced
+    assert len(removed) == 2 and len(added) == 2
+    assert {link[0][0] for link in removed + added} == {'b'}
+    assert delta['cells'] == ([], []) and delta['ports'] == ([], [])
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from Butterfly import LIST_TCL_MODES
+from Graph import export_graph, load_net
+
+
+def get_outputs(bfNet, out_dir):
+    outputs = {}
+    for tcl_mode in LIST_TCL_MODES:
+        tcl_fn = str(out_dir / ('%s.tcl' % tcl_mode))
+        bfNet.gen_connect_tcl_as_file(tcl_fn, tcl_mode=tcl_mode)
+        outputs[tcl_mode] = open(tcl_fn).read()
+    v_fn = str(out_dir / 'net.v')
+    bfNet.gen_verilog_as_file(v_fn)
+    outputs['verilog'] = open(v_fn).read()
+
+    return outputs
+
+
+@pytest.mark.parametrize('topology, placed', [('butterfly', False), ('butterfly', True), ('benes', False)])
+def test_loaded_net_is_identical(make_net, tmp_path, topology, placed):
+    type_list = [2, 4, 2]
+    n_stage = 5 if topology == 'benes' else 3
+    placement = None
+    if placed:
+        rng = np.random.default_rng(0)
+        placement = [rng.permutation(16 // n_ports) for n_ports in type_list]
+    bfNet = make_net(type_list, pfx_list=['s%d' % i for i in range(n_stage)], topology=topology, placement=placement)
+    export_graph(bfNet, str(tmp_path / 'graph'))
+
+    loaded = load_net(str(tmp_path / 'graph'))
+
+    for name in ['n_stage', 'n_port', 'type_list', 'bfly_type_list', 'pfx_list', 'intf_map', 'pin_dx', 'list_node_x']:
+        assert getattr(loaded, name) == getattr(bfNet, name)
+    for i in range(n_stage):
+        assert (loaded.list_node_y[i] == bfNet.list_node_y[i]).all()
+        assert (loaded.list_pin_ofst[i] == bfNet.list_pin_ofst[i]).all()
+        assert loaded.dict_output_pin_coord[i, 1] == bfNet.dict_output_pin_coord[i, 1]
+        if placed:
+            assert (loaded.placement[i] == bfNet.placement[i]).all()
+    for i in range(n_stage-1):
+        assert isinstance(loaded.list_uni_pairs[i], np.memmap)
+        assert (loaded.get_link_segments(i) == bfNet.get_link_segments(i)).all()
+
+    (tmp_path / 'ref').mkdir()
+    (tmp_path / 'loaded').mkdir()
+    assert get_outputs(loaded, tmp_path / 'loaded') == get_outputs(bfNet, tmp_path / 'ref')
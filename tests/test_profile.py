@@ -0,0 +1,46 @@
+import time
+
+import pytest
+
+from Profile import Profiler
+
+
+@pytest.fixture
+def profiler():
+    profiler = Profiler()
+    yield profiler
+    profiler.close()
+
+
+def test_report_total_is_wall_time(make_net, profiler, tmp_path):
+    t = time.perf_counter()
+    bfNet = make_net([4, 4, 4], profiler=profiler)
+    # headless, the png is rendered within the save_image phase
+    bfNet.save_network_image(img_dir=str(tmp_path))
+    elapsed = time.perf_counter() - t
+    report = profiler.get_report()
+
+    phases = {record['name']: record for record in report['phases']}
+    assert {phases[name]['parent'] for name in ['create_canvas', 'draw_switch_nodes', 'draw_pin_connection']} == {'save_image'}
+    assert report['wall_time'] <= elapsed
+    assert report['wall_time'] == pytest.approx(elapsed, rel=0.05)
+    # the self times split the outermost phases
+    assert sum(record['self_time'] for record in report['phases']) == pytest.approx(report['wall_time'])
+    assert phases['save_image']['peak_mem'] >= phases['draw_switch_nodes']['peak_mem']
+
+
+def test_nested_phase_keeps_outer_peak(profiler):
+    with profiler.phase('outer'):
+        block = bytearray(1 << 20)
+        del block
+        with profiler.phase('inner'):
+            time.sleep(0.01)
+        lines = list(profiler.gen_lines('lines', iter(['a\n', 'b\n'])))
+
+    inner, gen, outer = profiler.list_phases
+    assert [record['parent'] for record in profiler.list_phases] == ['outer', 'outer', None]
+    assert gen['counts']['lines'] == len(lines) == 2
+    # the peak of outer was reached before inner reset the traced peak
+    assert outer['peak_mem'] >= 1 << 20 > inner['peak_mem']
+    assert outer['self_time'] == pytest.approx(outer['wall_time'] - inner['wall_time'] - gen['wall_time'])
+    assert profiler.get_report()['wall_time'] == outer['wall_time']
@@ -0,0 +1,60 @@
+import csv
+import gzip
+
+import numpy as np
+import pytest
+
+from Routing import RouteIndex
+
+
+@pytest.fixture(params=[[2, 4, 2], [4, 4], [2, 2, 2, 2], [8, 2]], ids=lambda type_list: '_'.join(map(str, type_list)))
+def bfNet(request, make_net):
+    return make_net(request.param)
+
+
+def test_paths_end_at_their_destination(bfNet):
+    n_port, type_list = bfNet.n_port, bfNet.type_list
+    paths = RouteIndex(bfNet).trace_paths(np.arange(n_port)[:, None], np.arange(n_port))
+    assert paths.shape == (n_port, n_port, bfNet.n_stage)
+
+    # the input pin of stage 0 is the input port, the output pin of the last stage the output port
+    in_pins = np.broadcast_to(np.arange(n_port)[:, None], (n_port, n_port))
+    for i in range(bfNet.n_stage):
+        # every hop leaves the switch node it entered
+        assert (paths[..., i] // type_list[i] == in_pins // type_list[i]).all()
+        if i < bfNet.n_stage-1:
+            next_pin = np.empty(n_port, dtype=np.int64)
+            next_pin[bfNet.list_uni_pairs[i][:, 0]] = bfNet.list_uni_pairs[i][:, 1]
+            in_pins = next_pin[paths[..., i]]
+    assert (paths[..., -1] == np.arange(n_port)).all()
+
+    # as one (swId, portId) per stage
+    assert RouteIndex(bfNet).get_path(1, 2) == [divmod(int(uniId), n_ports) for uniId, n_ports in zip(paths[1, 2], type_list)]
+
+
+def test_npy_export_is_memory_mapped(bfNet, tmp_path):
+    paths = RouteIndex(bfNet, lazy=False).paths
+    index = RouteIndex(bfNet)
+    npy_fn = str(tmp_path / 'route.npy')
+
+    index.export(npy_fn)
+
+    assert isinstance(index.paths, np.memmap)
+    assert (np.load(npy_fn, mmap_mode='r') == paths).all()
+    assert (index.get_row(3) == paths[3]).all()
+
+
+@pytest.mark.parametrize('csv_name', ['route.csv', 'route.csv.gz'])
+def test_csv_export_round_trip(bfNet, tmp_path, csv_name):
+    paths = RouteIndex(bfNet, lazy=False).paths
+    csv_fn = str(tmp_path / csv_name)
+
+    RouteIndex(bfNet).export(csv_fn)
+
+    with (gzip.open if csv_name.endswith('.gz') else open)(csv_fn, 'rt') as file:
+        rows = np.array([[int(value) for value in row.values()] for row in csv.DictReader(file)])
+    assert len(rows) == bfNet.n_port**2 * bfNet.n_stage
+    src, dst, stage, swId, portId = rows.T
+    loaded = np.empty_like(paths)
+    loaded[src, dst, stage] = swId * np.array(bfNet.type_list)[stage] + portId
+    assert (loaded == paths).all()
@@ -0,0 +1,48 @@
+import gc
+import time
+import weakref
+import threading
+
+from Service import NetworkLRU, GenService, call
+
+
+def test_evicted_network_frees_its_figure(make_net, tmp_path):
+    import matplotlib.pyplot as plt
+
+    lru = NetworkLRU(max_nets=1)
+    refs = []
+    for type_list in [[2, 2], [4, 4], [2, 4]]:
+        bfNet, hit = lru.get(tuple(type_list), lambda: make_net(type_list))
+        assert not hit
+        bfNet.save_network_image(img_dir=str(tmp_path))
+        refs.append(weakref.ref(bfNet.ax.figure))
+        del bfNet
+    gc.collect()
+
+    assert plt.get_fignums() == []
+    # only the figure of the network still in the cache is alive
+    assert [ref() is not None for ref in refs] == [False, False, True]
+
+
+def test_request_with_worker_processes(tmp_path):
+    socket_fn = str(tmp_path / 'service.sock')
+    service = GenService(socket_fn, n_worker=2)
+    thread = threading.Thread(target=service.serve_forever)
+    thread.start()
+    try:
+        while True:
+            try:
+                call('stats', socket_fn=socket_fn)
+                break
+            except OSError:
+                time.sleep(0.01)
+        argv = ['-ns', '3', '-np', '16', '-tl', '2', '4', '2', '-df', '1920', '1080', '--pfx_list', 'a', 'b', 'c']
+        call('gen', {'argv': argv + ['--tcl_fn', 'serial.tcl'], 'cwd': str(tmp_path)}, socket_fn)
+        # the process pool is started from a thread of the service
+        result = call('gen', {'argv': argv + ['--tcl_fn', 'shards.tcl', '--tcl_workers', '2'], 'cwd': str(tmp_path)}, socket_fn)
+    finally:
+        call('shutdown', socket_fn=socket_fn)
+        thread.join()
+
+    assert result['hit']
+    assert (tmp_path / 'shards.tcl').read_bytes() == (tmp_path / 'serial.tcl').read_bytes()
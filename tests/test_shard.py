@@ -0,0 +1,37 @@
+import io
+import os
+
+import pytest
+
+from Shard import write_tcl_shards, gen_tcl_parts_as_file
+
+
+@pytest.mark.parametrize('n_worker', [1, 3])
+@pytest.mark.parametrize('tcl_mode', ['flat', 'intf'])
+@pytest.mark.parametrize('topology', ['butterfly', 'benes'])
+def test_sharded_tcl_is_byte_identical(make_net, tmp_path, topology, tcl_mode, n_worker):
+    type_list = [4, 2, 2]
+    n_stage = 5 if topology == 'benes' else 3
+    bfNet = make_net(type_list, pfx_list=['s%d' % i for i in range(n_stage)], topology=topology)
+    serial_fn = str(tmp_path / 'serial.tcl')
+    bfNet.gen_connect_tcl_as_file(serial_fn, tcl_mode=tcl_mode)
+    with open(serial_fn, 'rb') as file:
+        serial = file.read()
+
+    file = io.StringIO()
+    write_tcl_shards(bfNet, file, tcl_mode, n_worker)
+    assert file.getvalue().encode() == serial
+
+    master_fn = str(tmp_path / 'master.tcl')
+    part_fns = gen_tcl_parts_as_file(bfNet, str(tmp_path / 'parts'), master_fn, tcl_mode, n_worker)
+    parts = b''
+    for part_fn in part_fns:
+        with open(part_fn, 'rb') as part:
+            parts += part.read()
+    assert parts == serial
+
+    # the master script sources the parts in order, relative to itself
+    with open(master_fn) as file:
+        lines = file.read().splitlines()
+    assert lines[0] == 'set bfly_part_dir [file join [file dirname [info script]] {parts}]'
+    assert lines[1:] == ['source [file join $bfly_part_dir %s]' % os.path.basename(part_fn) for part_fn in part_fns]
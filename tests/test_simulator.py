@@ -0,0 +1,78 @@
+import time
+
+import numpy as np
+import pytest
+
+from Simulator import ButterflySim
+
+
+@pytest.fixture
+def make_sim(make_net):
+    return lambda **kwargs: ButterflySim(make_net([2, 4, 4]), **kwargs)
+
+
+def test_flits_are_conserved(make_sim):
+    sim = make_sim(inj_rate=0.8, sink_rate=0.7, n_batch=16, seed=3)
+    sim.run(300)
+
+    assert sim.n_injected == sim.n_delivered + sum(int(count.sum()) for count in sim.list_count)
+    assert sim.latency_hist.sum() == sim.n_delivered
+    assert sim.latency_hist[:sim.n_stage+1].sum() == 0
+
+
+def test_same_seed_same_report(make_sim):
+    reports = [make_sim(inj_rate=0.6, n_batch=8, seed=7).run(200, n_warmup=50) for _ in range(2)]
+
+    assert reports[0] == reports[1]
+
+
+def test_one_grant_per_output_port(make_sim):
+    sim = make_sim(inj_rate=1.0, n_batch=4, seed=1)
+    for _ in range(50):
+        sim.step()
+        # the grants of stage 0 are left in its request buffer, shape (n_nodes, k_out, c_in, n_batch)
+        grants = sim.list_views[0]['req']
+        assert (grants.sum(axis=2) <= 1).all()
+        assert (grants.sum(axis=1) <= 1).all()
+
+
+def test_permutation_at_low_load_is_delivered(make_sim):
+    sim = make_sim(inj_rate=0.05, traffic='perm', n_batch=4, seed=5)
+    report = sim.run(2000, n_warmup=100)
+
+    assert report['accept_rate'] == 1.0
+    assert abs(report['throughput'] - 0.05) < 0.005
+    # injected at the end of a cycle, an unblocked flit then leaves a stage per cycle
+    assert report['latency_p50'] == sim.n_stage + 1
+
+
+def test_chunked_run_samples_the_same_steady_state(make_sim):
+    # a single network under backpressure, the sinks accept 80% of the cycles
+    reports = [make_sim(inj_rate=0.9, sink_rate=0.8, seed=n_chunk).run(3000, n_warmup=500, n_chunk=n_chunk) for n_chunk in [1, 8]]
+
+    assert reports[1]['n_cycle'] == reports[0]['n_cycle'] == 3000
+    for name in ['throughput', 'accept_rate']:
+        assert abs(reports[1][name] - reports[0][name]) < 0.01
+    assert abs(reports[1]['latency_p50'] - reports[0]['latency_p50']) <= 1
+    assert np.allclose(reports[1]['block_rate'], reports[0]['block_rate'], atol=0.015)
+
+
+def test_single_network_run_is_chunked(make_net):
+    sim = ButterflySim(make_net([4, 4, 4, 4]), inj_rate=0.5, seed=0)
+    t = time.perf_counter()
+    for _ in range(100):
+        sim.step()
+    step_time = (time.perf_counter() - t) / 100
+
+    n_cycle = 10**5
+    sim.clear_stats()
+    t = time.perf_counter()
+    report = sim.run(n_cycle)
+    cycle_time = (time.perf_counter() - t) / n_cycle
+
+    assert sim.get_n_chunk(n_cycle) > 1 and sim.cycle == 100
+    # about 20 times faster here, a million cycles of the 256 port network take seconds
+    assert cycle_time < step_time / 5
+    assert report['n_cycle'] >= n_cycle
+    assert abs(report['throughput'] - 0.5 * report['accept_rate']) < 0.005
+    assert report['latency_p50'] >= sim.n_stage + 1
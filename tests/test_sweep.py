@@ -0,0 +1,10 @@
+from Sweep import score_type_list
+from Wire import estimate_wire, get_totals
+
+
+def test_sweep_reports_wire_estimate(make_net):
+    row = score_type_list([4, 2, 2], n_perm=4)
+    # score_type_list builds the network on its default monitor
+    totals = get_totals(estimate_wire(make_net([4, 2, 2], monitor_def=(2560, 1440))))
+
+    assert {name: row[name] for name in totals} == totals
@@ -0,0 +1,165 @@
+import io
+import os
+import gzip
+import shutil
+import subprocess
+
+import pytest
+
+from Butterfly import write_lines
+
+
+# flat tcl of radix 2 & 4 networks as generated before any radix was supported, of radix 8 since
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden')
+LIST_GOLDEN_TYPE_LISTS = [[2, 2, 2], [4, 4], [2, 4, 2], [8, 8]]
+
+
+def make_golden_net(make_net, type_list):
+    return make_net(type_list, pfx_list=['sw%d_s%d' % (n_ports, i) for i, n_ports in enumerate(type_list)])
+
+
+def read_golden(type_list):
+    with open(os.path.join(GOLDEN_DIR, 'flat_%s.tcl' % '_'.join(map(str, type_list)))) as file:
+        return file.read()
+
+
+# block design commands recording the nets of a sourced tcl file, printed as one list of pins & ports per line
+BD_STUB_TCL = '''
+set ports [dict create]
+set port_names [dict create]
+set nets {}
+
+proc startgroup {} {}
+proc endgroup {} {}
+proc get_bd_pins {pins} {
+    set objs {}
+    foreach pin $pins {lappend objs pin:$pin}
+    return $objs
+}
+proc get_bd_ports {name} {
+    return [list port:[dict get $::ports $name]]
+}
+# as Vivado, the new port is named after the pin with the first free index suffix
+proc make_bd_pins_external {objs} {
+    foreach obj $objs {
+        set base [lindex [split $obj /] end]
+        set k 0
+        while {[dict exists $::ports ${base}_$k]} {incr k}
+        set id [dict size $::port_names]
+        dict set ::ports ${base}_$k $id
+        dict set ::port_names $id ${base}_$k
+        lappend ::nets [list port:$id $obj]
+    }
+}
+proc set_property {prop value objs} {
+    if {$prop ne "name" || [dict exists $::ports $value]} {error "invalid property $prop $value"}
+    foreach obj $objs {
+        set id [string range $obj 5 end]
+        dict unset ::ports [dict get $::port_names $id]
+        dict set ::ports $value $id
+        dict set ::port_names $id $value
+    }
+}
+proc connect_bd_net {args} {
+    lappend ::nets [concat {*}$args]
+}
+
+source [lindex $argv 0]
+foreach net $nets {
+    set names {}
+    foreach obj $net {
+        if {[string match port:* $obj]} {set obj port:[dict get $port_names [string range $obj 5 end]]}
+        lappend names $obj
+    }
+    puts $names
+}
+'''
+
+
+def get_tcl_nets(bfNet, tcl_mode, tmp_path):
+    '''
+    Source the tcl of tcl_mode with the block design stubs, return the set of nets as frozensets of pins & ports
+    '''
+    stub_fn = str(tmp_path / 'bd_stub.tcl')
+    with open(stub_fn, 'w') as file:
+        file.write(BD_STUB_TCL)
+    tcl_fn = str(tmp_path / ('%s.tcl' % tcl_mode))
+    bfNet.gen_connect_tcl_as_file(tcl_fn, tcl_mode=tcl_mode)
+    out = subprocess.run([shutil.which('tclsh'), stub_fn, tcl_fn], capture_output=True, text=True, check=True).stdout
+
+    # commands connecting to the same pin or port extend one net
+    parent = {}
+    def find(obj):
+        while parent.setdefault(obj, obj) != obj:
+            obj = parent[obj]
+        return obj
+    for line in out.splitlines():
+        objs = line.split()
+        for obj in objs[1:]:
+            parent[find(obj)] = find(objs[0])
+
+    nets = {}
+    for obj in parent:
+        nets.setdefault(find(obj), set()).add(obj)
+    return {frozenset(net) for net in nets.values()}
+
+
+@pytest.mark.skipif(shutil.which('tclsh') is None, reason='tclsh not found')
+@pytest.mark.parametrize('type_list', [[2, 4, 2], [8, 8], [4, 2, 8]])
+def test_compact_tcl_nets_match_flat(make_net, type_list, tmp_path):
+    bfNet = make_net(type_list, pfx_list=['a', 'b', 'c'][:len(type_list)])
+
+    flat = get_tcl_nets(bfNet, 'flat', tmp_path)
+    compact = get_tcl_nets(bfNet, 'compact', tmp_path)
+
+    # clk, rst_n, 6 external ports per port & 3 nets per link between consecutive stages
+    assert len(flat) == 2 + 6*bfNet.n_port + 3*bfNet.n_port*(bfNet.n_stage-1)
+    assert compact == flat
+
+
+@pytest.mark.parametrize('type_list', LIST_GOLDEN_TYPE_LISTS)
+def test_flat_tcl_matches_golden(make_net, type_list, tmp_path):
+    tcl_fn = str(tmp_path / 'connect.tcl')
+    make_golden_net(make_net, type_list).gen_connect_tcl_as_file(tcl_fn)
+
+    with open(tcl_fn) as file:
+        assert file.read() == read_golden(type_list)
+
+
+@pytest.mark.parametrize('output', ['path', 'gzip', 'file', 'stdout', 'small_batches'])
+def test_tcl_outputs_match_golden(make_net, output, tmp_path, capsys):
+    bfNet = make_golden_net(make_net, [2, 4, 2])
+
+    if output == 'path':
+        bfNet.gen_connect_tcl_as_file(str(tmp_path / 'connect.tcl'))
+        text = (tmp_path / 'connect.tcl').read_text()
+    elif output == 'gzip':
+        bfNet.gen_connect_tcl_as_file(str(tmp_path / 'connect.tcl.gz'))
+        with gzip.open(str(tmp_path / 'connect.tcl.gz'), 'rt') as file:
+            text = file.read()
+    elif output == 'file':
+        file = io.StringIO()
+        bfNet.gen_connect_tcl_as_file(file)
+        # file-like objects are left open
+        text = file.getvalue()
+    elif output == 'stdout':
+        bfNet.gen_connect_tcl_as_file('-')
+        text = capsys.readouterr().out
+    else:
+        file = io.StringIO()
+        write_lines(file, bfNet.gen_connect_tcl(), batch=7)
+        text = file.getvalue()
+
+    assert text == read_golden([2, 4, 2])
+
+
+def test_compact_tcl_runs_on_tcl85(make_net):
+    bfNet = make_net([4, 4, 4], pfx_list=['a', 'b', 'c'])
+    text = ''.join(bfNet.gen_connect_tcl('compact'))
+
+    # Vivado embeds Tcl 8.5: no lmap, no string cat
+    assert 'lmap' not in text and 'string cat' not in text
+    # clk & rst_n of all switch nodes but the first one by one command each
+    assert text.count('connect_bd_net [get_bd_ports clk]') == 1
+    assert text.count('connect_bd_net [get_bd_ports rst_n]') == 1
+    assert 'lappend clk_pins b_$j/clk; lappend rst_n_pins b_$j/rst_n' in text
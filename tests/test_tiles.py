@@ -0,0 +1,26 @@
+import os
+
+from Tiles import render_tiles
+
+
+def read_tiles(tile_dir):
+    tiles = {}
+    for root, _, fns in os.walk(tile_dir):
+        for fn in fns:
+            if fn.endswith('.png'):
+                with open(os.path.join(root, fn), 'rb') as file:
+                    tiles[os.path.relpath(os.path.join(root, fn), tile_dir)] = file.read()
+    return tiles
+
+
+def test_placement_changes_tiles(make_net, tmp_path):
+    plain = make_net([2, 4, 2])
+    # reversed switch nodes of stage 1
+    placed = make_net([2, 4, 2], placement=[list(range(8)), list(range(3, -1, -1)), list(range(8))])
+
+    render_tiles(plain, str(tmp_path / 'plain'), levels=[0, 1], n_worker=1)
+    render_tiles(placed, str(tmp_path / 'placed'), levels=[0, 1], n_worker=1)
+    plain_tiles, placed_tiles = read_tiles(tmp_path / 'plain'), read_tiles(tmp_path / 'placed')
+
+    assert plain_tiles
+    assert any(placed_tiles.get(name) != data for name, data in plain_tiles.items())
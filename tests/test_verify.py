@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from Verify import verify
+
+
+@pytest.fixture
+def bfNet(make_net):
+    return make_net([2, 4, 2], pfx_list=['a', 'b', 'c'])
+
+
+@pytest.mark.parametrize('topology', ['butterfly', 'benes'])
+def test_generated_network_passes(make_net, tmp_path, topology):
+    bfNet = make_net([2, 4, 2], pfx_list=list('abcde'), topology=topology)
+    tcl_fn = str(tmp_path / 'net.tcl')
+    bfNet.gen_connect_tcl_as_file(tcl_fn)
+
+    report = verify(bfNet, tcl_fn)
+    assert report['passed'], report
+
+
+@pytest.mark.parametrize('stageIdx', [0, 1])
+def test_retargeted_link_fails(make_net, stageIdx):
+    rng = np.random.default_rng(stageIdx)
+    for _ in range(10):
+        bfNet = make_net([2, 4, 2], pfx_list=['a', 'b', 'c'])
+        uni_pairs = bfNet.list_uni_pairs[stageIdx].copy()
+        # one link drives an input pin already driven by another link
+        a, b = rng.choice(bfNet.n_port, 2, replace=False)
+        uni_pairs[a, 1] = uni_pairs[b, 1]
+        bfNet.list_uni_pairs[stageIdx] = uni_pairs
+
+        report = verify(bfNet)
+        assert not report['passed']
+        assert 'input pin %d of stage %d is in 2 links' % (uni_pairs[b, 1], stageIdx+1) in report['pin_pairs']
+
+
+def test_crossed_links_fail_paths(bfNet):
+    uni_pairs = bfNet.list_uni_pairs[0].copy()
+    # output port 0 of switch node 0 & output port 1 of switch node 1 swap their input pins, still a bijection
+    uni_pairs[[0, 3], 1] = uni_pairs[[3, 0], 1]
+    bfNet.list_uni_pairs[0] = uni_pairs
+
+    report = verify(bfNet)
+    assert not report['passed']
+    assert report['pin_pairs'] == [] and report['paths']
+
+
+def test_corrupted_tcl_connection_fails(bfNet, tmp_path):
+    tcl_fn = str(tmp_path / 'net.tcl')
+    bfNet.gen_connect_tcl_as_file(tcl_fn)
+    with open(tcl_fn) as file:
+        text = file.read()
+    line = 'connect_bd_net [get_bd_pins a_0/ovld_b] [get_bd_pins b_2/ivld_a]\n'
+    assert line in text
+    with open(tcl_fn, 'w') as file:
+        file.write(text.replace(line, line.replace('b_2/', 'b_3/')))
+
+    report = verify(bfNet, tcl_fn)
+    assert not report['passed']
+    assert report['pin_pairs'] == [] and report['paths'] == []
+    assert len(report['tcl']) == 2
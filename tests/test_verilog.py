@@ -0,0 +1,34 @@
+import re
+import gzip
+from collections import Counter
+
+import pytest
+
+
+@pytest.mark.parametrize('type_list', [[2, 2, 2], [4, 4], [8, 8], [4, 2, 8]])
+def test_verilog_ports_and_instances(make_net, type_list):
+    pfx_list = ['a', 'b', 'c'][:len(type_list)]
+    bfNet = make_net(type_list, pfx_list=pfx_list)
+    text = ''.join(bfNet.gen_verilog())
+
+    ports = re.findall(r'^    (?:input|output) +wire (?:\[DATA_WIDTH-1:0\] )?(\w+)', text, re.M)
+    instances = re.findall(r'^(\w+) (\w+) \($', text, re.M)
+    # the external ports are the ones created & renamed by the tcl
+    tcl_ports = re.findall(r'^set_property name (\w+) ', ''.join(bfNet.gen_connect_tcl()), re.M)
+
+    assert len(ports) == 2 + 6*bfNet.n_port
+    assert sorted(ports) == sorted(tcl_ports)
+    assert instances == [(pfx, '%s_%d' % (pfx, j)) for pfx, n_ports in zip(pfx_list, type_list) for j in range(bfNet.n_port // n_ports)]
+    # every link bit connects an output pin to an input pin
+    links = Counter(re.findall(r'\((link\d+_\w+\[\d+\])\)', text))
+    assert len(links) == 3*bfNet.n_port*(bfNet.n_stage-1)
+    assert set(links.values()) == {2}
+
+
+def test_verilog_gzip_output(make_net, tmp_path):
+    bfNet = make_net([4, 2, 8], pfx_list=['a', 'b', 'c'])
+    bfNet.gen_verilog_as_file(str(tmp_path / 'net.v'))
+    bfNet.gen_verilog_as_file(str(tmp_path / 'net.v.gz'))
+
+    with gzip.open(str(tmp_path / 'net.v.gz'), 'rb') as file:
+        assert file.read() == (tmp_path / 'net.v').read_bytes()